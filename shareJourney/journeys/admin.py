@@ -1,12 +1,49 @@
 from cloudinary.models import CloudinaryResource
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
+from django.http import StreamingHttpResponse
 from django.utils.html import mark_safe
 
+from .authentication import evict_users
+from .exports import iter_ndjson, iter_csv
+from .threads import delete_subtrees
 from .models import User, Journey, Participation, Post, Comment, Report, Image, CommentJourney, ReportedUser
+from .paginators import EstimatedCountPaginator
 
 
-class UserAdmin(admin.ModelAdmin):
+class OptimizedModelAdmin(admin.ModelAdmin):  # changelist cho bảng lớn: không COUNT(*) toàn bảng
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class LimitedInlineFormSet(BaseInlineFormSet):  # chỉ load N dòng mới nhất của inline
+    max_rows = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_limited_queryset'):
+            self._limited_queryset = super().get_queryset().order_by('-created_date')[:self.max_rows]
+        return self._limited_queryset
+
+
+class SummaryInlineAdmin(admin.TabularInline):  # inline chỉ đọc, sửa chi tiết qua show_change_link
+    formset = LimitedInlineFormSet
+    extra = 0
+    max_num = 0
+    can_delete = False
+    show_change_link = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class UserAdmin(OptimizedModelAdmin):
     list_display = ['id', 'username', 'rate', 'is_active']
+    search_fields = ['username', 'email', 'phone']
+    ordering = ['id']
     readonly_fields = ['img']
 
     def img(self, obj):
@@ -26,41 +63,74 @@ class ImageInlineAdmin(admin.StackedInline):
     fk_name = 'post'
 
 
-class CommentInlineAdmin(admin.StackedInline):
+class CommentInlineAdmin(SummaryInlineAdmin):
     model = Comment
-    extra = 0
     fk_name = 'post'
+    fields = readonly_fields = ['user', 'content', 'created_date']
 
 
-class CommentJourneyInlineAdmin(admin.StackedInline):
+class CommentJourneyInlineAdmin(SummaryInlineAdmin):
     model = CommentJourney
-    extra = 0
     fk_name = 'journey'
+    fields = readonly_fields = ['user', 'content', 'created_date']
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(OptimizedModelAdmin):
     list_display = ['id', 'content', 'created_date', 'user']
+    list_select_related = ['user']
+    search_fields = ['content']
+    autocomplete_fields = ['user', 'journey']
     inlines = [CommentInlineAdmin, ImageInlineAdmin, ]
 
 
-class ParticipationInlineAdmin(admin.StackedInline):
+class ParticipationInlineAdmin(SummaryInlineAdmin):
     model = Participation
-    extra = 0
     fk_name = 'journey'
+    fields = readonly_fields = ['user', 'is_approved', 'rating', 'created_date']
 
 
-class ParticipationAdmin(admin.ModelAdmin):
+class ParticipationAdmin(OptimizedModelAdmin):
     list_display = ['id', 'user', 'journey','journey_id','is_approved']
+    list_select_related = ['user', 'journey']
+    autocomplete_fields = ['user', 'journey']
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(OptimizedModelAdmin):
     list_display = ['id', 'user', 'content', 'created_date']
+    list_select_related = ['user']
+    autocomplete_fields = ['user', 'post']
+    raw_id_fields = ['parent_comment']
+
+    def delete_model(self, request, obj):  # xóa cả chuỗi trả lời theo path, không cascade từng cấp
+        delete_subtrees(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_subtrees(queryset)
+
+
+class CommentJourneyAdmin(CommentAdmin):
+    autocomplete_fields = ['user', 'journey']
 
 
-class JourneyAdmin(admin.ModelAdmin):
+class JourneyAdmin(OptimizedModelAdmin):
     list_display = ['id', 'name_journey', 'created_date', 'start_location', 'end_location', 'active', 'user_create']
+    list_select_related = ['user_create']
     search_fields = ['name_journey']
+    autocomplete_fields = ['user_create']
     inlines = [CommentJourneyInlineAdmin, ParticipationInlineAdmin, ]
+    actions = ['export_ndjson', 'export_csv']
+
+    @admin.action(description='Xuất NDJSON (kèm post, comment, thành viên)')
+    def export_ndjson(self, request, queryset):
+        response = StreamingHttpResponse(iter_ndjson(queryset), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="journeys.ndjson"'
+        return response
+
+    @admin.action(description='Xuất CSV')
+    def export_csv(self, request, queryset):
+        response = StreamingHttpResponse(iter_csv(queryset), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="journeys.csv"'
+        return response
 
 
 class ReportInline(admin.StackedInline):
@@ -68,12 +138,18 @@ class ReportInline(admin.StackedInline):
     extra = 0
     readonly_fields = ('reported_user', 'reported_by', 'reason')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('reported_user', 'reported_by')
+
 
 class ReportedUserAdmin(admin.ModelAdmin):
     list_display = ('user', 'report_count', 'is_processed', 'activate_user')
+    list_filter = ('is_processed',)
+    list_select_related = ('user',)  # tránh query user cho từng dòng
     ordering = ('is_processed', '-report_count',)
     readonly_fields = ('user', 'report_count')
     inlines = [ReportInline, ]
+    actions = ['deactivate_users', 'mark_processed']
 
     def activate_user(self, obj):
         return obj.user.is_active
@@ -81,6 +157,19 @@ class ReportedUserAdmin(admin.ModelAdmin):
     activate_user.boolean = True  # hiển thị tick or X
     activate_user.short_description = 'Is Active'
 
+    @admin.action(description='Khóa tài khoản các user đã chọn')
+    def deactivate_users(self, request, queryset):
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        count = User.objects.filter(id__in=user_ids).update(is_active=False)
+        evict_users(user_ids)  # update() không gửi signal nên phải xóa cache token thủ công
+        queryset.update(is_processed=True)
+        self.message_user(request, f'Đã khóa {count} tài khoản.')
+
+    @admin.action(description='Đánh dấu đã xử lý')
+    def mark_processed(self, request, queryset):
+        count = queryset.update(is_processed=True)
+        self.message_user(request, f'Đã xử lý {count} báo cáo.')
+
 
 class JourneyAppAdminSite(admin.AdminSite):
     site_title = 'Trang quản trị của tôi'
@@ -109,5 +198,5 @@ admin_site.register(User, UserAdmin)
 admin_site.register(Participation, ParticipationAdmin)
 admin_site.register(Post, PostAdmin)
 admin_site.register(Comment, CommentAdmin)
-admin_site.register(CommentJourney, CommentAdmin)
+admin_site.register(CommentJourney, CommentJourneyAdmin)
 admin_site.register(ReportedUser, ReportedUserAdmin)
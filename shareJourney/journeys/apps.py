@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class JourneysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'journeys'
+
+    def ready(self):
+        from journeys import authentication  # noqa: F401  đăng ký signal xóa cache token
+        from journeys import sync  # noqa: F401  đăng ký signal ghi tombstone khi xóa
+        from journeys import media  # noqa: F401  đăng ký signal lưu URL ảnh sau khi upload
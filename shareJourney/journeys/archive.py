@@ -0,0 +1,139 @@
+import json
+import zlib
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+from rest_framework.fields import DateTimeField
+
+from journeys import media, sync
+from journeys.exports import iter_records, ExportEncoder
+from journeys.models import Journey, Post, CommentJourney, LikeJourney, LikePost, Notification, User, \
+    JourneyArchive, ArchivedPost
+from journeys.serializers import UserSerializer
+
+# Lưu trữ hành trình đã hoàn thành lâu: post, ảnh, comment, like được nén vào JourneyArchive rồi xóa khỏi bảng chính.
+# Journey và Participation vẫn giữ lại (thống kê, danh sách thành viên, đánh giá). Thông báo cũ bị xóa.
+
+datetime_field = DateTimeField()
+
+
+def journeys_to_archive(days):
+    return Journey.objects.inactive().filter(archived=False, updated_date__lt=now() - timedelta(days=days))
+
+
+@transaction.atomic
+def archive_journey(journey):
+    record = next(iter_records(Journey.objects.filter(pk=journey.pk)))
+    record['likes'] = list(LikeJourney.objects.active().filter(journey=journey)
+                           .values_list('user_id', flat=True))
+    post_likes = {}
+    for post_id, user_id in LikePost.objects.active().filter(post__journey=journey) \
+            .values_list('post_id', 'user_id'):
+        post_likes.setdefault(post_id, []).append(user_id)
+    for post in record['posts']:
+        post['likes'] = post_likes.get(post['id'], [])
+
+    JourneyArchive.objects.create(
+        journey=journey,
+        data=zlib.compress(json.dumps(record, cls=ExportEncoder).encode(), 9),
+        likes_count=len(record['likes']),
+        comments_count=len(record['comments']),
+        posts_count=len(record['posts']),
+    )
+    ArchivedPost.objects.bulk_create([ArchivedPost(id=p['id'], journey=journey) for p in record['posts']])
+
+    with sync.batched():  # tombstone của mọi dòng bị xóa ghi bằng 1 bulk_create
+        Notification.objects.filter(Q(journey=journey) | Q(post__journey=journey)).delete()
+        Post.objects.filter(journey=journey).delete()  # xóa kèm ảnh, comment, like của post
+        CommentJourney.objects.filter(journey=journey).delete()
+        LikeJourney.objects.filter(journey=journey).delete()
+    Journey.objects.filter(pk=journey.pk).update(archived=True)  # không đổi updated_date
+
+
+def archive_batch(days, batch_size=50):  # lưu trữ tối đa batch_size hành trình, trả về số đã xử lý
+    count = 0
+    for journey in journeys_to_archive(days).order_by('updated_date')[:batch_size]:
+        archive_journey(journey)
+        count += 1
+    return count
+
+
+def _users(user_ids, context):
+    users = User.objects.filter(id__in=set(user_ids))
+    return {u['id']: u for u in UserSerializer(users, many=True, context=context).data}
+
+
+def _created(value):
+    return datetime_field.to_representation(parse_datetime(value)) if value else None
+
+
+def post_data(post, journey_id, users, request, detail=True):  # giống PostDetailSerializer / PostSerializer
+    data = {
+        'id': post['id'],
+        'journey': journey_id,
+        'user': users.get(post['user_id']),
+        'content': post['content'],
+        'visit_point': post['visit_point'],
+        'latitude': post['latitude'],
+        'longitude': post['longitude'],
+        'estimated_time_of_arrival': post['estimated_time_of_arrival'],
+        'created_date': _created(post['created_date']),
+        'images': [{'id': i['id'], 'image': media.url(i['image'])} for i in post['images']],
+    }
+    if detail:
+        data.update({
+            'liked': request.user.id in post['likes'] if request.user.is_authenticated else None,
+            'likes_count': len(post['likes']),
+            'comments_count': len(post['comments']),
+        })
+    return data
+
+
+def archived_posts(journey, request):
+    snapshot = journey.archive.snapshot()
+    users = _users([p['user_id'] for p in snapshot['posts']], {'request': request})
+    posts = sorted(snapshot['posts'], key=lambda p: p['created_date'] or '', reverse=True)
+    return [post_data(p, journey.id, users, request) for p in posts]
+
+
+def archived_post(post_id, request):
+    archived = ArchivedPost.objects.filter(pk=post_id).select_related('journey__archive').first()
+    if archived is None:
+        return None
+    post = next(p for p in archived.journey.archive.snapshot()['posts'] if p['id'] == archived.id)
+    return post_data(post, archived.journey_id, _users([post['user_id']], {'request': request}), request,
+                     detail=False)
+
+
+def comment_tree(comments, users, member_ids=None):  # giống CommentDetailSerializers / CommentJourneyDetailSerializers
+    nodes = {}
+    roots = []
+    for c in sorted(comments, key=lambda c: c['id']):
+        node = {'id': c['id'], 'content': c['content'], 'user': users.get(c['user_id']),
+                'created_date': _created(c['created_date'])}
+        if member_ids is not None:
+            node['is_member'] = c['user_id'] in member_ids
+        node['replies'] = []
+        nodes[c['id']] = node
+        if c['parent_comment_id'] is None:
+            roots.append(node)
+        elif c['parent_comment_id'] in nodes:
+            nodes[c['parent_comment_id']]['replies'].append(node)
+    return roots
+
+
+def archived_journey_comments(journey, request):
+    comments = journey.archive.snapshot()['comments']
+    member_ids = set(journey.participation_set.active().values_list('user_id', flat=True))
+    return comment_tree(comments, _users([c['user_id'] for c in comments], {}), member_ids)
+
+
+def archived_post_comments(post_id):
+    archived = ArchivedPost.objects.filter(pk=post_id).select_related('journey__archive').first()
+    if archived is None:
+        return None
+    post = next(p for p in archived.journey.archive.snapshot()['posts'] if p['id'] == archived.id)
+    return comment_tree(post['comments'], _users([c['user_id'] for c in post['comments']], {}))
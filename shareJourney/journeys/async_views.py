@@ -0,0 +1,281 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Avg, Count
+from django.http import JsonResponse
+from django.utils.duration import duration_string
+from rest_framework.fields import DateTimeField
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from journeys import archive, media, batch, threads
+from journeys.authentication import CachedOAuth2Authentication
+from journeys.models import Journey, Post, Comment, CommentJourney, LikeJourney, Participation, Follow, \
+    Notification
+from journeys.paginators import JourneyPaginator, CommentPaginator
+
+# Bản async (ASGI) của các API đọc nhiều nhất, trả về cùng định dạng JSON với bản DRF trong views.py.
+# Các query độc lập của 1 request được chạy đồng thời bằng asyncio.gather.
+
+datetime_field = DateTimeField()
+NOTIFICATION_PAGE_SIZE = 50
+
+
+def _authenticate(request):
+    result = CachedOAuth2Authentication().authenticate(Request(request))
+    return result[0] if result else None
+
+
+async def get_user(request):
+    return await sync_to_async(_authenticate)(request)
+
+
+def user_data(user, followed_ids):  # giống UserSerializer
+    return {
+        'id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'username': user.username,
+        'phone': user.phone,
+        'email': user.email,
+        'avatar': media.field_url(user, 'avatar'),
+        'followed': user.id in followed_ids,
+    }
+
+
+async def followed_ids(current_user, user_ids):
+    if current_user is None:
+        return set()
+    return {uid async for uid in Follow.objects.active().filter(follower=current_user, following_id__in=user_ids)
+            .values_list('following_id', flat=True)}
+
+
+def journey_data(journey, followed, liked, likes_count, comments_count, average_rating):  # giống JourneyDetailSerializers
+    return {
+        'user_create': user_data(journey.user_create, followed),
+        'id': journey.id,
+        'name_journey': journey.name_journey,
+        'background': journey.background,
+        'start_location': journey.start_location,
+        'end_location': journey.end_location,
+        'departure_time': journey.departure_time,
+        'distance': journey.distance,
+        'estimated_time': duration_string(journey.estimated_time) if journey.estimated_time is not None else None,
+        'liked': liked,
+        'likes_count': likes_count,
+        'active': journey.active,
+        'lock_cmt': journey.lock_cmt,
+        'comments_count': comments_count,
+        'average_rating': round(average_rating, 1) if average_rating else 0,
+        'start_latitude': journey.start_latitude,
+        'start_longitude': journey.start_longitude,
+        'end_latitude': journey.end_latitude,
+        'end_longitude': journey.end_longitude,
+        'distance_km': journey.distance_km,
+    }
+
+
+async def _grouped(queryset, annotation):
+    return {row['journey']: row['value'] async for row in queryset.values('journey').annotate(value=annotation)}
+
+
+async def _liked_ids(user, journey_ids):
+    if user is None:
+        return set()
+    return {jid async for jid in LikeJourney.objects.active().filter(user=user, journey_id__in=journey_ids)
+            .values_list('journey_id', flat=True)}
+
+
+async def journey_list(request):
+    queryset = Journey.objects.active().select_related('user_create').order_by('-created_date')
+    q = request.GET.get('q')
+    if q:
+        queryset = queryset.filter(name_journey__icontains=q)
+    page_size = JourneyPaginator.page_size
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    user, count, journeys = await asyncio.gather(
+        get_user(request),
+        queryset.acount(),
+        sync_to_async(list)(queryset[(page - 1) * page_size:page * page_size]),
+    )
+    if page > 1 and not journeys:
+        return JsonResponse({'detail': 'Invalid page.'}, status=404)
+
+    ids = [j.id for j in journeys]
+    likes, comments, ratings, liked, followed = await asyncio.gather(
+        _grouped(LikeJourney.objects.active().filter(journey_id__in=ids), Count('id')),
+        _grouped(CommentJourney.objects.filter(journey_id__in=ids), Count('id')),
+        _grouped(Participation.objects.active().filter(journey_id__in=ids), Avg('rating')),
+        _liked_ids(user, ids),
+        followed_ids(user, {j.user_create_id for j in journeys}),
+    )
+    return _paginated(request, page, page_size, count,
+                      [journey_data(j, followed, j.id in liked, likes.get(j.id, 0), comments.get(j.id, 0),
+                                    ratings.get(j.id)) for j in journeys])
+
+
+async def journey_detail(request, pk):
+    try:
+        journey = await Journey.objects.select_related('user_create', 'archive').aget(pk=pk)
+    except Journey.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    user = await get_user(request)
+    if journey.archived:  # số liệu lấy từ bảng lưu trữ
+        followed = await followed_ids(user, [journey.user_create_id])
+        liked = user is not None and user.id in journey.archive.snapshot()['likes']
+        rating = await journey.participation_set.active().aaggregate(Avg('rating'))
+        return JsonResponse(journey_data(journey, followed, liked, journey.archive.likes_count,
+                                         journey.archive.comments_count, rating['rating__avg']))
+    likes_count, comments_count, rating, liked, followed = await asyncio.gather(
+        journey.likejourney_set.active().acount(),
+        CommentJourney.objects.filter(journey=journey).acount(),
+        journey.participation_set.active().aaggregate(Avg('rating')),
+        _liked_ids(user, [journey.id]),
+        followed_ids(user, [journey.user_create_id]),
+    )
+    return JsonResponse(journey_data(journey, followed, journey.id in liked, likes_count, comments_count,
+                                     rating['rating__avg']))
+
+
+async def _latest_post(journey_id, user_id):  # bài đăng mới nhất của thành viên trong hành trình này
+    return await Post.objects.filter(journey_id=journey_id, user_id=user_id).order_by('-created_date') \
+        .values('visit_point', 'latitude', 'longitude', 'estimated_time_of_arrival').afirst()
+
+
+async def journey_members(request, pk):
+    try:
+        journey = await Journey.objects.select_related('user_create').aget(pk=pk)
+    except Journey.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    users = [journey.user_create] + [p.user async for p in journey.participation_set.active()
+                                     .select_related('user')]
+    posts = await asyncio.gather(*[_latest_post(journey.id, u.id) for u in users])
+    members = []
+    for i, (user, post) in enumerate(zip(users, posts)):
+        member_data = {'id': user.id}
+        if i == 0:  # người tạo hành trình
+            member_data['ownerJourney'] = True
+        member_data.update({
+            'full_name': user.get_full_name(),
+            'username': user.username,
+            'avatar': media.field_url(user, 'avatar'),
+            'post': post,
+        })
+        members.append(member_data)
+    return JsonResponse(members, safe=False)
+
+
+def _page_number(value, count, page_size):  # ?page= như PageNumberPagination ('last' = trang cuối), None nếu sai
+    pages = max(-(-count // page_size), 1)
+    if value in JourneyPaginator.last_page_strings:
+        return pages
+    try:
+        page = int(value)
+    except (TypeError, ValueError):
+        return None
+    return page if 1 <= page <= pages else None
+
+
+def _paginated(request, page, page_size, count, results):  # giống get_paginated_response của PageNumberPagination
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 1:
+        previous = replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')
+    return JsonResponse({
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if page * page_size < count else None,
+        'previous': previous,
+        'results': results,
+    })
+
+
+def comment_data(comment, replies=None):  # giống CommentReplySerializer / CommentJourneyReplySerializer (+ replies)
+    user = comment.user
+    data = {
+        'id': comment.id,
+        'content': comment.content,
+        'user': user_data(user, {user.id} if getattr(user, 'followed_by_me', False) else ()),
+        'created_date': datetime_field.to_representation(comment.created_date),
+    }
+    if hasattr(comment, 'member_of_journey'):
+        data['is_member'] = comment.member_of_journey
+    data['reply_count'] = comment.reply_total
+    if replies is not None:
+        data['replies'] = [comment_data(r) for r in replies]
+    return data
+
+
+def _threads(scope, user, page, page_size):  # trang bình luận cấp cha kèm K trả lời đầu, annotate sẵn như bản DRF
+    user = user or AnonymousUser()
+    parents = list(batch.comments(threads.top_level(scope), user)[(page - 1) * page_size:page * page_size])
+    return [comment_data(c, c.first_replies) for c in threads.attach_replies(parents, scope, user)]
+
+
+async def _comment_page(request, scope, archived):  # archived: cây lưu trữ (hành trình đã lưu trữ) hoặc None
+    page_size = CommentPaginator.page_size
+    if archived is not None:
+        items = threads.archived_threads(archived)
+        page = _page_number(request.GET.get('page', 1), len(items), page_size)
+        if page is None:
+            return JsonResponse({'detail': 'Invalid page.'}, status=404)
+        return _paginated(request, page, page_size, len(items), items[(page - 1) * page_size:page * page_size])
+    user, count = await asyncio.gather(get_user(request), threads.top_level(scope).acount())
+    page = _page_number(request.GET.get('page', 1), count, page_size)
+    if page is None:
+        return JsonResponse({'detail': 'Invalid page.'}, status=404)
+    results = await sync_to_async(_threads)(scope, user, page, page_size)
+    return _paginated(request, page, page_size, count, results)
+
+
+async def post_comments(request, post_id):  # giống CommentListAPIView: phân trang, trả lời còn lại qua .../replies/
+    archived = await sync_to_async(archive.archived_post_comments)(post_id)
+    return await _comment_page(request, Comment.objects.filter(post_id=post_id), archived)
+
+
+async def journey_comments(request, journey_id):
+    journey = await Journey.objects.filter(pk=journey_id, archived=True).select_related('archive').afirst()
+    archived = None
+    if journey is not None:
+        archived = await sync_to_async(archive.archived_journey_comments)(journey, request)
+    return await _comment_page(request, CommentJourney.objects.filter(journey_id=journey_id), archived)
+
+
+async def notifications(request):  # client poll thông báo mới, ?since=<id lớn nhất đã nhận>
+    user = await get_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    queryset = Notification.objects.filter(user=user).select_related('actor')
+    since = request.GET.get('since')
+    if since and since.isdigit():
+        # id tăng dần: has_more -> gọi lại với since = id cuối của trang này, không bỏ sót thông báo nào
+        queryset = queryset.filter(id__gt=since).order_by('id')
+    items, unread = await asyncio.gather(
+        sync_to_async(list)(queryset[:NOTIFICATION_PAGE_SIZE + 1]),
+        Notification.objects.filter(user=user, read=False).acount(),
+    )
+    has_more = len(items) > NOTIFICATION_PAGE_SIZE
+    items = items[:NOTIFICATION_PAGE_SIZE]
+    followed = await followed_ids(user, {n.actor_id for n in items if n.actor_id})
+    return JsonResponse({
+        'unread': unread,
+        'has_more': has_more,
+        'results': [{
+            'id': n.id,
+            'post_id': n.post_id,
+            'journey_id': n.journey_id,
+            'message': n.message,
+            'verb': n.verb,
+            'count': n.count,
+            'read': n.read,
+            'created_date': datetime_field.to_representation(n.created_date),
+            'actor': user_data(n.actor, followed) if n.actor else None,
+        } for n in items],
+    })
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model
+
+from journeys.models import User
+
+AccessToken = get_access_token_model()
+
+# token -> giá trị các field của user và access token, lưu trong Django cache (dùng chung giữa các process khi CACHES
+# là Redis/Memcached). Mỗi request dựng lại instance mới nên view sửa request.user không ảnh hưởng request khác.
+# Mỗi user có 1 key version: đổi user -> tăng version, mọi token của user đó hết hiệu lực ở mọi process (không quét).
+# TTL ngắn để giới hạn thời gian token đã thu hồi còn dùng được.
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+
+
+def _token_key(token):
+    return 'auth:token:' + hashlib.sha256(token.encode()).hexdigest()
+
+
+def _version_key(user_id):
+    return f'auth:user:{user_id}:v'
+
+
+def _fields(instance):
+    return {f.attname: getattr(instance, f.attname) for f in instance._meta.concrete_fields}
+
+
+def _load(model, fields):
+    return model.from_db('default', list(fields), list(fields.values()))
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):  # bỏ qua query access token + user khi token đã được xác thực
+    def authenticate(self, request):
+        token = self.get_bearer_token(request)
+        if token:
+            entry = cache.get(_token_key(token))
+            if entry is not None and entry['version'] == cache.get(_version_key(entry['user']['id'])):
+                user, access_token = _load(User, entry['user']), _load(AccessToken, entry['token'])
+                access_token.user = user
+                if not access_token.is_expired() and user.is_active:
+                    _count('hits')
+                    return user, access_token
+            _count('misses')
+
+        result = super().authenticate(request)
+        if result is not None and token:
+            user, access_token = result
+            ttl = min(_ttl(), (access_token.expires - timezone.now()).total_seconds())  # không quá thời hạn token
+            if ttl > 0:
+                cache.set(_token_key(token), {'version': cache.get(_version_key(user.pk)), 'user': _fields(user),
+                                              'token': _fields(access_token)}, ttl)
+        return result
+
+    def get_bearer_token(self, request):
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) == 2 and auth[0].lower() == 'bearer':
+            return auth[1]
+        return None
+
+
+def stats():  # số lần trúng/trượt cache của process này
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 3) if total else None}
+
+
+def evict_users(user_ids):  # tăng version -> token đã cache của các user này không còn khớp
+    for user_id in set(user_ids):
+        key = _version_key(user_id)
+        if cache.add(key, 1, _ttl()):
+            continue
+        try:
+            cache.incr(key)
+        except ValueError:  # key vừa hết hạn
+            cache.set(key, 1, _ttl())
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def evict_token(sender, instance, **kwargs):  # token bị thu hồi (xóa) hoặc thay đổi
+    cache.delete(_token_key(instance.token))
+
+
+@receiver([post_save, post_delete], sender=User)
+def evict_user(sender, instance, **kwargs):  # user bị khóa (is_active=False) hoặc cập nhật profile
+    evict_users([instance.pk])
@@ -0,0 +1,92 @@
+from django.db.models import Avg, Count, Exists, IntegerField, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from journeys.fieldsets import wants, expanded
+from journeys.models import LikeJourney, CommentJourney, Participation, Follow, Journey, User
+
+# Annotate sẵn các giá trị mà SerializerMethodField cần (likes_total, comments_total, ...) để danh sách/batch
+# không chạy 1 query cho mỗi đối tượng. Dùng cho ?ids=1,2,3 và cho list/retrieve (kèm ?fields=).
+
+MAX_IDS = 100
+
+
+def parse_ids(value):  # '3,1,3,2' -> [3, 1, 2] (giữ thứ tự, bỏ trùng)
+    try:
+        ids = list(dict.fromkeys(int(i) for i in (value or '').split(',') if i.strip()))
+    except ValueError:
+        raise ValidationError({'ids': 'Danh sách id không hợp lệ'})
+    if not ids:
+        raise ValidationError({'ids': 'Thiếu danh sách id'})
+    if len(ids) > MAX_IDS:
+        raise ValidationError({'ids': f'Tối đa {MAX_IDS} id mỗi lần'})
+    return ids
+
+
+def _count(queryset, field):  # COUNT trong subquery, không làm nhân dòng như JOIN nhiều bảng
+    return Coalesce(Subquery(queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+                             .annotate(c=Count('pk')).values('c'), output_field=IntegerField()), Value(0))
+
+
+def _followed(user, field='pk'):
+    if not user.is_authenticated:
+        return Value(False)
+    return Exists(Follow.objects.active().filter(follower=user, following=OuterRef(field)))
+
+
+def _with_user(queryset, field, user, spec):  # user lồng bên trong: prefetch kèm cờ followed đã annotate
+    if not expanded(spec, field):  # bị thu gọn thành id hoặc không được chọn
+        return queryset
+    users = User.objects.all()
+    if wants(spec, field, 'followed'):
+        users = users.annotate(followed_by_me=_followed(user))
+    return queryset.prefetch_related(Prefetch(field, queryset=users))
+
+
+def journeys(queryset, user, spec=None):  # spec: fieldsets.parse(request), chỉ annotate những field được chọn
+    annotations = {}
+    if wants(spec, 'likes_count'):
+        annotations['likes_total'] = _count(LikeJourney.objects.active(), 'journey')
+    if wants(spec, 'comments_count'):
+        annotations['comments_total'] = _count(CommentJourney.objects.all(), 'journey')
+    if wants(spec, 'average_rating'):
+        annotations['rating_avg'] = Subquery(Participation.objects.active().filter(journey=OuterRef('pk'))
+                                             .order_by().values('journey').annotate(a=Avg('rating')).values('a'))
+    if wants(spec, 'liked') and user.is_authenticated:
+        annotations['liked_by_me'] = Exists(LikeJourney.objects.active().filter(journey=OuterRef('pk'), user=user))
+    return _with_user(queryset.select_related('archive').annotate(**annotations), 'user_create', user, spec)
+
+
+def posts(queryset, user, spec=None):
+    if wants(spec, 'images'):
+        queryset = queryset.prefetch_related('images')
+    return _with_user(queryset, 'user', user, spec)
+
+
+def users(queryset, user, spec=None):
+    annotations = {}
+    if wants(spec, 'follower_count'):
+        annotations['follower_total'] = _count(Follow.objects.active(), 'following')
+    if wants(spec, 'following_count'):
+        annotations['following_total'] = _count(Follow.objects.active(), 'follower')
+    if wants(spec, 'journey_count'):
+        annotations['journey_total'] = _count(Journey.objects.all(), 'user_create')
+    if wants(spec, 'followed'):
+        annotations['followed_by_me'] = _followed(user)
+    return queryset.annotate(**annotations)
+
+
+def comments(queryset, user, spec=None):  # Comment hoặc CommentJourney
+    model = queryset.model
+    annotations = {}
+    if wants(spec, 'reply_count'):  # số trả lời trực tiếp
+        annotations['reply_total'] = _count(model.objects.all(), 'parent_comment')
+    if model is CommentJourney and wants(spec, 'is_member'):
+        annotations['member_of_journey'] = Exists(Participation.objects.active().filter(journey=OuterRef('journey'),
+                                                                                        user=OuterRef('user')))
+    return _with_user(queryset.annotate(**annotations), 'user', user, spec)
+
+
+def in_order(objects, ids):  # sắp theo thứ tự ids, trả về (danh sách, id không tìm thấy)
+    found = {obj.pk: obj for obj in objects}
+    return [found[i] for i in ids if i in found], [i for i in ids if i not in found]
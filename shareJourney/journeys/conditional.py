@@ -0,0 +1,143 @@
+import hashlib
+import math
+
+from django.db.models import Count, Max, Q, QuerySet
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from journeys import threads
+from journeys.models import LikeJourney, LikePost, CommentJourney, Participation, Follow, Post, Image, Comment, \
+    Journey, User
+
+# Conditional GET: ETag tính từ số dòng + max(updated_date) của các dòng mà trang đang phục vụ phụ thuộc (các dòng
+# trên trang, dòng con được đếm/lồng vào, user lồng bên trong), kèm user (liked/followed khác nhau theo user), đường
+# dẫn (trang, ?fields=) và Accept (định dạng). Chỉ tính khi request có If-None-Match: khớp -> 304, không chạy query
+# chính và không serialize; request không điều kiện được gắn ETag sau khi build.
+# Last-Modified chỉ để tham khảo: xóa dòng không làm tăng max(updated_date) nên 304 chỉ dựa vào ETag.
+
+
+def _version(queryset):
+    if any(f.name == 'updated_date' for f in queryset.model._meta.fields):
+        row = queryset.order_by().aggregate(n=Count('pk'), last=Max('updated_date'))
+        return row['n'], row['last']
+    return queryset.order_by().count(), None  # bảng không có updated_date (Image): chỉ đếm
+
+
+def fingerprint(request, versions):  # versions: queryset hoặc giá trị sẵn có (id các dòng trên trang, tổng số dòng)
+    parts = [request.user.pk, request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+    last_modified = None
+    for item in versions:
+        if not isinstance(item, QuerySet):
+            parts.append(item)
+            continue
+        count, last = _version(item)
+        parts += [count, last.isoformat() if last else None]
+        if last and (last_modified is None or last > last_modified):
+            last_modified = last
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest(), last_modified
+
+
+def not_modified(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = [t.removeprefix('W/') for t in parse_etags(header)]  # so sánh weak (middleware nén đổi thành W/)
+    return '*' in tags or etag in tags
+
+
+def respond(request, versions, build):  # versions(): các queryset để tính ETag, build(): response đầy đủ
+    conditional = bool(request.META.get('HTTP_IF_NONE_MATCH'))
+    try:
+        etag, last_modified = fingerprint(request, versions()) if conditional else (None, None)
+    except (ValueError, TypeError):  # pk/trang không hợp lệ -> để view trả 404 như cũ
+        return build()
+    if conditional and not_modified(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+    if response.status_code == status.HTTP_200_OK and not conditional:
+        try:
+            etag, last_modified = fingerprint(request, versions())
+        except (ValueError, TypeError):  # view đã trả 200 nhưng không tính được ETag -> trả response không ETag
+            return response
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'  # luôn hỏi lại server, nhưng được dùng bản đã lưu nếu 304
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def page_ids(queryset, request, paginator):  # id các dòng trên trang ?page= (PageNumberPagination), theo thứ tự
+    page_size = paginator.get_page_size(request)
+    page = request.query_params.get(paginator.page_query_param, 1)
+    if page in paginator.last_page_strings:  # ?page=last
+        page = max(math.ceil(queryset.order_by().count() / page_size), 1)
+    page = int(page)
+    if page < 1:
+        raise ValueError(page)
+    return list(queryset.values_list('pk', flat=True)[(page - 1) * page_size:page * page_size])
+
+
+def _users(user, users):  # user lồng bên trong (tên, avatar) + cờ followed của người đang xem
+    versions = [users]
+    if user.is_authenticated:
+        versions.append(Follow.objects.filter(follower=user, following__in=users.values('pk')))
+    return versions
+
+
+def journeys(queryset, user, ids):  # trang hành trình (JourneyDetailSerializers), ids: id các hành trình trên trang
+    return [ids, queryset.order_by().count(), Journey.objects.filter(pk__in=ids),
+            LikeJourney.objects.filter(journey__in=ids), CommentJourney.objects.filter(journey__in=ids),
+            Participation.objects.filter(journey__in=ids)] + _users(user, User.objects.filter(journey__in=ids))
+
+
+def post(post_id, user):
+    return [Post.objects.filter(pk=post_id), Image.objects.filter(post_id=post_id),
+            LikePost.objects.filter(post_id=post_id), Comment.objects.filter(post_id=post_id)] + \
+        _users(user, User.objects.filter(post=post_id))
+
+
+def members(journey_id):  # thành viên + bài đăng mới nhất của từng người trong hành trình
+    journey = Journey.objects.filter(pk=journey_id)
+    participations = Participation.objects.filter(journey_id=journey_id)
+    users = User.objects.filter(Q(pk__in=participations.active().values('user_id')) |
+                                Q(pk__in=journey.values('user_create')))
+    return [journey, participations, users, Post.objects.filter(journey_id=journey_id, user__in=users.values('pk'))]
+
+
+def _comments(scope, ids, user):  # các bình luận trên trang + trả lời trực tiếp của chúng (lồng sẵn, reply_count)
+    comments = scope.filter(Q(pk__in=ids) | Q(parent_comment__in=ids))
+    return [ids, comments] + _users(user, User.objects.filter(pk__in=comments.values('user_id')))
+
+
+def post_comments(post_id, user, request, paginator):
+    scope = Comment.objects.filter(post_id=post_id)
+    return [Post.objects.filter(pk=post_id)] + \
+        _comments(scope, page_ids(threads.top_level(scope), request, paginator), user)
+
+
+def post_replies(post_id, comment_id, user):  # trả lời của 1 bình luận (phân trang bằng cursor)
+    scope = Comment.objects.filter(post_id=post_id)
+    return [Post.objects.filter(pk=post_id)] + \
+        _comments(scope, list(scope.filter(parent_comment_id=comment_id).values_list('pk', flat=True)), user)
+
+
+def _journey_comments(journey_id, ids, user):
+    scope = CommentJourney.objects.filter(journey_id=journey_id)
+    versions = _comments(scope, ids, user)
+    commenters = scope.filter(Q(pk__in=ids) | Q(parent_comment__in=ids)).values('user_id')
+    return [Journey.objects.filter(pk=journey_id),
+            Participation.objects.filter(journey_id=journey_id, user__in=commenters)] + versions  # is_member
+
+
+def journey_comments(journey_id, user, request, paginator):
+    scope = CommentJourney.objects.filter(journey_id=journey_id)
+    return _journey_comments(journey_id, page_ids(threads.top_level(scope), request, paginator), user)
+
+
+def journey_replies(journey_id, comment_id, user):
+    ids = list(CommentJourney.objects.filter(journey_id=journey_id, parent_comment_id=comment_id)
+               .values_list('pk', flat=True))
+    return _journey_comments(journey_id, ids, user)
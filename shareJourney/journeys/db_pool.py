@@ -0,0 +1,56 @@
+import threading
+import time
+import weakref
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# theo dõi các kết nối DB đang mở (mỗi thread giữ 1 kết nối/alias, sống tối đa CONN_MAX_AGE giây)
+_lock = threading.Lock()
+_wrappers = {}  # alias -> WeakSet các DatabaseWrapper đã từng mở kết nối
+_created = {}
+_reused = {}
+_installed = False
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    with _lock:
+        _wrappers.setdefault(connection.alias, weakref.WeakSet()).add(connection)
+        _created[connection.alias] = _created.get(connection.alias, 0) + 1
+
+
+def _on_request_started(sender, **kwargs):
+    # kết nối còn mở từ request trước -> được dùng lại thay vì mở mới
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None:
+            with _lock:
+                _reused[conn.alias] = _reused.get(conn.alias, 0) + 1
+
+
+def install():  # gọi 1 lần trong wsgi.py và asgi.py
+    global _installed
+    if _installed:
+        return
+    connection_created.connect(_on_connection_created, dispatch_uid='db_pool_created')
+    request_started.connect(_on_request_started, dispatch_uid='db_pool_request_started')
+    _installed = True
+
+
+def pool_stats():
+    stats = {}
+    now = time.monotonic()
+    with _lock:
+        for alias in connections:
+            wrappers = [w for w in _wrappers.get(alias, ()) if w.connection is not None]
+            ages = [now - (w.close_at - w.settings_dict['CONN_MAX_AGE']) for w in wrappers
+                    if w.close_at is not None]
+            stats[alias] = {
+                'open': len(wrappers),
+                'created': _created.get(alias, 0),
+                'reused': _reused.get(alias, 0),
+                'max_age': connections.settings[alias]['CONN_MAX_AGE'],
+                'health_checks': connections.settings[alias]['CONN_HEALTH_CHECKS'],
+                'oldest_age': round(max(ages), 1) if ages else None,
+            }
+    return stats
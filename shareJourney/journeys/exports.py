@@ -0,0 +1,159 @@
+import csv
+import datetime
+import json
+from contextlib import contextmanager
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction, connections, router, models
+from django.utils.dateparse import parse_datetime, parse_duration
+from django.utils.timezone import now
+
+from journeys import threads
+from journeys.models import Journey, Post, Image, Comment, CommentJourney, Participation
+
+# Xuất/nhập hành trình kèm post, ảnh, comment và thành viên. Mỗi hành trình là 1 dòng NDJSON;
+# dữ liệu được đọc theo chunk bằng iterator() nên bộ nhớ không tăng theo kích thước bảng.
+
+JOURNEY_FIELDS = ['id', 'user_create_id', 'name_journey', 'background', 'lock_cmt', 'start_location', 'end_location',
+                  'departure_time', 'active', 'distance', 'estimated_time', 'start_latitude', 'start_longitude',
+                  'end_latitude', 'end_longitude', 'distance_km', 'created_date', 'updated_date']
+POST_FIELDS = ['id', 'user_id', 'content', 'visit_point', 'latitude', 'longitude', 'estimated_time_of_arrival',
+               'created_date', 'updated_date']
+COMMENT_FIELDS = ['id', 'user_id', 'content', 'parent_comment_id', 'created_date', 'updated_date']
+PARTICIPATION_FIELDS = ['id', 'user_id', 'joined_at', 'is_approved', 'rating', 'created_date', 'updated_date']
+CSV_FIELDS = JOURNEY_FIELDS + ['posts_count', 'comments_count', 'participants_count']
+SKIP, UPDATE = 'skip', 'update'  # xử lý id đã có khi nhập: bỏ qua dòng đó / ghi đè bằng dữ liệu nhập
+
+
+class ExportEncoder(DjangoJSONEncoder):  # giữ đủ micro giây (DjangoJSONEncoder cắt còn mili giây)
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _values(obj, fields):
+    return {f: getattr(obj, f) for f in fields}
+
+
+def iter_records(journeys, chunk_size=200):
+    journeys = journeys.order_by('id').select_related('archive') \
+        .prefetch_related('post_set__images', 'post_set__comment_set', 'commentjourney_set', 'participation_set')
+    image_field = Image._meta.get_field('image')
+    for journey in journeys.iterator(chunk_size=chunk_size):
+        record = _values(journey, JOURNEY_FIELDS)
+        if journey.archived:  # post/comment nằm trong snapshot lưu trữ
+            snapshot = journey.archive.snapshot()
+            record.update(posts=snapshot['posts'], comments=snapshot['comments'],
+                          participants=[_values(p, PARTICIPATION_FIELDS) for p in journey.participation_set.all()])
+            yield record
+            continue
+        record['posts'] = [dict(_values(post, POST_FIELDS),
+                                images=[{'id': i.id, 'image': image_field.value_to_string(i)}
+                                        for i in post.images.all()],
+                                comments=[_values(c, COMMENT_FIELDS) for c in post.comment_set.all()])
+                           for post in journey.post_set.all()]
+        record['comments'] = [_values(c, COMMENT_FIELDS) for c in journey.commentjourney_set.all()]
+        record['participants'] = [_values(p, PARTICIPATION_FIELDS) for p in journey.participation_set.all()]
+        yield record
+
+
+def iter_ndjson(journeys, chunk_size=200):
+    for record in iter_records(journeys, chunk_size):
+        yield json.dumps(record, cls=ExportEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:  # csv.writer ghi vào đây để lấy từng dòng thay vì ghi ra file
+    def write(self, value):
+        return value
+
+
+def iter_csv(journeys, chunk_size=200):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for record in iter_records(journeys, chunk_size):
+        yield writer.writerow([record[f] for f in JOURNEY_FIELDS] + [
+            len(record['posts']), len(record['comments']), len(record['participants'])])
+
+
+def _parse(record, fields, model, **extra):
+    data = {f: record.get(f) for f in fields}
+    for name in ('created_date', 'updated_date', 'joined_at'):
+        if data.get(name):
+            data[name] = parse_datetime(data[name])
+    if 'updated_date' in data and data['updated_date'] is None:  # lúc nhập auto_now bị tắt (_original_dates)
+        data['updated_date'] = now()
+    if data.get('estimated_time'):
+        data['estimated_time'] = parse_duration(data['estimated_time'])
+    return model(**data, **extra)
+
+
+@contextmanager
+def _original_dates(model):
+    # bulk_create gọi pre_save nên auto_now/auto_now_add ghi đè ngày gốc -> tắt trong lúc insert để khỏi ghi lại lần 2.
+    # Đổi thuộc tính của field dùng chung cả process: chỉ gọi từ lệnh import (1 luồng), không gọi trong request
+    fields = [f for f in model._meta.concrete_fields
+              if isinstance(f, models.DateTimeField) and (f.auto_now or f.auto_now_add)]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, saved):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def _bulk_create(model, objs, batch_size, fields, conflicts=None):
+    # conflicts=None: id đã có -> IntegrityError cả lô; SKIP: bỏ qua dòng trùng id; UPDATE: ghi đè các field nhập vào
+    options = {}
+    if conflicts == SKIP:
+        options['ignore_conflicts'] = True
+    elif conflicts == UPDATE:
+        options.update(update_conflicts=True, update_fields=[f for f in fields if f != 'id'])
+        if connections[router.db_for_write(model)].features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['id']  # MySQL dùng ON DUPLICATE KEY UPDATE, không nhận unique_fields
+    with _original_dates(model):
+        model.objects.bulk_create(objs, batch_size=batch_size, **options)
+
+
+def import_records(lines, batch_size=500, conflicts=None):  # nhập NDJSON do iter_ndjson tạo ra, giữ nguyên id
+    count = 0
+    batch = []
+    for line in lines:
+        if line.strip():
+            batch.append(json.loads(line))
+        if len(batch) >= batch_size:
+            count += _import_batch(batch, batch_size, conflicts)
+            batch = []
+    if batch:
+        count += _import_batch(batch, batch_size, conflicts)
+    return count
+
+
+@transaction.atomic
+def _import_batch(records, batch_size, conflicts=None):
+    journeys, posts, images, comments, journey_comments, participants = [], [], [], [], [], []
+    for record in records:
+        journeys.append(_parse(record, JOURNEY_FIELDS, Journey))
+        for p in record['posts']:
+            posts.append(_parse(p, POST_FIELDS, Post, journey_id=record['id']))
+            images += [Image(id=i['id'], post_id=p['id'], image=i['image']) for i in p['images']]
+            comments += [_parse(c, COMMENT_FIELDS, Comment, post_id=p['id']) for c in p['comments']]
+        journey_comments += [_parse(c, COMMENT_FIELDS, CommentJourney, journey_id=record['id'])
+                             for c in record['comments']]
+        participants += [_parse(p, PARTICIPATION_FIELDS, Participation, journey_id=record['id'])
+                         for p in record['participants']]
+
+    _bulk_create(Journey, journeys, batch_size, JOURNEY_FIELDS, conflicts)
+    _bulk_create(Post, posts, batch_size, POST_FIELDS + ['journey_id'], conflicts)
+    _bulk_create(Image, images, batch_size, ['id', 'post_id', 'image'], conflicts)
+    # comment cha luôn có id nhỏ hơn comment trả lời
+    threads.fill_paths(Comment, comments)
+    threads.fill_paths(CommentJourney, journey_comments)
+    _bulk_create(Comment, sorted(comments, key=lambda c: c.id), batch_size,
+                 COMMENT_FIELDS + ['post_id', 'path'], conflicts)
+    _bulk_create(CommentJourney, sorted(journey_comments, key=lambda c: c.id), batch_size,
+                 COMMENT_FIELDS + ['journey_id', 'path'], conflicts)
+    _bulk_create(Participation, participants, batch_size, PARTICIPATION_FIELDS + ['journey_id'], conflicts)
+    return len(journeys)
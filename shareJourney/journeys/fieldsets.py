@@ -0,0 +1,76 @@
+from rest_framework import serializers
+
+# ?fields=id,name_journey,user_create.username&expand=images
+# - chỉ trả về các field được liệt kê, 'a.b' chọn field b của object lồng a
+# - object lồng có trong fields nhưng không chọn field con và không có trong expand -> chỉ trả về id
+# - không có ?fields -> giữ nguyên toàn bộ như cũ
+
+
+def parse(request):  # -> (cây field, tập đường dẫn expand) hoặc None nếu không lọc
+    params = getattr(request, 'query_params', None)
+    if params is None or not params.get('fields'):
+        return None
+    tree = {}
+    for path in params['fields'].split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    expand = {p.strip() for p in params.get('expand', '').split(',') if p.strip()}
+    return tree, expand
+
+
+def wants(spec, *path):  # client có cần field theo đường dẫn này không (để bỏ bớt query/annotate)
+    if spec is None:
+        return True
+    tree, expand = spec
+    for i, part in enumerate(path):
+        if not tree:
+            return True
+        if part not in tree:
+            return False
+        if i < len(path) - 1 and not tree[part] and '.'.join(path[:i + 1]) not in expand:
+            return False  # object lồng bị thu gọn thành id
+        tree = tree[part]
+    return True
+
+
+def expanded(spec, name):  # object lồng được trả về đầy đủ (không bị thu gọn thành id hay bỏ qua)
+    if spec is None or not spec[0]:
+        return True
+    tree, expand = spec
+    return name in tree and (bool(tree[name]) or name in expand)
+
+
+def nested(spec, name):  # spec của object lồng name, để annotate cho queryset con (vd. replies)
+    if spec is None or not spec[0]:
+        return spec
+    tree, expand = spec
+    return tree.get(name, {}), {e[len(name) + 1:] for e in expand if e.startswith(name + '.')}
+
+
+class SparseFieldsMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        spec = getattr(self, '_sparse', None)
+        if spec is None:
+            root = self.parent is None or (isinstance(self.parent, serializers.ListSerializer)
+                                           and self.parent.parent is None)
+            spec = parse(self.context.get('request')) if root else None
+        if spec is None or not spec[0]:
+            return fields
+        tree, expand = spec
+        result = {}
+        for name, field in fields.items():
+            if name not in tree:
+                continue
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if isinstance(nested, SparseFieldsMixin):
+                if tree[name] or name in expand:
+                    nested._sparse = (tree[name], {e[len(name) + 1:] for e in expand if e.startswith(name + '.')})
+                else:  # không mở rộng -> chỉ trả id
+                    kwargs = {'source': field.source} if field.source else {}
+                    field = serializers.PrimaryKeyRelatedField(read_only=True, many=many, **kwargs)
+            result[name] = field
+        return result
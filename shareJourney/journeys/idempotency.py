@@ -0,0 +1,129 @@
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from journeys.models import IdempotencyKey
+
+# Kho key idempotency: lưu hash của key (không lưu key gốc), hash nội dung thao tác và response đã nén.
+# Mỗi key sống IDEMPOTENCY_TTL_HOURS giờ; key hết hạn coi như chưa từng gửi và bị xóa bởi purge_expired().
+# Key đang xử lý chỉ được giữ IDEMPOTENCY_LEASE_SECONDS giây: process chết giữa chừng (không chạy tới finish) thì
+# hết lease là request gửi lại giành được key, không phải chờ 409 suốt TTL.
+# Dùng chung cho /mutations/ và header Idempotency-Key của các API tạo mới (@idempotent).
+
+
+def digest(value):
+    if not isinstance(value, bytes):
+        value = json.dumps(value, cls=JSONEncoder, sort_keys=True).encode()
+    return hashlib.sha256(value).hexdigest()
+
+
+def pack(data):
+    return zlib.compress(json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode())
+
+
+def unpack(entry):
+    return json.loads(zlib.decompress(bytes(entry.response))) if entry.response else None
+
+
+def expires_at():
+    return now() + timedelta(hours=getattr(settings, 'IDEMPOTENCY_TTL_HOURS', 24))
+
+
+def lease_expires_at():
+    return now() + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 60))
+
+
+def lookup(user, keys):  # {key: IdempotencyKey} của các key còn hạn
+    hashes = {digest(key.encode()): key for key in keys}
+    entries = IdempotencyKey.objects.filter(user=user, key_hash__in=hashes, expires_at__gt=now())
+    return {hashes[entry.key_hash]: entry for entry in entries}
+
+
+def reserve(user, items):  # items: [(key, fingerprint)]; IntegrityError nếu request khác đang giữ cùng key
+    hashes = {digest(key.encode()): key for key, _ in items}
+    IdempotencyKey.objects.filter(user=user, key_hash__in=hashes, expires_at__lte=now()).delete()
+    IdempotencyKey.objects.bulk_create([
+        IdempotencyKey(user=user, key_hash=digest(key.encode()), fingerprint=fingerprint,
+                       expires_at=lease_expires_at())  # chỉ giữ trong thời gian lease cho tới khi finish
+        for key, fingerprint in items
+    ])
+    # đọc lại để có id (MySQL không trả id sau bulk_create)
+    return {hashes[e.key_hash]: e for e in IdempotencyKey.objects.filter(user=user, key_hash__in=hashes)}
+
+
+def finish(entries, results):  # entries: {key: IdempotencyKey đã giữ}, results: {key: (status_code, data)}
+    done = []
+    for key, entry in entries.items():
+        if key in results:
+            entry.status_code, data = results[key]
+            entry.response = pack(data)
+            entry.expires_at = expires_at()  # xong -> giữ kết quả đủ TTL
+            done.append(entry)
+    IdempotencyKey.objects.bulk_update(done, ['status_code', 'response', 'expires_at'])
+    IdempotencyKey.objects.filter(id__in=[e.id for k, e in entries.items() if k not in results]).delete()
+
+
+def purge_expired(batch_size=1000):
+    total = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now()).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+def _request_fingerprint(request):  # method + path + nội dung (file chỉ tính tên và kích thước)
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {name: values for name, values in data.lists()}
+    files = {name: [(f.name, f.size) for f in request.FILES.getlist(name)] for name in request.FILES}
+    return digest([request.method, request.path, data if not files else {**data, **files}])
+
+
+def idempotent(view):  # header Idempotency-Key: gửi lại cùng key -> trả response đã lưu, không chạy lại view
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key or not request.user.is_authenticated:
+            return view(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': 'Idempotency-Key quá dài'}, status=status.HTTP_400_BAD_REQUEST)
+        fingerprint = _request_fingerprint(request)
+        entry = lookup(request.user, [key]).get(key)
+        if entry is None:
+            try:
+                with transaction.atomic():
+                    entry = reserve(request.user, [(key, fingerprint)])[key]
+            except IntegrityError:  # request khác vừa giữ cùng key
+                entry = lookup(request.user, [key]).get(key)
+            else:
+                return _execute(view, entry, key, self, request, *args, **kwargs)
+        if entry is None or entry.status_code is None:
+            return Response({'error': 'Request với key này đang được xử lý'}, status=status.HTTP_409_CONFLICT)
+        if entry.fingerprint != fingerprint:
+            return Response({'error': 'Key đã được dùng cho request khác'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = Response(unpack(entry), status=entry.status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+    return wrapper
+
+
+def _execute(view, entry, key, *args, **kwargs):  # chỉ lưu response thành công; lỗi thì nhả key để client thử lại
+    results = {}
+    try:
+        response = view(*args, **kwargs)
+        if status.is_success(response.status_code):
+            results[key] = (response.status_code, response.data)
+        return response
+    finally:
+        finish({key: entry}, results)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from journeys import archive
+
+
+class Command(BaseCommand):  # chạy định kỳ, mỗi lần xử lý tối đa --batches x --batch-size hành trình
+    help = 'Move journeys completed more than N days ago into compressed archive snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--batches', type=int, default=20)
+
+    def handle(self, *args, **options):
+        total = 0
+        for _ in range(options['batches']):
+            count = archive.archive_batch(options['days'], options['batch_size'])
+            total += count
+            if count < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'Đã lưu trữ {total} hành trình.'))
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from journeys.models import Journey, Post
+
+
+class Command(BaseCommand):  # so sánh API sync (DRF) với bản async trên dữ liệu hiện có
+    help = 'Benchmark sync vs async read endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--token', help='OAuth2 access token dùng cho các API cần đăng nhập')
+        parser.add_argument('--host', help='Host gửi kèm request, mặc định lấy từ ALLOWED_HOSTS')
+
+    def handle(self, *args, **options):
+        journey = Journey.objects.order_by('-id').first()
+        post = Post.objects.order_by('-id').first()
+        pairs = [('journey list', '/journey/', '/async/journey/')]
+        if journey:
+            pairs += [
+                ('journey detail', f'/journey/{journey.id}/', f'/async/journey/{journey.id}/'),
+                ('members', f'/journey/{journey.id}/members/', f'/async/journey/{journey.id}/members/'),
+                ('journey comments', f'/journey/{journey.id}/comments/', f'/async/journey/{journey.id}/comments/'),
+            ]
+        if post:
+            pairs.append(('post comments', f'/post/{post.id}/comments/', f'/async/post/{post.id}/comments/'))
+
+        # Client mặc định gửi Host 'testserver', ngoài test runner sẽ bị DisallowedHost (400)
+        host = options['host'] or next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        headers = {'HTTP_HOST': host, 'SERVER_NAME': host}
+        if options['token']:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {options["token"]}'
+        total = options['requests']
+        for name, sync_url, async_url in pairs:
+            sync_time = self.run_sync(sync_url, total, headers)
+            async_time = asyncio.run(self.run_async(async_url, total, options['concurrency'], headers))
+            self.stdout.write(f'{name:<18} sync {total / sync_time:8.1f} req/s   '
+                              f'async {total / async_time:8.1f} req/s (concurrency {options["concurrency"]})')
+
+    def run_sync(self, url, total, headers):
+        client = Client(**headers)
+        start = time.perf_counter()
+        for _ in range(total):
+            self.ensure_ok(url, client.get(url))
+        return time.perf_counter() - start
+
+    async def run_async(self, url, total, concurrency, headers):
+        client = AsyncClient(**headers)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with semaphore:
+                self.ensure_ok(url, await client.get(url))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[fetch() for _ in range(total)])
+        return time.perf_counter() - start
+
+    def ensure_ok(self, url, response):  # đo tốc độ trang lỗi thì kết quả vô nghĩa
+        if not 200 <= response.status_code < 300:
+            raise CommandError(f'{url} trả về {response.status_code}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from journeys import recommendations
+
+
+class Command(BaseCommand):  # chạy định kỳ (cron): mặc định chỉ tính lại user có tương tác mới
+    help = 'Precompute journey recommendations for users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Tính lại cho tất cả user')
+        parser.add_argument('--top-n', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        since = recommendations.last_build_time()
+        user_ids, new_journey_ids = None, ()
+        if not options['full'] and since is not None:
+            user_ids = recommendations.users_to_refresh(since)
+            new_journey_ids = recommendations.new_journeys(since)
+        count = recommendations.build_recommendations(user_ids, top_n=options['top_n'],
+                                                      batch_size=options['batch_size'],
+                                                      new_journey_ids=new_journey_ids)
+        self.stdout.write(self.style.SUCCESS(f'Đã cập nhật gợi ý cho {count} user.'))
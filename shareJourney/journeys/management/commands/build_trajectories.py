@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from journeys import trajectories
+from journeys.models import Post
+
+
+class Command(BaseCommand):  # dựng trajectory cho các post có sẵn trước khi có bảng Trajectory
+    help = 'Rebuild member trajectories from check-in posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journey', type=int, help='Chỉ dựng lại cho 1 hành trình')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if options['journey']:
+            posts = posts.filter(journey_id=options['journey'])
+        pairs = posts.values_list('journey_id', 'user_id').distinct().order_by()
+        count = 0
+        for journey_id, user_id in pairs.iterator():
+            trajectories.rebuild(journey_id, user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Đã dựng {count} trajectory.'))
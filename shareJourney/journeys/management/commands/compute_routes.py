@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from journeys import routes
+from journeys.models import Journey
+
+
+class Command(BaseCommand):
+    help = 'Compute distance_km / estimated_time for journeys with start and end coordinates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Tính lại cả hành trình đã có distance_km')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        journeys = Journey.objects.all()
+        if not options['all']:
+            journeys = journeys.filter(distance_km__isnull=True)
+        count = routes.compute_routes(journeys, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Đã tính quãng đường cho {count} hành trình.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from journeys.exports import iter_ndjson, iter_csv
+from journeys.models import Journey
+
+
+class Command(BaseCommand):
+    help = 'Stream journeys with their posts, comments and participants as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--output', help='File đích (mặc định: stdout)')
+        parser.add_argument('--active', action='store_true', help='Chỉ xuất hành trình đang hoạt động')
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        journeys = Journey.objects.all()
+        if options['active']:
+            journeys = journeys.active()
+        rows = (iter_ndjson if options['format'] == 'ndjson' else iter_csv)(journeys, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from journeys.exports import import_records, SKIP, UPDATE
+
+
+class Command(BaseCommand):
+    help = 'Bulk import journeys from an NDJSON file produced by export_journeys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+        conflicts = parser.add_mutually_exclusive_group()  # mặc định: id đã có trong DB -> lỗi, không nhập lô đó
+        conflicts.add_argument('--skip-existing', dest='conflicts', action='store_const', const=SKIP,
+                               help='Bỏ qua các dòng có id đã tồn tại')
+        conflicts.add_argument('--update-existing', dest='conflicts', action='store_const', const=UPDATE,
+                               help='Ghi đè các dòng có id đã tồn tại bằng dữ liệu nhập')
+
+    def handle(self, *args, **options):
+        with open(options['path'], encoding='utf-8') as f:
+            count = import_records(f, batch_size=options['batch_size'], conflicts=options['conflicts'])
+        self.stdout.write(self.style.SUCCESS(f'Đã nhập {count} hành trình.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from journeys import notifications
+
+
+class Command(BaseCommand):  # chạy định kỳ (cron): dọn thông báo cũ, gộp thông báo, tạo bản tổng hợp
+    help = 'Purge old read notifications, compact bursts and generate digests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--digest-hours', type=int, default=0, help='Tạo bản tổng hợp cho N giờ qua (0 = bỏ qua)')
+
+    def handle(self, *args, **options):
+        purged = notifications.purge_read(options['retention_days'], options['batch_size'])
+        merged = notifications.compact()
+        self.stdout.write(f'Đã xóa {purged} thông báo cũ, gộp {merged} thông báo.')
+        if options['digest_hours']:
+            digests = notifications.build_digests(options['digest_hours'])
+            self.stdout.write(f'Đã tạo {digests} bản tổng hợp.')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from journeys import idempotency
+
+
+class Command(BaseCommand):  # chạy định kỳ (cron): xóa các key idempotency đã hết hạn
+    help = 'Delete expired idempotency keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Đã xóa {idempotency.purge_expired(options['batch_size'])} key.")
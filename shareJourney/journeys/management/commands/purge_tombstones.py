@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from journeys import sync
+
+
+class Command(BaseCommand):  # chạy định kỳ (cron): xóa tombstone cũ hơn SYNC_TOMBSTONE_DAYS
+    help = 'Delete sync tombstones older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SYNC_TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Đã xóa {sync.purge_tombstones(options['days'])} tombstone.")
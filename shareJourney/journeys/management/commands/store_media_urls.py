@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from journeys import media
+
+
+class Command(BaseCommand):  # lưu URL ảnh cho các user/ảnh có trước khi có avatar_url, image_url
+    help = 'Precompute and store Cloudinary URLs for existing avatars and post images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = 0
+        for model, fields in media.STORED.items():
+            batch = []
+            for instance in model.objects.only('id', *fields, *fields.values()).iterator(options['batch_size']):
+                changes = media.stale(instance)
+                if changes:
+                    for name, value in changes.items():
+                        setattr(instance, name, value)
+                    batch.append(instance)
+                if len(batch) >= options['batch_size']:
+                    count += model.objects.bulk_update(batch, list(fields.values()))
+                    batch = []
+            count += model.objects.bulk_update(batch, list(fields.values()))
+        self.stdout.write(self.style.SUCCESS(f'Đã lưu URL cho {count} ảnh.'))
@@ -0,0 +1,60 @@
+import json
+from functools import lru_cache
+
+from cloudinary import CloudinaryResource, utils
+from cloudinary.models import CloudinaryField
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from journeys.models import User, Image
+
+# URL ảnh Cloudinary: build 1 lần cho mỗi (public_id, version, định dạng, transformation) rồi giữ trong LRU của
+# process, thay vì ký/ghép chuỗi lại cho từng object mỗi lần serialize. URL luôn có version nên nội dung sau URL
+# không đổi -> CDN và client cache lâu dài được (ảnh mới = version mới = URL mới).
+# CLOUDINARY_STORED_URLS: dùng URL đã lưu sẵn vào DB lúc upload (avatar_url, image_url), không cần build.
+
+STORED = {User: {'avatar': 'avatar_url'}, Image: {'image': 'image_url'}}  # model -> {field ảnh: field lưu URL}
+
+_field = CloudinaryField()  # để parse giá trị thô lấy từ .values()
+
+
+@lru_cache(maxsize=getattr(settings, 'CLOUDINARY_URL_CACHE_SIZE', 20000))
+def _build(public_id, resource_type, type, version, format, options):  # options: JSON (key của cache)
+    return utils.cloudinary_url(public_id, resource_type=resource_type, type=type, version=version, format=format,
+                                **json.loads(options))[0]
+
+
+def url(resource, **options):  # resource: CloudinaryResource hoặc chuỗi lưu trong DB
+    if isinstance(resource, str):
+        resource = _field.to_python(resource) if resource else None
+    if not resource or not isinstance(resource, CloudinaryResource):
+        return None
+    options = {**getattr(settings, 'CLOUDINARY_URL_OPTIONS', {}), **resource.url_options, **options}
+    return _build(resource.public_id, resource.resource_type or 'image', resource.type, resource.version,
+                  resource.format, json.dumps(options, sort_keys=True))  # transformation là list/dict lồng nhau
+
+
+def field_url(instance, field):  # URL của field ảnh trên instance, ưu tiên URL đã lưu sẵn
+    stored = STORED.get(type(instance), {}).get(field)
+    if stored and getattr(settings, 'CLOUDINARY_STORED_URLS', True) and stored in instance.__dict__:
+        value = instance.__dict__[stored]
+        if value:
+            return value
+    return url(getattr(instance, field))
+
+
+def stale(instance):  # {field lưu URL: URL mới} của những field chưa khớp với ảnh hiện tại
+    return {stored: url(getattr(instance, field)) or '' for field, stored in STORED.get(type(instance), {}).items()
+            if getattr(instance, stored) != (url(getattr(instance, field)) or '')}
+
+
+@receiver(post_save, dispatch_uid='media_store_urls')
+def store_urls(sender, instance, raw=False, **kwargs):  # ảnh được upload trong save() -> chỉ có URL sau khi lưu
+    if sender not in STORED or raw:
+        return
+    changes = stale(instance)
+    if changes:
+        sender.objects.filter(pk=instance.pk).update(**changes)
+        for name, value in changes.items():
+            setattr(instance, name, value)
@@ -0,0 +1,96 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # không cài brotli -> chỉ dùng gzip
+    brotli = None
+
+from journeys import routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:  # request đọc (GET) dùng replica trừ khi client vừa ghi dữ liệu
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_key = self.get_pin_key(request)
+        use_primary = request.method not in SAFE_METHODS or cache.get(pin_key) is not None
+        tokens = routers.start_request(use_primary)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request(tokens)
+        if wrote or request.method not in SAFE_METHODS:
+            # read-your-writes: trong vài giây sau khi ghi, client này vẫn đọc từ primary
+            cache.set(pin_key, True, getattr(settings, 'REPLICA_READ_YOUR_WRITES_SECONDS', 5))
+        return response
+
+    def get_pin_key(self, request):
+        client = (request.META.get('HTTP_AUTHORIZATION')
+                  or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                  or request.META.get('REMOTE_ADDR', ''))
+        return 'replica_pin:' + hashlib.sha1(client.encode()).hexdigest()
+
+
+class CompressionMiddleware:  # nén response bằng brotli (nếu cài) hoặc gzip khi lớn hơn COMPRESSION_MIN_SIZE
+    COMPRESSIBLE = ('application/json', 'application/msgpack', 'application/cbor', 'application/x-ndjson',
+                    'application/javascript', 'text/')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not response.get('Content-Type', '').startswith(
+                self.COMPRESSIBLE):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+        if response.streaming:  # export CSV/NDJSON: nén dần từng phần bằng gzip
+            if 'gzip' not in accepted or response.is_async:
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+            encoding = 'gzip'
+        else:
+            if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+                return response
+            if brotli is not None and 'br' in accepted:
+                content, encoding = brotli.compress(response.content,
+                                                    quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)), 'br'
+            elif 'gzip' in accepted:
+                content, encoding = compress_string(response.content), 'gzip'
+            else:
+                return response
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):  # nội dung đã đổi -> ETag chỉ còn là weak
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+def accepted_encodings(header):  # 'gzip, br;q=0.8, deflate;q=0' -> {'gzip', 'br'}
+    result = set()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1
+        except ValueError:
+            quality = 1
+        if name.strip() and quality > 0:
+            result.add(name.strip().lower())
+    return result
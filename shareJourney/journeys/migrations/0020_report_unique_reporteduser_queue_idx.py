@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:36
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def dedupe_reports(apps, schema_editor):
+    # giữ lại report đầu tiên của mỗi cặp (reported_user, reported_by) rồi đếm lại report_count
+    Report = apps.get_model('journeys', 'Report')
+    ReportedUser = apps.get_model('journeys', 'ReportedUser')
+    duplicates = (Report.objects.values('reported_user', 'reported_by')
+                  .annotate(first_id=Min('id'), total=Count('id')).filter(total__gt=1))
+    for d in duplicates:
+        Report.objects.filter(reported_user=d['reported_user'], reported_by=d['reported_by']) \
+            .exclude(id=d['first_id']).delete()
+    for profile in ReportedUser.objects.annotate(total=Count('reports')):
+        if profile.report_count != profile.total:
+            ReportedUser.objects.filter(pk=profile.pk).update(report_count=profile.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0019_alter_post_latitude_alter_post_longitude'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_reports, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='report',
+            unique_together={('reported_user', 'reported_by')},
+        ),
+        migrations.AddIndex(
+            model_name='reporteduser',
+            index=models.Index(fields=['is_processed', '-report_count'], name='reporteduser_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0020_report_unique_reporteduser_queue_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('score', models.FloatField()),
+                ('journey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='journeys.journey')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-score'], name='recommendation_user_score_idx')],
+                'unique_together': {('user', 'journey')},
+            },
+        ),
+    ]
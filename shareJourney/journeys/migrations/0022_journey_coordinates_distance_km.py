@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0021_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journey',
+            name='distance_km',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='journey',
+            name='end_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='journey',
+            name='end_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='journey',
+            name='start_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='journey',
+            name='start_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
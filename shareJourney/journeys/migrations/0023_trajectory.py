@@ -0,0 +1,32 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0022_journey_coordinates_distance_km'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trajectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('polyline', models.TextField(default='')),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('last_latitude', models.FloatField(blank=True, null=True)),
+                ('last_longitude', models.FloatField(blank=True, null=True)),
+                ('journey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trajectories', to='journeys.journey')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trajectories', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('journey', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0023_trajectory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JourneyArchive',
+            fields=[
+                ('journey', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='journeys.journey')),
+                ('data', models.BinaryField()),
+                ('likes_count', models.PositiveIntegerField(default=0)),
+                ('comments_count', models.PositiveIntegerField(default=0)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='journey',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('journey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_posts', to='journeys.journey')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0027_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='image_url',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_url',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
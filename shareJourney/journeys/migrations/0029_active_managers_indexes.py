@@ -0,0 +1,48 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:03
+
+from django.db import migrations, models
+import journeys.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0028_media_urls'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', journeys.models.SoftStateUserManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', 'is_active', 'follower'], name='follow_following_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', 'is_active', 'following'], name='follow_follower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['active', '-created_date'], name='journey_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='likejourney',
+            index=models.Index(fields=['journey', 'active'], name='likejourney_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='likepost',
+            index=models.Index(fields=['post', 'active'], name='likepost_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['journey', 'is_approved', 'user'], name='participation_approved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['user', 'is_approved', 'journey'], name='participation_user_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0029_active_managers_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent_comment', 'created_date'], name='comment_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentjourney',
+            index=models.Index(fields=['journey', 'parent_comment', 'created_date'], name='commentjourney_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # comment cha luôn có id nhỏ hơn comment trả lời -> duyệt theo id là đủ để có path của cha trước
+    for name in ('Comment', 'CommentJourney'):
+        model = apps.get_model('journeys', name)
+        paths, parents, batch = {}, {}, []
+        for comment in model.objects.order_by('id').only('id', 'parent_comment_id').iterator(chunk_size=2000):
+            parent_id = comment.parent_comment_id
+            while parent_id is not None and len(paths.get(parent_id, '')) + 11 > 255:
+                parent_id = parents[parent_id]  # quá sâu -> gắn vào tổ tiên gần nhất còn chỗ (giống CommentPath.save)
+            comment.parent_comment_id = parents[comment.id] = parent_id
+            comment.path = paths[comment.id] = paths.get(parent_id, '') + '%010d/' % comment.id
+            batch.append(comment)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ['path', 'parent_comment'])
+                batch = []
+        model.objects.bulk_update(batch, ['path', 'parent_comment'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0030_comment_thread_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='commentjourney',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0031_comment_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tombstone',
+            name='journey_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
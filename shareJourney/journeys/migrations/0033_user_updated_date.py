@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0032_tombstone_journey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
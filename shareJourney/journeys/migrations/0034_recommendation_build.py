@@ -0,0 +1,22 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0033_user_updated_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('full', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
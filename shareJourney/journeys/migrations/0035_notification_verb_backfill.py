@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:40
+
+from django.db import migrations
+
+# thông báo tạo trước 0025 chưa có verb -> suy ra từ nội dung (giống notifications.MESSAGES lúc đó) để compact gộp được
+VERBS = [
+    ('like_journey', 'đã thích hành trình của bạn.'),
+    ('comment_journey', 'đã bình luận trên hành trình của bạn.'),
+    ('like_post', 'đã thích bài viết của bạn.'),
+    ('comment_post', 'đã bình luận trên bài viết của bạn.'),
+    ('approve', 'duyệt vào hành trình của họ.'),
+]
+
+
+def fill_verbs(apps, schema_editor):
+    Notification = apps.get_model('journeys', 'Notification')
+    for verb, suffix in VERBS:
+        Notification.objects.filter(verb='', message__endswith=suffix).update(verb=verb)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journeys', '0034_recommendation_build'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_verbs, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,24 @@
+import json
+import zlib
+
 from cloudinary.models import CloudinaryField
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Length, Substr
+from django.contrib.auth.models import AbstractUser, UserManager
+
+
+class SoftStateQuerySet(models.QuerySet):  # .active(): chỉ các dòng còn hiệu lực theo cờ ACTIVE_FIELD của model
+    def active(self):
+        return self.filter(**{self.model.ACTIVE_FIELD: True})
+
+    def inactive(self):
+        return self.filter(**{self.model.ACTIVE_FIELD: False})
+
+
+class SoftStateUserManager(UserManager.from_queryset(SoftStateQuerySet)):  # giữ create_user/create_superuser
+    pass
 
 
 class BaseModel(models.Model):
@@ -14,9 +32,14 @@ class BaseModel(models.Model):
 class User(AbstractUser):
     is_active = models.BooleanField(default=True)  # admin khóa tài khoản
     avatar = CloudinaryField(folder="avatarJourney", null=False, blank=False, default='')
+    avatar_url = models.CharField(max_length=255, blank=True, default='')  # URL build sẵn lúc upload (journeys.media)
     phone = models.CharField(max_length=10, unique=True, null=True)
     email = models.EmailField(max_length=50, unique=True)
     rate = models.FloatField(null=True, blank=True, default=0.0)
+    updated_date = models.DateTimeField(auto_now=True, null=True)  # ETag của các trang lồng user (conditional)
+
+    ACTIVE_FIELD = 'is_active'
+    objects = SoftStateUserManager()
 
 
 class Journey(BaseModel):
@@ -30,6 +53,21 @@ class Journey(BaseModel):
     active = models.BooleanField(default=True)
     distance = models.CharField(max_length=100, blank=True, null=True)
     estimated_time = models.DurationField(blank=True, null=True)
+    start_latitude = models.FloatField(blank=True, null=True)
+    start_longitude = models.FloatField(blank=True, null=True)
+    end_latitude = models.FloatField(blank=True, null=True)
+    end_longitude = models.FloatField(blank=True, null=True)
+    distance_km = models.FloatField(blank=True, null=True)  # tính bởi journeys.routes
+    archived = models.BooleanField(default=False)  # post/comment/like đã chuyển sang JourneyArchive
+
+    ACTIVE_FIELD = 'active'
+    objects = SoftStateQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_date', 'id'], name='journey_sync_idx'),  # keyset cho /sync/
+            models.Index(fields=['active', '-created_date'], name='journey_active_idx'),  # danh sách đang hoạt động
+        ]
 
     def __str__(self):
         return self.name_journey
@@ -48,6 +86,16 @@ class Participation(Interaction):  # ds user tham gia hành trình
     is_approved = models.BooleanField(default=False)  # xác nhận người tham gia hành trình
     rating = models.IntegerField(null=True, blank=True)
 
+    ACTIVE_FIELD = 'is_approved'  # .active() = thành viên đã được duyệt
+    objects = SoftStateQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_date', 'id'], name='participation_sync_idx'),
+            models.Index(fields=['journey', 'is_approved', 'user'], name='participation_approved_idx'),
+            models.Index(fields=['user', 'is_approved', 'journey'], name='participation_user_idx'),
+        ]
+
 
 class Post(Interaction):
     content = models.TextField()
@@ -56,9 +104,15 @@ class Post(Interaction):
     longitude = models.FloatField(blank=True, null=True)
     estimated_time_of_arrival = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_date', 'id'], name='post_sync_idx'),
+        ]
+
 
 class Image(models.Model):
     image = CloudinaryField(folder="PostJourney", null=True, blank=True)
+    image_url = models.CharField(max_length=255, blank=True, default='')
     post = models.ForeignKey(Post, related_name='images', on_delete=models.CASCADE, default=None)
 
 
@@ -73,32 +127,100 @@ class InteractionPost(BaseModel):
 class LikeJourney(Interaction):
     active = models.BooleanField(default=True)
 
+    ACTIVE_FIELD = 'active'
+    objects = SoftStateQuerySet.as_manager()
+
     class Meta:
         unique_together = ("journey", "user")
+        indexes = [
+            models.Index(fields=['journey', 'active'], name='likejourney_active_idx'),  # đếm like còn hiệu lực
+        ]
 
 
 class LikePost(InteractionPost):
     active = models.BooleanField(default=True)
 
+    ACTIVE_FIELD = 'active'
+    objects = SoftStateQuerySet.as_manager()
+
     class Meta:
         unique_together = ("post", "user")
+        indexes = [
+            models.Index(fields=['post', 'active'], name='likepost_active_idx'),
+        ]
+
 
+class CommentPath(models.Model):  # materialized path: id tổ tiên + id của mình, vd '0000000052/0000000077/'
+    path = models.CharField(max_length=255, db_index=True, default='', editable=False)
 
-class CommentJourney(Interaction):
+    STEP = 11  # id 10 chữ số + '/'
+
+    class Meta:
+        abstract = True
+
+    def clean(self):
+        super().clean()
+        self._check_parent()
+
+    def _check_parent(self):
+        if self.path and self.parent_comment is not None and self.parent_comment.path.startswith(self.path):
+            raise ValidationError({'parent_comment': 'Không thể chuyển bình luận vào trả lời của chính nó.'})
+
+    def save(self, *args, **kwargs):
+        self._check_parent()
+        model = type(self)
+        old_path = self.path  # '' khi tạo mới
+        below = 0  # độ dài phần path của cây con nằm dưới bình luận này (khi đổi cha)
+        if old_path and (self.parent_comment.path if self.parent_comment is not None else '') != old_path[:-self.STEP]:
+            below = model.objects.filter(path__istartswith=old_path).aggregate(n=models.Max(Length('path')))['n'] \
+                - len(old_path)
+        parent = self.parent_comment
+        while parent is not None and len(parent.path) + self.STEP + below > self._meta.get_field('path').max_length:
+            parent = parent.parent_comment  # quá sâu -> gắn vào tổ tiên gần nhất còn chỗ
+        self.parent_comment = parent
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            path = (parent.path if parent is not None else '') + '%010d/' % self.pk
+            if path != self.path:  # id chỉ có sau khi insert, hoặc đã đổi cha
+                self.path = path
+                model.objects.filter(pk=self.pk).update(path=path)
+                if old_path:  # đổi cha (admin): viết lại path của cả cây con trong 1 UPDATE
+                    model.objects.filter(path__istartswith=old_path).exclude(pk=self.pk) \
+                        .update(path=Concat(Value(path), Substr('path', len(old_path) + 1)))
+
+
+class CommentJourney(Interaction, CommentPath):
     content = models.TextField()
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_date', 'id'], name='commentjourney_sync_idx'),
+            models.Index(fields=['journey', 'parent_comment', 'created_date'], name='commentjourney_thread_idx'),
+        ]
+
 
-class Comment(InteractionPost):
+class Comment(InteractionPost, CommentPath):
     content = models.TextField()
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_date', 'id'], name='comment_sync_idx'),
+            models.Index(fields=['post', 'parent_comment', 'created_date'], name='comment_thread_idx'),  # phân trang
+        ]
+
 
 class ReportedUser(models.Model):  # lưu trạng thái xử lý
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='reported_user')  # user bị report
     report_count = models.PositiveIntegerField(default=0)
     is_processed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_processed', '-report_count'], name='reporteduser_queue_idx'),  # hàng đợi xử lý
+        ]
+
     def __str__(self):
         return self.user.username
 
@@ -111,14 +233,24 @@ class Report(BaseModel):
     reported_user_profile = models.ForeignKey(ReportedUser, on_delete=models.CASCADE, related_name='reports', null=True,
                                               blank=True)  # Inlines admin
 
+    class Meta:
+        unique_together = ('reported_user', 'reported_by')  # mỗi người chỉ report 1 user 1 lần
+
 
 class Follow(BaseModel):
     follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_user')
     following = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_following')
     is_active = models.BooleanField(default=True)
 
+    ACTIVE_FIELD = 'is_active'
+    objects = SoftStateQuerySet.as_manager()
+
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [  # follower/following còn hiệu lực của 1 user
+            models.Index(fields=['following', 'is_active', 'follower'], name='follow_following_idx'),
+            models.Index(fields=['follower', 'is_active', 'following'], name='follow_follower_idx'),
+        ]
 
 
 class Notification(BaseModel):
@@ -128,9 +260,84 @@ class Notification(BaseModel):
     message = models.CharField(max_length=255)
     read = models.BooleanField(default=False)
     actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='actor_notifications', null=True, blank=True)
+    verb = models.CharField(max_length=20, blank=True, default='')  # loại thông báo, dùng để gộp (journeys.notifications)
+    count = models.PositiveIntegerField(default=1)  # số thông báo đã gộp vào dòng này
 
     class Meta:
         ordering = ['-created_date']
+        indexes = [
+            models.Index(fields=['user', 'read', 'created_date'], name='notification_inbox_idx'),
+            models.Index(fields=['user', 'updated_date', 'id'], name='notification_sync_idx'),
+        ]
 
     def __str__(self):
         return self.message
+
+
+class Recommendation(BaseModel):  # top-N hành trình gợi ý cho mỗi user, tính sẵn bằng lệnh build_recommendations
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    journey = models.ForeignKey(Journey, on_delete=models.CASCADE, related_name='recommendations')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('user', 'journey')
+        indexes = [
+            models.Index(fields=['user', '-score'], name='recommendation_user_score_idx'),
+        ]
+
+
+class RecommendationBuild(models.Model):  # mỗi lần chạy build_recommendations, mốc cho chế độ chỉ tính user thay đổi
+    started_at = models.DateTimeField(db_index=True)
+    users = models.PositiveIntegerField(default=0)
+    full = models.BooleanField(default=False)
+
+
+class Trajectory(BaseModel):  # đường đi của 1 thành viên trong hành trình, lưu dạng encoded polyline
+    journey = models.ForeignKey(Journey, on_delete=models.CASCADE, related_name='trajectories')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trajectories')
+    polyline = models.TextField(default='')
+    point_count = models.PositiveIntegerField(default=0)
+    last_latitude = models.FloatField(null=True, blank=True)  # điểm cuối, để nối thêm điểm mới mà không decode lại
+    last_longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('journey', 'user')
+
+
+class JourneyArchive(models.Model):  # snapshot nén (zlib + JSON) của hành trình đã hoàn thành lâu
+    journey = models.OneToOneField(Journey, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    data = models.BinaryField()
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def snapshot(self):
+        if not hasattr(self, '_snapshot'):
+            self._snapshot = json.loads(zlib.decompress(bytes(self.data)))
+        return self._snapshot
+
+
+class ArchivedPost(models.Model):  # id post cũ -> hành trình đã lưu trữ, để /post/<id>/ vẫn tìm được
+    id = models.BigIntegerField(primary_key=True)
+    journey = models.ForeignKey(Journey, on_delete=models.CASCADE, related_name='archived_posts')
+
+
+class Tombstone(models.Model):  # dấu vết các dòng đã bị xóa để client offline đồng bộ (/sync/)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)  # chỉ gửi cho user này (thông báo)
+    journey_id = models.BigIntegerField(null=True, blank=True, db_index=True)  # chỉ gửi cho thành viên hành trình này
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class IdempotencyKey(models.Model):  # kết quả của 1 thao tác theo key client gửi, để lần gửi lại không chạy lại
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key_hash = models.CharField(max_length=64)  # sha256 của key
+    fingerprint = models.CharField(max_length=64, blank=True, default='')  # sha256 nội dung thao tác
+    status_code = models.PositiveSmallIntegerField(null=True)  # null = đang xử lý
+    response = models.BinaryField(default=b'')  # zlib(JSON)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key_hash')
@@ -0,0 +1,223 @@
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from journeys import idempotency, notifications, routes, trajectories
+from journeys.throttling import ActionThrottle
+from journeys.models import Journey, Post, CommentJourney, Comment, LikeJourney, LikePost
+from journeys.serializers import PostSerializer
+
+# Ghi hàng loạt cho client offline: POST /mutations/ {"operations": [{"key": "...", "op": "...", "args": {...}}]}
+# Các thao tác chạy theo thứ tự trong 1 transaction (mỗi thao tác 1 savepoint để lỗi của 1 thao tác không làm hỏng
+# cả lô), key đã xử lý thì trả lại kết quả cũ. Giá trị "@<key>" trong args = id do thao tác trước trong lô tạo ra.
+# Like được ghi gộp (bulk) ở cuối lô; post/comment cần id ngay nên tạo từng dòng.
+# Mỗi thao tác bị tính vào cùng bộ đếm JOURNEY_THROTTLES với API đơn lẻ tương ứng; vượt giới hạn -> lỗi 429.
+
+OPERATIONS = ('create_post', 'comment_journey', 'comment_post', 'like_journey', 'like_post')
+THROTTLED = {  # thao tác -> (basename, action) của API đơn lẻ; comment có 'parent' tính như reply_to_comment
+    'create_post': ('post', 'create'),
+    'comment_journey': ('journey', 'add_comment'),
+    'comment_post': ('post', 'add_comment'),
+    'like_journey': ('journey', 'like'),
+    'like_post': ('post', 'like'),
+}
+
+
+class OperationError(Exception):
+    def __init__(self, error, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(error)
+        self.error = error
+        self.status_code = status_code
+
+
+class KeyConflict(Exception):  # request khác đang xử lý cùng key
+    pass
+
+
+def parse(data):
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ValidationError({'operations': 'Thiếu danh sách thao tác'})
+    if len(operations) > getattr(settings, 'MUTATION_BATCH_MAX_OPERATIONS', 200):
+        raise ValidationError({'operations': 'Quá nhiều thao tác trong 1 lô'})
+    for i, op in enumerate(operations):
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS or not isinstance(op.get('args', {}), dict) \
+                or not isinstance(op.get('key'), str) or not 0 < len(op['key']) <= 255:
+            raise ValidationError({'operations': f'Thao tác thứ {i} không hợp lệ'})
+        op.setdefault('args', {})
+    return operations
+
+
+def _get(queryset, pk):
+    try:
+        obj = queryset.filter(pk=int(pk)).first()
+    except (TypeError, ValueError):
+        obj = None
+    if obj is None:
+        raise OperationError(f'Không tìm thấy {queryset.model.__name__} {pk}', status.HTTP_404_NOT_FOUND)
+    return obj
+
+
+class Runner:
+    def __init__(self, request, operations):
+        self.request = request
+        self.user = request.user
+        self.results = {}  # key -> kết quả (kể cả kết quả cũ của key trùng), để giải "@key"
+        self.likes = {LikeJourney: {}, LikePost: {}}  # model -> {id đối tượng: like (chưa ghi)}
+        self.targets = {LikeJourney: {}, LikePost: {}}  # model -> {id: Journey/Post}
+        self.throttle = ActionThrottle()
+        self._prefetch_likes(operations)
+
+    def _prefetch_likes(self, operations):  # 1 query cho đối tượng + 1 query cho like hiện có của mỗi loại
+        for op, model, target, field in (('like_journey', LikeJourney, Journey, 'journey'),
+                                         ('like_post', LikePost, Post, 'post')):
+            ids = {o['args'].get(field) for o in operations if o['op'] == op}
+            ids = [int(i) for i in ids if isinstance(i, int) or (isinstance(i, str) and i.isdigit())]
+            if not ids:
+                continue
+            related = 'user_create' if target is Journey else 'user'
+            self.targets[model].update(target.objects.select_related(related).in_bulk(ids))
+            for like in model.objects.filter(user=self.user, **{f'{field}_id__in': ids}):
+                self.likes[model][getattr(like, f'{field}_id')] = like
+
+    def resolve(self, args):
+        resolved = {}
+        for name, value in args.items():
+            if isinstance(value, str) and value.startswith('@'):
+                result = self.results.get(value[1:])
+                if not isinstance(result, dict) or 'id' not in result:
+                    raise OperationError(f'Không tìm thấy kết quả của thao tác {value[1:]}')
+                value = result['id']
+            resolved[name] = value
+        return resolved
+
+    def apply(self, op, args):
+        basename, action = THROTTLED[op]
+        if op in ('comment_journey', 'comment_post') and args.get('parent'):
+            action = 'reply_to_comment'
+        allowed, wait = self.throttle.charge(self.request, basename, action)
+        if not allowed:
+            raise OperationError(f'Thao tác quá nhanh, thử lại sau {int(wait) + 1} giây',
+                                 status.HTTP_429_TOO_MANY_REQUESTS)
+        return getattr(self, op)(args)
+
+    def create_post(self, args):
+        serializer = PostSerializer(data=args, context={'request': self.request})
+        if not serializer.is_valid():
+            raise OperationError(serializer.errors)
+        if serializer.validated_data['journey'].archived:
+            raise OperationError('Hành trình đã được lưu trữ, chỉ có thể xem.')
+        post = serializer.save(user=self.user)
+        routes.update_post_eta(post)
+        routes.update_owner_trail(post.journey_id, post.user_id)
+        trajectories.append_point(post)
+        return PostSerializer(post, context={'request': self.request}).data
+
+    def comment_journey(self, args):
+        journey = _get(Journey.objects.select_related('user_create'), args.get('journey'))
+        if journey.archived:
+            raise OperationError('Hành trình đã được lưu trữ, chỉ có thể xem.')
+        parent = _get(CommentJourney.objects.filter(journey=journey), args['parent']) if args.get('parent') else None
+        if not args.get('content'):
+            raise OperationError('Thiếu nội dung bình luận')
+        comment = CommentJourney.objects.create(user=self.user, journey=journey, content=args['content'],
+                                                parent_comment=parent)
+        if parent is None:  # giống add_comment: trả lời bình luận không tạo thông báo
+            notifications.notify(journey.user_create, notifications.COMMENT_JOURNEY, self.user, journey=journey)
+        return {'id': comment.id}
+
+    def comment_post(self, args):
+        post = _get(Post.objects.select_related('user'), args.get('post'))
+        parent = _get(Comment.objects.filter(post=post), args['parent']) if args.get('parent') else None
+        if not args.get('content'):
+            raise OperationError('Thiếu nội dung bình luận')
+        comment = Comment.objects.create(user=self.user, post=post, content=args['content'], parent_comment=parent)
+        if parent is None:
+            notifications.notify(post.user, notifications.COMMENT_POST, self.user, post=post)
+        return {'id': comment.id}
+
+    def like_journey(self, args):
+        return self._toggle(LikeJourney, Journey.objects.select_related('user_create'), 'journey', args)
+
+    def like_post(self, args):
+        return self._toggle(LikePost, Post.objects.select_related('user'), 'post', args)
+
+    def _toggle(self, model, targets, field, args):
+        pk = args.get(field)
+        target = self.targets[model].get(int(pk) if isinstance(pk, str) and pk.isdigit() else pk)
+        if target is None:  # id do thao tác trước trong lô tạo ra, chưa có trong prefetch
+            target = _get(targets, pk)
+            self.targets[model][target.pk] = target
+            existing = model.objects.filter(user=self.user, **{field: target}).first()
+            if existing is not None:
+                self.likes[model][target.pk] = existing
+        if getattr(target, 'archived', False):
+            raise OperationError('Hành trình đã được lưu trữ, chỉ có thể xem.')
+        like = self.likes[model].get(target.pk)
+        if like is None:
+            like = self.likes[model][target.pk] = model(user=self.user, **{field: target})
+        else:
+            like.active = not like.active
+        like.batch_changed = True
+        return {'id': target.pk, 'liked': like.active}
+
+    def flush_likes(self):
+        for model, verb, field in ((LikeJourney, notifications.LIKE_JOURNEY, 'journey'),
+                                   (LikePost, notifications.LIKE_POST, 'post')):
+            likes = [like for like in self.likes[model].values() if getattr(like, 'batch_changed', False)]
+            created = [like for like in likes if like.pk is None]
+            updated = [like for like in likes if like.pk is not None]
+            for like in updated:
+                like.updated_date = now()  # bulk_update không tự cập nhật auto_now
+            model.objects.bulk_create(created)
+            model.objects.bulk_update(updated, ['active', 'updated_date'])
+            for like in created:
+                if like.active:
+                    target = getattr(like, field)
+                    owner = target.user_create if model is LikeJourney else target.user
+                    notifications.notify(owner, verb, self.user, **{field: target})
+
+
+def apply(request, operations):  # trả về danh sách kết quả theo đúng thứ tự thao tác
+    user = request.user
+    fingerprints = {}
+    for op in operations:  # key lặp lại trong lô: chỉ thao tác đầu tiên được chạy
+        fingerprints.setdefault(op['key'], idempotency.digest([op['op'], op['args']]))
+    with transaction.atomic():
+        existing = idempotency.lookup(user, fingerprints)
+        if any(entry.status_code is None for entry in existing.values()):  # request khác đang chạy key này
+            raise KeyConflict()
+        try:
+            with transaction.atomic():
+                reserved = idempotency.reserve(user, [(k, fp) for k, fp in fingerprints.items() if k not in existing])
+        except IntegrityError:
+            raise KeyConflict()
+
+        runner = Runner(request, operations)
+        runner.results.update({key: idempotency.unpack(entry) for key, entry in existing.items()})
+        done, output = {}, []
+        for op in operations:
+            key = op['key']
+            if key in existing or key in done:
+                entry = existing.get(key)
+                fingerprint = entry.fingerprint if entry is not None else fingerprints[key]
+                if fingerprint != idempotency.digest([op['op'], op['args']]):
+                    output.append({'key': key, 'status': 'error', 'status_code': status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                   'error': 'Key đã được dùng cho thao tác khác'})
+                else:
+                    output.append({'key': key, 'status': 'duplicate', 'result': runner.results[key]})
+                continue
+            try:
+                with transaction.atomic():
+                    result = runner.apply(op['op'], runner.resolve(op['args']))
+            except OperationError as e:
+                output.append({'key': key, 'status': 'error', 'status_code': e.status_code, 'error': e.error})
+                continue
+            done[key] = runner.results[key] = result
+            output.append({'key': key, 'status': 'ok', 'result': result})
+
+        runner.flush_likes()
+        idempotency.finish(reserved, {key: (status.HTTP_200_OK, result) for key, result in done.items()})
+    return output
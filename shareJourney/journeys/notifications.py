@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils.timezone import now
+
+from journeys import sync
+from journeys.models import Notification
+
+LIKE_JOURNEY = 'like_journey'
+COMMENT_JOURNEY = 'comment_journey'
+LIKE_POST = 'like_post'
+COMMENT_POST = 'comment_post'
+APPROVE = 'approve'
+DIGEST = 'digest'
+
+MESSAGES = {
+    LIKE_JOURNEY: 'đã thích hành trình của bạn.',
+    COMMENT_JOURNEY: 'đã bình luận trên hành trình của bạn.',
+    LIKE_POST: 'đã thích bài viết của bạn.',
+    COMMENT_POST: 'đã bình luận trên bài viết của bạn.',
+}
+DIGEST_LABELS = {
+    LIKE_JOURNEY: 'lượt thích hành trình',
+    COMMENT_JOURNEY: 'bình luận hành trình',
+    LIKE_POST: 'lượt thích bài viết',
+    COMMENT_POST: 'bình luận bài viết',
+}
+
+
+def notify(user, verb, actor, journey=None, post=None):
+    # bỏ qua nếu người nhận chưa đọc thông báo y hệt (like/bỏ like liên tục)
+    if Notification.objects.filter(user=user, verb=verb, actor=actor, journey=journey, post=post, read=False).exists():
+        return None
+    return Notification.objects.create(user=user, verb=verb, actor=actor, journey=journey, post=post,
+                                       message=f"{actor.last_name} {MESSAGES[verb]}")
+
+
+def purge_read(days, batch_size=1000):  # xóa thông báo đã đọc cũ hơn N ngày, mỗi lần 1 lô id
+    queryset = Notification.objects.filter(read=True, created_date__lt=now() - timedelta(days=days))
+    total = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        with sync.batched():
+            total += Notification.objects.filter(id__in=ids).delete()[0]
+
+
+def compact(batch_size=500):
+    # gộp các thông báo chưa đọc cùng loại trên cùng hành trình/bài viết thành 1 dòng "Có 13 lượt thích ... mới, gần nhất từ A."
+    # mỗi vòng lấy tối đa batch_size nhóm, lặp tới khi không còn nhóm nào
+    merged = 0
+    while True:
+        groups = list(Notification.objects.filter(read=False, verb__in=list(MESSAGES))
+                      .values('user', 'verb', 'journey', 'post').annotate(rows=Count('id')).filter(rows__gt=1)
+                      .order_by()[:batch_size])
+        if not groups:
+            return merged
+        for group in groups:
+            merged += _merge(group)
+
+
+def _merge(group):
+    with transaction.atomic():
+        rows = Notification.objects.filter(user=group['user'], verb=group['verb'], journey=group['journey'],
+                                           post=group['post'], read=False)
+        locked = list(rows.select_for_update().values_list('id', 'count'))
+        latest = rows.select_related('actor').order_by('-created_date', '-id').first()
+        if latest is None:
+            return 0
+        total = sum(c for _, c in locked)
+        latest.count = total
+        # đếm theo lượt chứ không theo người: dòng của người cũ đã bị xóa nên cùng 1 người có thể quay lại
+        latest.message = f"Có {total} {DIGEST_LABELS[group['verb']]} mới, gần nhất từ {latest.actor.last_name}."
+        latest.save(update_fields=['count', 'message', 'updated_date'])
+        with sync.batched():
+            return rows.exclude(pk=latest.pk).delete()[0]
+
+
+def build_digests(hours=24):  # 1 thông báo tổng hợp cho mỗi user còn thông báo chưa đọc trong khoảng thời gian
+    since = now() - timedelta(hours=hours)
+    already = Notification.objects.filter(verb=DIGEST, created_date__gte=since).values('user')
+    counts = {}
+    for row in Notification.objects.filter(read=False, created_date__gte=since, verb__in=DIGEST_LABELS) \
+            .exclude(user__in=already).values('user', 'verb').annotate(total=Sum('count')).order_by():
+        counts.setdefault(row['user'], []).append((row['verb'], row['total']))
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, verb=DIGEST,
+                     message='Bạn có ' + ', '.join(f'{total} {DIGEST_LABELS[verb]}' for verb, total in items) + ' mới.')
+        for user_id, items in counts.items()
+    ])
+    return len(counts)
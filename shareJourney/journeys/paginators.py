@@ -1,5 +1,61 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor
 
 
 class JourneyPaginator(PageNumberPagination):
     page_size = 10
+
+
+class CommentPaginator(PageNumberPagination):  # bình luận cấp cha
+    page_size = 20
+
+
+class ReplyCursorPaginator(CursorPagination):  # trả lời của 1 bình luận, không lệch trang khi có trả lời mới
+    page_size = 20
+    ordering = ('created_date', 'id')
+
+    def paginate_list(self, items, request):  # danh sách trong bộ nhớ (hành trình đã lưu trữ), cursor chỉ mang offset
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        offset = cursor.offset if cursor is not None else 0
+        size = self.get_page_size(request)
+        page = items[offset:offset + size]
+        return {
+            'next': self.encode_cursor(Cursor(offset=offset + size, reverse=False, position=None))
+            if offset + size < len(items) else None,
+            'previous': self.encode_cursor(Cursor(offset=max(offset - size, 0), reverse=False, position=None))
+            if offset else None,
+            'results': page,
+        }
+
+
+def estimate_row_count(model, using='default'):
+    # lấy số dòng ước lượng từ thống kê của DB thay vì COUNT(*) toàn bảng
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                           "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):  # dùng cho changelist admin của các bảng lớn
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if isinstance(qs, QuerySet) and not qs.query.where:  # chỉ ước lượng khi không có bộ lọc
+            estimate = estimate_row_count(qs.model, qs.db)
+            if estimate is not None and estimate > self.estimate_threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,132 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import resolve
+from rest_framework.test import force_authenticate
+
+# Đo thời gian và số query cho từng field của serializer có ProfiledMixin (kể cả SerializerMethodField, RecursiveField).
+# Bật theo request bằng header X-Profile-Serializers (kết quả trả về header X-Serializer-Profile cho staff/DEBUG)
+# hoặc lấy mẫu SERIALIZER_PROFILING_SAMPLE_RATE request để ghi log.
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_PROFILE_SERIALIZERS'
+RESPONSE_HEADER = 'X-Serializer-Profile'
+TOP_FIELDS = 20
+
+_stats = ContextVar('serializer_profile', default=None)  # key -> [số lần, giây, số query]
+_depth = ContextVar('serializer_depth', default=0)
+_queries = ContextVar('serializer_queries', default=None)  # [tổng số query của request]
+
+
+class _Timed:  # bọc 1 field trong lúc profiling: cộng dồn thời gian get_attribute + to_representation và số query
+    def __init__(self, field, item, queries):
+        self._field, self._item, self._queries = field, item, queries
+
+    def __getattr__(self, name):
+        return getattr(self._field, name)
+
+    def _run(self, method, value):
+        started, queries_before = time.perf_counter(), self._queries[0]
+        try:
+            return method(value)
+        finally:
+            self._item[1] += time.perf_counter() - started  # tính cả thời gian của serializer lồng bên trong
+            self._item[2] += self._queries[0] - queries_before
+
+    def get_attribute(self, instance):
+        self._item[0] += 1
+        return self._run(self._field.get_attribute, instance)
+
+    def to_representation(self, value):
+        return self._run(self._field.to_representation, value)
+
+
+class ProfiledMixin:  # serializer chỉ đo khi middleware bật profiling cho request, bình thường chỉ đọc 1 ContextVar
+    def to_representation(self, instance):
+        if _stats.get() is None:
+            return super().to_representation(instance)
+        token = _depth.set(_depth.get() + 1)
+        try:
+            return super().to_representation(instance)
+        finally:
+            _depth.reset(token)
+
+    @property
+    def _readable_fields(self):
+        fields = super()._readable_fields
+        stats = _stats.get()
+        if stats is None:
+            return fields
+        prefix, queries = f'{_depth.get()}:{type(self).__name__}.', _queries.get()
+        return (_Timed(field, stats.setdefault(prefix + field.field_name, [0, 0.0, 0]), queries) for field in fields)
+
+
+def _count_query(execute, sql, params, many, context):
+    _queries.get()[0] += 1
+    return execute(sql, params, many, context)
+
+
+def summary(stats, limit=None):  # sắp xếp theo thời gian giảm dần
+    rows = sorted(stats.items(), key=lambda kv: kv[1][1], reverse=True)[:limit]
+    return [{'field': key.split(':', 1)[1], 'level': int(key.split(':', 1)[0]), 'calls': calls,
+             'ms': round(seconds * 1000, 2), 'queries': queries}
+            for key, (calls, seconds, queries) in rows]
+
+
+class SerializerProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = HEADER in request.META
+        sampled = random.random() < getattr(settings, 'SERIALIZER_PROFILING_SAMPLE_RATE', 0)
+        if not requested and not sampled:
+            return self.get_response(request)
+
+        stats_token, queries_token = _stats.set({}), _queries.set([0])
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(_count_query))
+                response = self.get_response(request)
+            stats, total_queries = _stats.get(), _queries.get()[0]
+        finally:
+            _stats.reset(stats_token)
+            _queries.reset(queries_token)
+        elapsed = round((time.perf_counter() - started) * 1000, 2)
+
+        user = getattr(request, 'user', None)  # DRF gán lại user đã xác thực vào request gốc
+        if requested and (settings.DEBUG or (user is not None and user.is_staff)):
+            response[RESPONSE_HEADER] = json.dumps({'ms': elapsed, 'queries': total_queries,
+                                                    'fields': summary(stats, TOP_FIELDS)})
+        if sampled:
+            logger.info('serializer profile %s %s: %s ms, %s queries, %s', request.method, request.path, elapsed,
+                        total_queries, json.dumps(summary(stats)))
+        return response
+
+
+def capture(request, path, limit=50):  # chạy 1 request GET tới path dưới cProfile, trả về bảng pstats
+    path, _, query = path.partition('?')
+    match = resolve(path)
+    headers = {k: v for k, v in request.META.items() if k == 'HTTP_AUTHORIZATION'}
+    inner = RequestFactory().get(path, data=None, QUERY_STRING=query, **headers)
+    force_authenticate(inner, user=request.user, token=getattr(request, 'auth', None))  # DRF bỏ qua inner.user
+    profiler = cProfile.Profile()
+    response = profiler.runcall(match.func, inner, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        profiler.runcall(response.render)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+    return response.status_code, out.getvalue()
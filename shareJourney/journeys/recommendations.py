@@ -0,0 +1,220 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg
+from django.utils.timezone import now
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from journeys.geo import haversine
+from journeys.models import User, Journey, Participation, LikeJourney, Follow, Post, Recommendation, \
+    RecommendationBuild
+
+# trọng số của từng loại tương tác trong ma trận user x journey
+PARTICIPATION_WEIGHT = 1.0
+CREATOR_WEIGHT = 1.0
+LIKE_WEIGHT = 0.5
+SOCIAL_WEIGHT = 0.3  # hành trình mà người mình follow tham gia/thích
+PROXIMITY_WEIGHT = 0.2
+PROXIMITY_SCALE_KM = 50.0
+
+
+class Matrices:
+    def __init__(self, user_ids, journey_ids, interactions, follows, active, creators, user_coords,
+                 journey_coords):
+        self.user_ids = user_ids
+        self.journey_ids = journey_ids
+        self.user_index = {uid: i for i, uid in enumerate(user_ids)}
+        self.interactions = interactions  # csr users x journeys
+        self.follows = follows  # csr users x users
+        self.active = active  # bool[journeys]
+        self.creators = creators  # index user tạo của mỗi journey, -1 nếu user không còn active
+        self.user_coords = user_coords  # float[users, 2], NaN nếu chưa có bài đăng có tọa độ
+        self.journey_coords = journey_coords  # float[journeys, 2]
+
+
+def _coords(rows, index, size):
+    coords = np.full((size, 2), np.nan)
+    for key, lat, lng in rows:
+        if key in index:
+            coords[index[key]] = (lat, lng)
+    return coords
+
+
+def build_matrices():
+    user_ids = list(User.objects.active().order_by('id').values_list('id', flat=True))
+    journeys = list(Journey.objects.order_by('id').values_list('id', 'user_create_id', 'active'))
+    user_index = {uid: i for i, uid in enumerate(user_ids)}
+    journey_ids = [j[0] for j in journeys]
+    journey_index = {jid: i for i, jid in enumerate(journey_ids)}
+
+    rows, cols, values = [], [], []
+
+    def add(pairs, weight):
+        for uid, jid in pairs:
+            if uid in user_index and jid in journey_index:
+                rows.append(user_index[uid])
+                cols.append(journey_index[jid])
+                values.append(weight)
+
+    add(Participation.objects.active().values_list('user_id', 'journey_id').iterator(),
+        PARTICIPATION_WEIGHT)
+    add(LikeJourney.objects.active().values_list('user_id', 'journey_id').iterator(), LIKE_WEIGHT)
+    add(((j[1], j[0]) for j in journeys), CREATOR_WEIGHT)
+    interactions = sparse.csr_matrix((values, (rows, cols)), shape=(len(user_ids), len(journey_ids)))
+    interactions.sum_duplicates()
+    interactions.data = np.minimum(interactions.data, 1.0)
+
+    follow_pairs = [(user_index[a], user_index[b]) for a, b in
+                    Follow.objects.active().values_list('follower_id', 'following_id').iterator()
+                    if a in user_index and b in user_index]
+    follows = sparse.csr_matrix((np.ones(len(follow_pairs)), tuple(zip(*follow_pairs)) or ([], [])),
+                                shape=(len(user_ids), len(user_ids)))
+
+    located = Post.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    user_coords = _coords(located.values_list('user_id').annotate(Avg('latitude'), Avg('longitude')),
+                          user_index, len(user_ids))  # vị trí trung bình các bài đăng
+    journey_coords = _coords(located.values_list('journey_id').annotate(Avg('latitude'), Avg('longitude')),
+                             journey_index, len(journey_ids))
+
+    return Matrices(
+        user_ids=user_ids,
+        journey_ids=journey_ids,
+        interactions=interactions,
+        follows=follows,
+        active=np.array([j[2] for j in journeys], dtype=bool),
+        creators=np.array([user_index.get(j[1], -1) for j in journeys], dtype=int),
+        user_coords=user_coords,
+        journey_coords=journey_coords,
+    )
+
+
+def item_similarity(interactions):  # cosine giữa các cột (journey x journey), ma trận thưa
+    norms = np.sqrt(np.asarray(interactions.multiply(interactions).sum(axis=0))).ravel()
+    norms[norms == 0] = 1.0
+    normalized = interactions @ sparse.diags(1.0 / norms)
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    return similarity
+
+
+class Nearby:  # cây KD trên tọa độ (đưa về vector đơn vị 3D) của các hành trình được chấm điểm và có tọa độ
+    def __init__(self, m, allowed):
+        self.cols = np.flatnonzero(allowed & ~np.isnan(m.journey_coords[:, 0]))
+        self.tree = cKDTree(_unit(m.journey_coords[self.cols])) if len(self.cols) else None
+
+    def nearest(self, coords, k):  # index cột của k hành trình gần nhất, [] nếu user chưa có tọa độ
+        if self.tree is None or k <= 0 or np.isnan(coords[0]):
+            return np.empty(0, dtype=int)
+        _, found = self.tree.query(_unit(coords[None, :]), k=min(k, len(self.cols)))
+        return self.cols[np.atleast_1d(found[0])]
+
+
+def _unit(coords):
+    lat, lng = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def score_users(m, rows, similarity, top_n, nearby, allowed=None):
+    # Điểm = CF (item-item) + social + gần vị trí. CF/social giữ dạng thưa; điểm gần chỉ tính cho các cột đã có điểm
+    # thưa cộng k hành trình gần nhất (cây KD), k = top_n + số hành trình bị loại của user -> top_n vẫn đúng như khi
+    # chấm toàn bộ mà không cần ma trận dày batch x journeys. allowed: chỉ chấm các cột này (mặc định: đang hoạt động).
+    allowed = m.active if allowed is None else allowed & m.active
+    rows = np.asarray(rows)
+    user_interactions = m.interactions[rows]
+    follow_rows = m.follows[rows]
+    follow_counts = np.asarray(follow_rows.sum(axis=1)).ravel()
+    follow_counts[follow_counts == 0] = 1.0
+    scores = user_interactions @ similarity + SOCIAL_WEIGHT * (sparse.diags(1.0 / follow_counts) @ follow_rows
+                                                               @ m.interactions)
+    scores = (scores @ sparse.diags(allowed.astype(float))).tocsr()
+
+    results = []
+    for i, row in enumerate(rows):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        seen = user_interactions.indices[user_interactions.indptr[i]:user_interactions.indptr[i + 1]]
+        candidates = dict(zip(scores.indices[start:end], scores.data[start:end]))
+        for col in nearby.nearest(m.user_coords[row], top_n + len(seen)):
+            candidates.setdefault(col, 0.0)
+        cols = np.fromiter(candidates, dtype=int, count=len(candidates))
+        values = np.fromiter(candidates.values(), dtype=float, count=len(candidates))
+        if len(cols):
+            distance = haversine(m.user_coords[row, 0], m.user_coords[row, 1],
+                                 m.journey_coords[cols, 0], m.journey_coords[cols, 1])
+            values = values + PROXIMITY_WEIGHT * np.nan_to_num(np.exp(-distance / PROXIMITY_SCALE_KM))
+        # bỏ các hành trình đã tham gia/thích hoặc do chính user tạo
+        keep = ~np.isin(cols, seen) & (m.creators[cols] != row) & (values > 0)
+        cols, values = cols[keep], values[keep]
+        order = np.argsort(-values, kind='stable')[:top_n]
+        results.append([(m.journey_ids[cols[j]], float(values[j])) for j in order])
+    return results
+
+
+def users_to_refresh(since):  # user có tương tác mới sau lần chạy trước hoặc chưa có gợi ý
+    changed = set(Participation.objects.filter(updated_date__gt=since).values_list('user_id', flat=True))
+    changed |= set(LikeJourney.objects.filter(updated_date__gt=since).values_list('user_id', flat=True))
+    changed |= set(Follow.objects.filter(updated_date__gt=since).values_list('follower_id', flat=True))
+    changed |= set(User.objects.active().filter(recommendations__isnull=True).values_list('id', flat=True))
+    return changed
+
+
+def new_journeys(since):  # hành trình tạo sau lần chạy trước: user không có tương tác mới cũng cần được chấm thêm
+    return set(Journey.objects.active().filter(created_date__gt=since).values_list('id', flat=True))
+
+
+def _save(batch_user_ids, results):
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=batch_user_ids).delete()
+        Recommendation.objects.bulk_create([
+            Recommendation(user_id=uid, journey_id=jid, score=score)
+            for uid, recs in zip(batch_user_ids, results) for jid, score in recs
+        ], batch_size=1000)
+
+
+def _merge(batch_user_ids, results, top_n):  # gộp điểm hành trình mới vào gợi ý đang có, giữ top_n
+    current = {uid: {} for uid in batch_user_ids}
+    for uid, jid, score in Recommendation.objects.filter(user_id__in=batch_user_ids) \
+            .values_list('user_id', 'journey_id', 'score'):
+        current[uid][jid] = score
+    changed_ids, merged = [], []
+    for uid, recs in zip(batch_user_ids, results):
+        if recs:
+            current[uid].update(recs)
+            changed_ids.append(uid)
+            merged.append(sorted(current[uid].items(), key=lambda r: -r[1])[:top_n])
+    if changed_ids:
+        _save(changed_ids, merged)
+
+
+def build_recommendations(user_ids=None, top_n=20, batch_size=200, new_journey_ids=()):
+    # user_ids=None -> tính lại tất cả user. new_journey_ids: chấm thêm các hành trình này cho những user còn lại
+    started = now()  # mốc cho lần chạy sau: thay đổi trong lúc đang tính sẽ được tính lại lần sau
+    m = build_matrices()
+    similarity = item_similarity(m.interactions)
+    refresh = [uid for uid in (m.user_ids if user_ids is None else user_ids) if uid in m.user_index]
+    rows = [m.user_index[uid] for uid in refresh]
+    nearby = Nearby(m, m.active)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        _save([m.user_ids[r] for r in batch], score_users(m, batch, similarity, top_n, nearby))
+
+    new_journey_ids = set(new_journey_ids)
+    if user_ids is not None and new_journey_ids:
+        allowed = np.array([jid in new_journey_ids for jid in m.journey_ids], dtype=bool)
+        nearby = Nearby(m, allowed & m.active)
+        refreshed = set(refresh)
+        others = [r for r, uid in enumerate(m.user_ids) if uid not in refreshed]
+        for start in range(0, len(others), batch_size):
+            batch = others[start:start + batch_size]
+            _merge([m.user_ids[r] for r in batch], score_users(m, batch, similarity, top_n, nearby, allowed), top_n)
+
+    RecommendationBuild.objects.create(started_at=started, users=len(rows), full=user_ids is None)
+    return len(rows)
+
+
+def last_build_time():  # mốc lưu rõ ràng, không suy ra từ Recommendation (user bị xóa gợi ý, chạy song song...)
+    return RecommendationBuild.objects.order_by('-started_at').values_list('started_at', flat=True).first()
+
+
+def recommended_journeys(user):
+    return Journey.objects.active().filter(recommendations__user=user).order_by('-recommendations__score')
@@ -0,0 +1,74 @@
+import cbor2
+import msgpack
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+# Định dạng nhị phân gọn hơn JSON, client chọn qua header Accept (application/msgpack, application/cbor).
+# ?dedupe=users: gom các object user lặp lại (user, user_create, actor) vào bảng 'users' riêng, trong payload chỉ
+# còn id. Dùng được với mọi renderer.
+
+USER_KEYS = ('user', 'user_create', 'actor')
+
+_encoder = JSONEncoder()  # chuyển datetime, Decimal, UUID... giống renderer JSON
+
+
+def _replace_users(value, table):
+    if isinstance(value, list):
+        return [_replace_users(v, table) for v in value]
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in USER_KEYS and isinstance(item, dict) and 'id' in item:
+                table.setdefault(item['id'], item)
+                result[key] = item['id']
+            else:
+                result[key] = _replace_users(item, table)
+        return result
+    return value
+
+
+def dedupe_users(data):
+    table = {}
+    data = _replace_users(data, table)
+    if isinstance(data, dict):
+        data['users'] = list(table.values())
+        return data
+    return {'results': data, 'users': list(table.values())}
+
+
+class DedupeUsersMixin:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        request = (renderer_context or {}).get('request')
+        if data is not None and request is not None and request.query_params.get('dedupe') == 'users':
+            data = dedupe_users(data)
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class JSONRenderer(DedupeUsersMixin, renderers.JSONRenderer):
+    pass
+
+
+class BinaryRenderer(renderers.BaseRenderer):
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.dumps(data)
+
+
+class MessagePackRenderer(DedupeUsersMixin, BinaryRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    def dumps(self, data):
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+class CBORRenderer(DedupeUsersMixin, BinaryRenderer):
+    media_type = 'application/cbor'
+    format = 'cbor'
+
+    def dumps(self, data):
+        return cbor2.dumps(data, default=lambda encoder, value: encoder.encode(_encoder.default(value)))
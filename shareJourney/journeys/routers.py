@@ -0,0 +1,62 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# trạng thái của request hiện tại: True -> đọc từ primary (ngoài request, ví dụ shell/command, luôn dùng primary)
+_use_primary = ContextVar('use_primary', default=True)
+_wrote = ContextVar('wrote', default=False)
+
+_replica_health = {}  # alias -> (healthy, checked_at)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def start_request(use_primary):
+    return _use_primary.set(use_primary), _wrote.set(False)
+
+
+def end_request(tokens):
+    wrote = _wrote.get()
+    _use_primary.reset(tokens[0])
+    _wrote.reset(tokens[1])
+    return wrote
+
+
+def replica_is_healthy(alias):
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 30)
+    healthy, checked_at = _replica_health.get(alias, (True, None))
+    if checked_at is not None and time.monotonic() - checked_at < interval:
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        healthy = True
+    except DatabaseError:
+        healthy = False
+    _replica_health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+class ReplicaRouter:  # đọc từ replica, ghi vào primary
+    def db_for_read(self, model, **hints):
+        if _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in get_replicas() if replica_is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # sau khi ghi thì phần còn lại của request cũng đọc từ primary
+        _use_primary.set(True)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import F
+from django.utils.timezone import now
+
+from journeys.geo import haversine
+from journeys.models import Journey, Post
+
+DEFAULT_SPEED_KMH = 40.0  # dùng khi thành viên chưa có đủ check-in để tính vận tốc
+MIN_SPEED_KMH = 1.0
+SPEED_SAMPLE_POSTS = 10  # số check-in gần nhất dùng để tính vận tốc
+
+
+def trail_distance_km(latitudes, longitudes):  # tổng quãng đường qua các điểm check-in theo thứ tự
+    if len(latitudes) < 2:
+        return 0.0
+    lat = np.asarray(latitudes, dtype=float)
+    lng = np.asarray(longitudes, dtype=float)
+    return float(haversine(lat[:-1], lng[:-1], lat[1:], lng[1:]).sum())
+
+
+def speed_kmh(posts):  # posts: [(latitude, longitude, created_date)] theo thời gian tăng dần
+    if len(posts) < 2:
+        return None
+    hours = (posts[-1][2] - posts[0][2]).total_seconds() / 3600
+    if hours <= 0:
+        return None
+    speed = trail_distance_km([p[0] for p in posts], [p[1] for p in posts]) / hours
+    return max(speed, MIN_SPEED_KMH)
+
+
+def auto_estimated_time(distance_km):  # estimated_time tự điền khi người tạo không nhập
+    return None if distance_km is None else timedelta(hours=distance_km / DEFAULT_SPEED_KMH)
+
+
+def compute_routes(journeys, batch_size=1000):
+    # tính distance_km theo lô: từ điểm đầu qua các check-in của người tạo (theo thời gian) tới điểm cuối,
+    # chưa có check-in thì là great-circle từ điểm đầu đến điểm cuối.
+    # estimated_time điền khi chưa nhập và tính lại khi vẫn là giá trị tự điền từ distance_km cũ
+    journeys = journeys.filter(start_latitude__isnull=False, start_longitude__isnull=False,
+                               end_latitude__isnull=False, end_longitude__isnull=False)
+    updated = 0
+    batch = []
+    for journey in journeys.only('id', 'user_create_id', 'start_latitude', 'start_longitude', 'end_latitude',
+                                 'end_longitude', 'distance_km', 'estimated_time').iterator(chunk_size=batch_size):
+        batch.append(journey)
+        if len(batch) >= batch_size:
+            updated += _update_batch(batch)
+            batch = []
+    if batch:
+        updated += _update_batch(batch)
+    return updated
+
+
+def _owner_trails(journeys):  # {journey_id: [(lat, lng)]} check-in của người tạo, 1 query cho cả lô
+    trails = {}
+    for journey_id, lat, lng in Post.objects.filter(journey__in=[j.id for j in journeys],
+                                                     user=F('journey__user_create'), latitude__isnull=False,
+                                                     longitude__isnull=False) \
+            .order_by('journey_id', 'created_date', 'id').values_list('journey_id', 'latitude', 'longitude'):
+        trails.setdefault(journey_id, []).append((lat, lng))
+    return trails
+
+
+def _update_batch(journeys):
+    coords = np.array([(j.start_latitude, j.start_longitude, j.end_latitude, j.end_longitude) for j in journeys])
+    distances = haversine(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3])
+    trails = _owner_trails(journeys)
+    updated_date = now()
+    for journey, distance in zip(journeys, distances):
+        trail = trails.get(journey.id)
+        if trail:
+            distance = trail_distance_km([journey.start_latitude] + [p[0] for p in trail] + [journey.end_latitude],
+                                         [journey.start_longitude] + [p[1] for p in trail] + [journey.end_longitude])
+        auto = journey.estimated_time is None or journey.estimated_time == auto_estimated_time(journey.distance_km)
+        journey.distance_km = round(float(distance), 2)
+        if auto:
+            journey.estimated_time = auto_estimated_time(journey.distance_km)
+        journey.updated_date = updated_date  # bulk_update không tự cập nhật auto_now
+    Journey.objects.bulk_update(journeys, ['distance_km', 'estimated_time', 'updated_date'])
+    return len(journeys)
+
+
+def update_journey_route(journey):
+    if None in (journey.start_latitude, journey.start_longitude, journey.end_latitude, journey.end_longitude):
+        return
+    compute_routes(Journey.objects.filter(pk=journey.pk))
+    journey.refresh_from_db(fields=['distance_km', 'estimated_time', 'updated_date'])
+
+
+def update_owner_trail(journey_id, user_id):  # check-in của người tạo thêm/sửa/xóa -> lộ trình đổi theo
+    compute_routes(Journey.objects.filter(pk=journey_id, user_create_id=user_id))
+
+
+def estimate_arrival(post):  # thời điểm dự kiến đến điểm cuối, tính từ vận tốc check-in gần đây của thành viên
+    journey = post.journey
+    if None in (post.latitude, post.longitude, journey.end_latitude, journey.end_longitude):
+        return None
+    recent = list(Post.objects.filter(journey=journey, user=post.user, latitude__isnull=False,
+                                      longitude__isnull=False, created_date__lte=post.created_date)
+                  .order_by('-created_date').values_list('latitude', 'longitude', 'created_date')
+                  [:SPEED_SAMPLE_POSTS])[::-1]
+    speed = speed_kmh(recent) or DEFAULT_SPEED_KMH
+    remaining = float(haversine(post.latitude, post.longitude, journey.end_latitude, journey.end_longitude))
+    return post.created_date + timedelta(hours=remaining / speed)
+
+
+def update_post_eta(post):  # lưu ETA vào post nếu client không gửi lên
+    if post.estimated_time_of_arrival:
+        return
+    eta = estimate_arrival(post)
+    if eta is not None:
+        post.estimated_time_of_arrival = eta.isoformat()
+        post.save(update_fields=['estimated_time_of_arrival', 'updated_date'])
@@ -2,21 +2,27 @@ from django.db.models import Avg
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from . import media
+from .fieldsets import SparseFieldsMixin
+from .profiling import ProfiledMixin
 from .models import User, Journey, Image, Post, Comment, Notification, CommentJourney, Participation, Report, Follow
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledMixin, SparseFieldsMixin, serializers.ModelSerializer):
     followed = serializers.SerializerMethodField()
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['avatar'] = instance.avatar.url
+        if 'avatar' in rep:  # có thể bị bỏ qua bởi ?fields=
+            rep['avatar'] = media.field_url(instance, 'avatar')
         return rep
 
     def get_followed(self, obj):
+        if hasattr(obj, 'followed_by_me'):  # đã annotate sẵn (batch)
+            return obj.followed_by_me
         if self.context.get('request') and self.context['request'].user.id:
-            return Follow.objects.filter(follower=self.context['request'].user, following=obj,
-                                         is_active=True).first() is not None
+            return Follow.objects.active().filter(follower=self.context['request'].user,
+                                                  following=obj).first() is not None
         return False
 
     class Meta:
@@ -59,12 +65,18 @@ class UserDetailSerializer(UserSerializer):
     journey_count = serializers.SerializerMethodField()
 
     def get_follower_count(self, obj):
-        return Follow.objects.filter(following=obj, is_active=True).count()
+        if hasattr(obj, 'follower_total'):
+            return obj.follower_total
+        return Follow.objects.active().filter(following=obj).count()
 
     def get_following_count(self, obj):
-        return Follow.objects.filter(follower=obj, is_active=True).count()
+        if hasattr(obj, 'following_total'):
+            return obj.following_total
+        return Follow.objects.active().filter(follower=obj).count()
 
     def get_journey_count(self, obj):
+        if hasattr(obj, 'journey_total'):
+            return obj.journey_total
         return Journey.objects.filter(user_create=obj).count()
 
     class Meta:
@@ -72,7 +84,7 @@ class UserDetailSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ['rate', 'follower_count', 'following_count', 'journey_count']
 
 
-class JourneySerializer(serializers.ModelSerializer):
+class JourneySerializer(ProfiledMixin, SparseFieldsMixin, serializers.ModelSerializer):
     user_create = UserSerializer(read_only=True)
 
     class Meta:
@@ -89,25 +101,41 @@ class JourneyDetailSerializers(JourneySerializer):
     def get_liked(self, journey):
         request = self.context.get('request')
         if request.user.is_authenticated:
-            return journey.likejourney_set.filter(active=True).exists()
+            if journey.archived:  # dữ liệu đã chuyển sang bảng lưu trữ
+                return request.user.id in journey.archive.snapshot()['likes']
+            if hasattr(journey, 'liked_by_me'):  # đã annotate sẵn (batch)
+                return journey.liked_by_me
+            return journey.likejourney_set.active().filter(user=request.user).exists()
 
     def get_likes_count(self, journey):
-        return journey.likejourney_set.filter(active=True).count()  # lấy những like của hành trình đó active=true
+        if journey.archived:
+            return journey.archive.likes_count
+        if hasattr(journey, 'likes_total'):
+            return journey.likes_total
+        return journey.likejourney_set.active().count()  # lấy những like của hành trình đó active=true
 
     def get_comments_count(self, journey):
+        if journey.archived:
+            return journey.archive.comments_count
+        if hasattr(journey, 'comments_total'):
+            return journey.comments_total
         return CommentJourney.objects.filter(journey=journey).count()
 
     def get_average_rating(self, obj):
-        average = obj.participation_set.filter(is_approved=True).aggregate(Avg('rating'))['rating__avg']
+        if hasattr(obj, 'rating_avg'):
+            return round(obj.rating_avg, 1) if obj.rating_avg else 0
+        average = obj.participation_set.active().aggregate(Avg('rating'))['rating__avg']
         return round(average, 1) if average else 0
 
     class Meta:
         model = JourneySerializer.Meta.model
         fields = JourneySerializer.Meta.fields + ['distance', 'estimated_time', 'liked', 'likes_count', 'active',
-                                                  'lock_cmt', 'comments_count', 'average_rating']
+                                                  'lock_cmt', 'comments_count', 'average_rating', 'start_latitude',
+                                                  'start_longitude', 'end_latitude', 'end_longitude', 'distance_km']
+        read_only_fields = ['distance_km']
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(ProfiledMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField()
 
     class Meta:
@@ -115,18 +143,19 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['user', 'rating']
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(ProfiledMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Image
         fields = ['id', 'image']
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['image'] = instance.image.url
+        if 'image' in rep:
+            rep['image'] = media.field_url(instance, 'image')
         return rep
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(ProfiledMixin, SparseFieldsMixin, serializers.ModelSerializer):
     images = ImageSerializer(many=True, required=False)
     user = UserSerializer(read_only=True)
     journey = JourneySerializer
@@ -153,10 +182,10 @@ class PostDetailSerializer(PostSerializer):
     def get_liked(self, post):
         request = self.context.get('request')
         if request.user.is_authenticated:
-            return post.likepost_set.filter(user=request.user).exists()
+            return post.likepost_set.active().filter(user=request.user).exists()
 
-    def get_likes_count(self, journey):
-        return journey.likepost_set.count()
+    def get_likes_count(self, post):  # không tính like đã bỏ (active=False)
+        return post.likepost_set.active().count()
 
     def get_comments_count(self, post):
         return Comment.objects.filter(post=post).count()
@@ -172,13 +201,13 @@ class RecursiveField(serializers.Serializer):  # lồng các cmt con vào 1 cmt
         return serializer.data
 
 
-class CommentSerializers(serializers.ModelSerializer):  # update ko dùng detail, nó yêu cầu user
+class CommentSerializers(ProfiledMixin, serializers.ModelSerializer):  # update ko dùng detail, nó yêu cầu user
     class Meta:
         model = Comment
         fields = ['id', 'content']
 
 
-class CommentDetailSerializers(serializers.ModelSerializer):
+class CommentDetailSerializers(ProfiledMixin, SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()
     replies = RecursiveField(many=True)
 
@@ -187,27 +216,66 @@ class CommentDetailSerializers(serializers.ModelSerializer):
         fields = CommentSerializers.Meta.fields + ['user', 'created_date', 'replies']
 
 
-class CommentJourneySerializers(serializers.ModelSerializer):
+class CommentReplySerializer(CommentDetailSerializers):  # trả lời con không lồng sẵn, tải thêm qua /replies/
+    replies = None
+    reply_count = serializers.SerializerMethodField()
+
+    def get_reply_count(self, comment):
+        if hasattr(comment, 'reply_total'):  # đã annotate sẵn (batch.comments)
+            return comment.reply_total
+        return comment.replies.count()
+
+    class Meta(CommentDetailSerializers.Meta):
+        fields = CommentSerializers.Meta.fields + ['user', 'created_date', 'reply_count']
+
+
+class CommentThreadSerializer(CommentReplySerializer):  # bình luận cấp cha kèm vài trả lời đầu tiên
+    replies = CommentReplySerializer(source='first_replies', many=True, read_only=True)
+
+    class Meta(CommentReplySerializer.Meta):
+        fields = CommentReplySerializer.Meta.fields + ['replies']
+
+
+class CommentJourneySerializers(ProfiledMixin, serializers.ModelSerializer):
     class Meta:
         model = CommentJourney
         fields = ['id', 'content']
 
 
-class CommentJourneyDetailSerializers(serializers.ModelSerializer):
+class CommentJourneyDetailSerializers(ProfiledMixin, SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()
     replies = RecursiveField(many=True)
     is_member = serializers.SerializerMethodField()
 
     def get_is_member(self, comment):
+        if hasattr(comment, 'member_of_journey'):
+            return comment.member_of_journey
         journey = comment.journey
-        return Participation.objects.filter(journey=journey, user=comment.user, is_approved=True).exists()
+        return Participation.objects.active().filter(journey=journey, user=comment.user).exists()
 
     class Meta:
         model = CommentJourneySerializers.Meta.model
         fields = CommentJourneySerializers.Meta.fields + ['user', 'created_date', 'is_member', 'replies']
 
 
-class ReportSerializer(serializers.ModelSerializer):
+class CommentJourneyReplySerializer(CommentJourneyDetailSerializers):
+    replies = None
+    reply_count = serializers.SerializerMethodField()
+
+    get_reply_count = CommentReplySerializer.get_reply_count
+
+    class Meta(CommentJourneyDetailSerializers.Meta):
+        fields = CommentJourneySerializers.Meta.fields + ['user', 'created_date', 'is_member', 'reply_count']
+
+
+class CommentJourneyThreadSerializer(CommentJourneyReplySerializer):
+    replies = CommentJourneyReplySerializer(source='first_replies', many=True, read_only=True)
+
+    class Meta(CommentJourneyReplySerializer.Meta):
+        fields = CommentJourneyReplySerializer.Meta.fields + ['replies']
+
+
+class ReportSerializer(ProfiledMixin, serializers.ModelSerializer):
     class Meta:
         model = Report
         fields = ['reported_user', 'reported_by', 'reason', 'created_date']
@@ -0,0 +1,233 @@
+import base64
+import binascii
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, pre_save, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+from rest_framework.exceptions import ValidationError
+
+from journeys import media
+from journeys.exports import JOURNEY_FIELDS, POST_FIELDS, COMMENT_FIELDS, PARTICIPATION_FIELDS
+from journeys.models import Journey, Post, Image, Comment, CommentJourney, Participation, Notification, Tombstone
+
+# Đồng bộ delta cho client offline: /sync/?since=<token> trả các dòng đã đổi (theo updated_date, id) và các dòng đã
+# xóa (Tombstone) kể từ token trước, mỗi trang tối đa SYNC_PAGE_SIZE dòng. Token là con trỏ keyset của từng bảng.
+# Chỉ gồm hành trình user tạo/tham gia (và post, comment, thành viên của chúng) cùng thông báo của user.
+
+NOTIFICATION_FIELDS = ['id', 'post_id', 'journey_id', 'actor_id', 'message', 'read', 'verb', 'count', 'created_date',
+                       'updated_date']
+TABLES = [  # (tên trong payload, model, các field trả về)
+    ('journeys', Journey, JOURNEY_FIELDS + ['archived']),
+    ('participations', Participation, PARTICIPATION_FIELDS + ['journey_id']),
+    ('posts', Post, POST_FIELDS + ['journey_id']),
+    ('journey_comments', CommentJourney, COMMENT_FIELDS + ['journey_id']),
+    ('comments', Comment, COMMENT_FIELDS + ['post_id']),
+    ('notifications', Notification, NOTIFICATION_FIELDS),
+]
+TRACKED = {model: name for name, model, _ in TABLES}
+NAMES = set(TRACKED.values())
+
+
+RESYNC = 'resync'  # tombstone báo client tải lại toàn bộ 1 hành trình (vừa được duyệt vào): /sync/?journey=<id>
+
+# Tombstone gắn với hành trình (journey_id) chỉ gửi cho thành viên hành trình đó; tombstone có user chỉ gửi cho user
+# đó (thông báo, mất/được quyền thành viên). Xóa hàng loạt thì gom trong batched() và ghi bằng 1 bulk_create.
+_buffer = ContextVar('sync_tombstones', default=None)
+
+
+@contextmanager
+def batched():
+    if _buffer.get() is not None:  # lồng nhau -> dùng chung bộ đệm ngoài cùng
+        yield
+        return
+    token = _buffer.set({'rows': [], 'posts': {}})
+    try:
+        yield
+        Tombstone.objects.bulk_create(_buffer.get()['rows'], batch_size=1000)
+    finally:
+        _buffer.reset(token)
+
+
+def _record(model, object_id, user_id=None, journey_id=None):
+    tombstone = Tombstone(model=model, object_id=object_id, user_id=user_id, journey_id=journey_id)
+    state = _buffer.get()
+    if state is None:
+        tombstone.save()
+    else:
+        state['rows'].append(tombstone)
+
+
+def _post_journey(post_id):  # comment bị xóa cùng post vẫn tìm được hành trình: Collector xóa comment trước post
+    state = _buffer.get()
+    posts = state['posts'] if state is not None else {}
+    if post_id not in posts:
+        posts[post_id] = Post.objects.filter(pk=post_id).values_list('journey_id', flat=True).first()
+    return posts[post_id]
+
+
+@receiver(post_delete, sender=Journey, dispatch_uid='sync_tombstone_journey')
+def journey_deleted(sender, instance, **kwargs):  # thành viên nhận tombstone qua participation bị xóa theo
+    _record(TRACKED[Journey], instance.pk, user_id=instance.user_create_id)
+
+
+@receiver(post_delete, sender=Participation, dispatch_uid='sync_tombstone_participation')
+def participation_deleted(sender, instance, **kwargs):
+    _record(TRACKED[Participation], instance.pk, journey_id=instance.journey_id)
+    if instance.is_approved:
+        _record(TRACKED[Journey], instance.journey_id, user_id=instance.user_id)
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='sync_tombstone_post')
+@receiver(post_delete, sender=CommentJourney, dispatch_uid='sync_tombstone_comment_journey')
+def journey_row_deleted(sender, instance, **kwargs):
+    _record(TRACKED[sender], instance.pk, journey_id=instance.journey_id)
+
+
+@receiver(post_delete, sender=Comment, dispatch_uid='sync_tombstone_comment')
+def comment_deleted(sender, instance, **kwargs):
+    _record(TRACKED[Comment], instance.pk, journey_id=_post_journey(instance.post_id))
+
+
+@receiver(post_delete, sender=Notification, dispatch_uid='sync_tombstone_notification')
+def notification_deleted(sender, instance, **kwargs):
+    _record(TRACKED[Notification], instance.pk, user_id=instance.user_id)
+
+
+@receiver(pre_save, sender=Participation, dispatch_uid='sync_membership_before')
+def membership_before(sender, instance, **kwargs):
+    instance._was_approved = bool(instance.pk) and Participation.objects.active().filter(pk=instance.pk).exists()
+
+
+@receiver(post_save, sender=Participation, dispatch_uid='sync_membership_after')
+def membership_changed(sender, instance, **kwargs):
+    was = getattr(instance, '_was_approved', False)
+    if instance.is_approved and not was:  # dữ liệu cũ của hành trình nằm trước con trỏ của client -> tải lại
+        _record(RESYNC, instance.journey_id, user_id=instance.user_id)
+    elif was and not instance.is_approved:  # mất quyền thành viên -> client bỏ hành trình và dữ liệu của nó
+        _record(TRACKED[Journey], instance.journey_id, user_id=instance.user_id)
+
+
+def encode_token(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _valid_cursor(cursor):
+    return isinstance(cursor, list) and len(cursor) == 2 and isinstance(cursor[0], str) \
+        and isinstance(cursor[1], int) and not isinstance(cursor[1], bool) and parse_datetime(cursor[0]) is not None
+
+
+def decode_token(token):
+    if not token:
+        return {'cursors': {}, 'tombstone': 0, 'issued': None}
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        cursors, issued = state['cursors'], state['issued']
+        if not isinstance(cursors, dict) or not all(name in NAMES and _valid_cursor(c) for name, c in cursors.items()):
+            raise ValueError(cursors)
+        if issued is not None and (not isinstance(issued, str) or parse_datetime(issued) is None):
+            raise ValueError(issued)
+        return {'cursors': cursors, 'tombstone': int(state['tombstone']), 'issued': issued}
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValidationError({'since': 'Token không hợp lệ'})
+
+
+def token_expired(state):  # tombstone cũ đã bị xóa -> client phải đồng bộ lại từ đầu
+    issued = parse_datetime(state['issued']) if state['issued'] else None
+    return issued is not None and issued < now() - timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30))
+
+
+def _journey_ids(user, journey_id=None):
+    member_of = Participation.objects.active().filter(user=user).values('journey_id')
+    journeys = Journey.objects.filter(Q(user_create=user) | Q(id__in=member_of))
+    if journey_id is not None:
+        journeys = journeys.filter(id=journey_id)
+    return journeys.values('id')
+
+
+def _scope(model, journey_ids, user):
+    if model is Journey:
+        return Journey.objects.filter(id__in=journey_ids)
+    if model is Comment:
+        return Comment.objects.filter(post__journey__in=journey_ids)
+    if model is Notification:
+        return Notification.objects.filter(user=user)
+    return model.objects.filter(journey__in=journey_ids)
+
+
+def _after(queryset, cursor):  # keyset (updated_date, id) > cursor
+    if not cursor:
+        return queryset
+    updated, pk = parse_datetime(cursor[0]), cursor[1]
+    return queryset.filter(Q(updated_date__gt=updated) | Q(updated_date=updated, id__gt=pk))
+
+
+def _with_images(rows):
+    images = {}
+    for image in Image.objects.filter(post_id__in=[r['id'] for r in rows]).values('id', 'post_id', 'image'):
+        images.setdefault(image['post_id'], []).append(
+            {'id': image['id'], 'image': media.url(image['image'])})
+    for row in rows:
+        row['images'] = images.get(row['id'], [])
+
+
+def changes(user, token, journey_id=None):
+    # journey_id: tải lại riêng 1 hành trình sau tombstone RESYNC, bắt đầu với token rỗng rồi phân trang như thường
+    state = decode_token(token)
+    if token and token_expired(state):
+        return None
+    if not token:  # đồng bộ lần đầu nhận toàn bộ dữ liệu hiện có -> không cần các tombstone cũ
+        last = Tombstone.objects.order_by('-id').values_list('id', flat=True).first()
+        state['tombstone'] = last or 0
+    journey_ids = _journey_ids(user, journey_id)
+    page_size = getattr(settings, 'SYNC_PAGE_SIZE', 500)
+    # bỏ qua các dòng vừa ghi trong vài giây gần đây: transaction chưa commit có thể mang updated_date nhỏ hơn
+    upper = now() - timedelta(seconds=getattr(settings, 'SYNC_LAG_SECONDS', 2))
+    remaining = page_size
+    has_more = False
+    data = {}
+    for name, model, fields in TABLES:
+        if journey_id is not None and model is Notification:
+            continue
+        if remaining <= 0:
+            has_more = True
+            break
+        rows = list(_after(_scope(model, journey_ids, user), state['cursors'].get(name))
+                    .filter(updated_date__lt=upper).order_by('updated_date', 'id').values(*fields)[:remaining])
+        if rows:
+            state['cursors'][name] = [rows[-1]['updated_date'].isoformat(), rows[-1]['id']]
+            if model is Post:
+                _with_images(rows)
+        data[name] = rows
+        remaining -= len(rows)
+        has_more = has_more or remaining <= 0
+
+    deleted = []
+    resync = []
+    if journey_id is None and remaining > 0:  # tải lại 1 hành trình: tombstone vẫn đi theo luồng đồng bộ chính
+        # user và journey_id cùng rỗng: tombstone ghi trước khi có journey_id, vẫn gửi cho mọi người
+        tombstones = list(Tombstone.objects.filter(Q(user=user) | Q(journey_id__in=journey_ids) |
+                                                   Q(user__isnull=True, journey_id__isnull=True),
+                                                   id__gt=state['tombstone'], deleted_at__lt=upper)
+                          .order_by('id')[:remaining])
+        if tombstones:
+            state['tombstone'] = tombstones[-1].id
+        deleted = [{'model': t.model, 'id': t.object_id} for t in tombstones if t.model != RESYNC]
+        resync = [t.object_id for t in tombstones if t.model == RESYNC]
+        has_more = has_more or len(tombstones) == remaining
+    elif journey_id is None:
+        has_more = True
+
+    state['issued'] = upper.isoformat()
+    return {'changes': data, 'deleted': deleted, 'resync': resync, 'next': encode_token(state),
+            'has_more': has_more}
+
+
+def purge_tombstones(days):
+    return Tombstone.objects.filter(deleted_at__lt=now() - timedelta(days=days)).delete()[0]
@@ -1,3 +1,937 @@
-from django.test import TestCase
+# Chạy: python manage.py test journeys --settings=shareJourney.test_settings
+import base64
+import gzip
+import importlib
+import json
+import os
+import threading
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
 
-# Create your tests here.
+import cbor2
+import msgpack
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.core.exceptions import ValidationError as ModelValidationError
+from django.db import connection, IntegrityError
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.deletion import Collector
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from scipy import sparse
+
+from journeys import routers, sync, throttling, authentication, recommendations, threads, \
+    archive, idempotency, notifications, routes, trajectories, exports, db_pool, media
+from journeys.authentication import CachedOAuth2Authentication
+from journeys.geo import haversine
+from journeys.middleware import ReplicaRoutingMiddleware
+from journeys.paginators import EstimatedCountPaginator
+from journeys.models import User, Journey, Participation, Post, Comment, LikeJourney, Notification, Tombstone, \
+    IdempotencyKey, Recommendation, Trajectory, Report, ReportedUser, CommentJourney
+
+
+def make_user(username, **kwargs):
+    return User.objects.create_user(username=username, email=f'{username}@test.vn', password='x', **kwargs)
+
+
+class ReplicaRouterTests(TransactionTestCase):  # user-028; TestCase bọc trong atomic -> router luôn chọn primary
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        routers._replica_health.clear()
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request):  # alias được chọn cho lần đọc đầu tiên và lần đọc sau khi ghi trong request
+        seen = {}
+
+        def view(req):
+            seen['read'] = self.router.db_for_read(User)
+            if req.method == 'POST':
+                seen['write'] = make_user('writer')._state.db
+                seen['after_write'] = self.router.db_for_read(User)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        return seen
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.route(self.factory.get('/journey/'))['read'], 'replica')
+
+    def test_writes_go_to_primary(self):
+        seen = self.route(self.factory.post('/journey/'))
+        self.assertEqual(seen['write'], 'default')
+        self.assertEqual(seen['after_write'], 'default')
+
+    def test_sticky_after_write(self):
+        self.route(self.factory.post('/journey/', REMOTE_ADDR='10.0.0.1'))
+        self.assertEqual(self.route(self.factory.get('/journey/', REMOTE_ADDR='10.0.0.1'))['read'], 'default')
+        self.assertEqual(self.route(self.factory.get('/journey/', REMOTE_ADDR='10.0.0.2'))['read'], 'replica')
+
+    def test_outside_request_uses_primary(self):
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+
+def make_journey(user, **kwargs):
+    kwargs.setdefault('name_journey', 'Đà Lạt')
+    return Journey.objects.create(user_create=user, start_location='A', end_location='B', **kwargs)
+
+
+def token(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+@override_settings(SYNC_LAG_SECONDS=-5)
+class SyncTests(TestCase):  # user-044
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.member = make_user('member')
+        self.outsider = make_user('outsider')
+        self.journey = make_journey(self.owner)
+        Participation.objects.create(user=self.member, journey=self.journey, is_approved=True)
+        self.post = Post.objects.create(user=self.owner, journey=self.journey, content='x')
+
+    def test_bad_token_shape_is_400(self):
+        for state in [{'cursors': {'posts': 'x'}, 'tombstone': 0, 'issued': None},
+                      {'cursors': {'posts': ['hôm qua', 1]}, 'tombstone': 0, 'issued': None},
+                      {'cursors': [], 'tombstone': 0, 'issued': None},
+                      {'cursors': {}, 'tombstone': 0, 'issued': 'abc'}]:
+            with self.assertRaises(ValidationError):
+                sync.decode_token(token(state))
+        client = APIClient()
+        client.force_authenticate(self.member)
+        response = client.get('/sync/', {'since': token({'cursors': {'posts': 5}, 'tombstone': 0, 'issued': None})})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tombstones_only_reach_members(self):
+        start_member = sync.changes(self.member, '')['next']
+        start_outsider = sync.changes(self.outsider, '')['next']
+        post_id = self.post.id
+        self.post.delete()
+        self.assertIn({'model': 'posts', 'id': post_id}, sync.changes(self.member, start_member)['deleted'])
+        self.assertEqual(sync.changes(self.outsider, start_outsider)['deleted'], [])
+
+    def test_new_member_gets_resync(self):
+        start = sync.changes(self.outsider, '')['next']
+        Participation.objects.create(user=self.outsider, journey=self.journey, is_approved=True)
+        self.assertEqual(sync.changes(self.outsider, start)['resync'], [self.journey.id])
+        posts = sync.changes(self.outsider, '', self.journey.id)['changes']['posts']
+        self.assertEqual([p['id'] for p in posts], [self.post.id])
+
+    def test_removed_member_gets_journey_tombstone(self):
+        start = sync.changes(self.member, '')['next']
+        participation = Participation.objects.get(user=self.member)
+        participation.is_approved = False
+        participation.save()
+        self.assertIn({'model': 'journeys', 'id': self.journey.id}, sync.changes(self.member, start)['deleted'])
+
+    def test_batched_delete_writes_tombstones_once(self):
+        Post.objects.create(user=self.owner, journey=self.journey, content='y')
+        with CaptureQueriesContext(connection) as queries, sync.batched():
+            Post.objects.filter(journey=self.journey).delete()
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "journeys_tombstone"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Tombstone.objects.filter(model='posts', journey_id=self.journey.id).count(), 2)
+
+    def test_untracked_models_fast_delete(self):  # receiver không sender làm mọi model mất fast delete
+        self.assertTrue(Collector('default').can_fast_delete(IdempotencyKey.objects.all()))
+        self.assertTrue(Collector('default').can_fast_delete(Tombstone.objects.all()))
+
+
+class ConditionalGetTests(TestCase):  # user-043
+    def setUp(self):
+        self.owner = make_user('owner', last_name='Chủ')
+        self.client = APIClient()
+        self.journey = make_journey(self.owner)
+        self.post = Post.objects.create(user=self.owner, journey=self.journey, content='x')
+        self.commenter = make_user('commenter', last_name='An')
+        Comment.objects.create(user=self.commenter, post=self.post, content='hay')
+
+    def get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_unchanged_page_is_304(self):
+        url = f'/post/{self.post.id}/comments/'
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+    def test_nested_user_change_invalidates(self):
+        url = f'/post/{self.post.id}/comments/'
+        etag = self.get(url)['ETag']
+        self.commenter.last_name = 'Bình'
+        self.commenter.save()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_rows_outside_page_do_not_invalidate(self):
+        for i in range(10):
+            make_journey(self.owner, name_journey=f'mới {i}')  # hành trình đầu tiên bị đẩy sang trang 2
+        etag = self.get('/journey/')['ETag']
+        self.journey.name_journey = 'Đổi tên'
+        self.journey.save()
+        self.assertEqual(self.get('/journey/', etag).status_code, 304)
+        self.assertEqual(self.get('/journey/?page=2', etag).status_code, 200)
+
+
+@override_settings(JOURNEY_THROTTLES={'like': [('user', 'sliding', '2/min')]})
+class MutationThrottleTests(TestCase):  # user-045
+    def setUp(self):
+        throttling._backend = None
+        self.user = make_user('liker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.journeys = [make_journey(make_user(f'owner{i}')) for i in range(3)]
+
+    def test_batch_operations_share_action_limits(self):
+        operations = [{'key': f'k{j.id}', 'op': 'like_journey', 'args': {'journey': j.id}} for j in self.journeys]
+        results = self.client.post('/mutations/', {'operations': operations}, format='json').data['results']
+        self.assertEqual([r['status'] for r in results], ['ok', 'ok', 'error'])
+        self.assertEqual(results[2]['status_code'], 429)
+        self.assertEqual(LikeJourney.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.client.post(f'/journey/{self.journeys[2].id}/like/').status_code, 429)
+
+
+class SlidingWindowTests(TestCase):  # user-038
+    def test_concurrent_requests_cannot_overshoot(self):
+        backend = throttling.MemoryBackend()
+        barrier = threading.Barrier(8)
+        reads = backend.get
+
+        def slow_get(key):  # mọi luồng đọc xong rồi mới ghi: kiểu get-get-incr sẽ cho lọt cả 8
+            value = reads(key)
+            try:
+                barrier.wait(timeout=0.2)
+            except threading.BrokenBarrierError:
+                pass
+            return value
+        backend.get = slow_get
+        allowed = []
+        workers = [threading.Thread(target=lambda: allowed.append(
+            throttling.sliding_window(backend, 'k', 3, 60, 1000.0)[0])) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(allowed.count(True), 3)
+
+    def test_rejected_requests_are_not_counted(self):
+        backend = throttling.MemoryBackend()
+        for _ in range(5):
+            throttling.sliding_window(backend, 'k', 2, 60, 1000.0)
+        self.assertEqual(backend.get('k:16'), 2)
+
+
+class CachedAuthenticationTests(TestCase):  # user-030
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('traveler', first_name='An')
+        application = Application.objects.create(user=self.user, client_type='confidential',
+                                                 authorization_grant_type='password')
+        AccessToken.objects.create(user=self.user, token='secret', application=application,
+                                   expires=now() + timedelta(hours=1), scope='read write')
+        self.auth = CachedOAuth2Authentication()
+        self.request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer secret')
+
+    def authenticate(self):
+        return self.auth.authenticate(self.request)[0]
+
+    def test_each_request_gets_a_fresh_user(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            first = self.authenticate()
+        first.first_name = 'Đã sửa trong view'
+        second = self.authenticate()
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, 'An')
+
+    def test_user_change_evicts_through_shared_cache(self):
+        self.authenticate()
+        User.objects.filter(pk=self.user.pk).update(first_name='Bình')
+        authentication.evict_users([self.user.pk])  # process khác gọi, chỉ qua cache dùng chung
+        self.assertEqual(self.authenticate().first_name, 'Bình')
+
+
+class NotificationPollTests(TestCase):  # user-031
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        application = Application.objects.create(user=self.user, client_type='confidential',
+                                                 authorization_grant_type='password')
+        AccessToken.objects.create(user=self.user, token='poll', application=application,
+                                   expires=now() + timedelta(hours=1), scope='read write')
+        Notification.objects.bulk_create([Notification(user=self.user, message=f'#{i}') for i in range(60)])
+
+    def poll(self, since):
+        return self.client.get('/async/notifications/', {'since': since}, HTTP_AUTHORIZATION='Bearer poll').json()
+
+    def test_since_pages_forward_without_gaps(self):
+        first = self.poll(0)
+        self.assertTrue(first['has_more'])
+        second = self.poll(first['results'][-1]['id'])
+        self.assertFalse(second['has_more'])
+        ids = [n['id'] for n in first['results'] + second['results']]
+        self.assertEqual(ids, sorted(Notification.objects.values_list('id', flat=True)))
+
+
+class RecommendationTests(TestCase):  # user-032
+    def random_matrices(self, users=30, journeys=80, seed=7):
+        rng = np.random.default_rng(seed)
+        interactions = sparse.random(users, journeys, density=0.08, random_state=seed, format='csr')
+        interactions.data[:] = 1.0
+        follows = sparse.random(users, users, density=0.1, random_state=seed + 1, format='csr')
+        follows.data[:] = 1.0
+        user_coords = np.column_stack([rng.uniform(10, 21, users), rng.uniform(103, 109, users)])
+        user_coords[::5] = np.nan
+        journey_coords = np.column_stack([rng.uniform(10, 21, journeys), rng.uniform(103, 109, journeys)])
+        journey_coords[::7] = np.nan
+        return recommendations.Matrices(list(range(users)), list(range(1000, 1000 + journeys)), interactions,
+                                        follows, rng.random(journeys) > 0.2, rng.integers(-1, users, journeys),
+                                        user_coords, journey_coords)
+
+    def dense_reference(self, m, rows, similarity, top_n):  # cách chấm cũ: ma trận dày batch x journeys
+        rows = np.asarray(rows)
+        scores = np.asarray((m.interactions[rows] @ similarity).todense())
+        counts = np.asarray(m.follows[rows].sum(axis=1)).ravel()
+        counts[counts == 0] = 1.0
+        scores += recommendations.SOCIAL_WEIGHT * np.asarray((m.follows[rows] @ m.interactions).todense()) / \
+            counts[:, None]
+        distance = haversine(m.user_coords[rows, 0][:, None], m.user_coords[rows, 1][:, None],
+                             m.journey_coords[:, 0][None, :], m.journey_coords[:, 1][None, :])
+        scores += recommendations.PROXIMITY_WEIGHT * np.nan_to_num(np.exp(-distance /
+                                                                          recommendations.PROXIMITY_SCALE_KM))
+        scores[:, ~m.active] = -np.inf
+        scores[m.interactions[rows].nonzero()] = -np.inf
+        scores[m.creators[None, :] == rows[:, None]] = -np.inf
+        return [[(m.journey_ids[c], row[c]) for c in np.argsort(-row)[:top_n] if row[c] > 0] for row in scores]
+
+    def test_sparse_scores_match_dense_top_n(self):
+        m = self.random_matrices()
+        similarity = recommendations.item_similarity(m.interactions)
+        rows = list(range(len(m.user_ids)))
+        results = recommendations.score_users(m, rows, similarity, 5, recommendations.Nearby(m, m.active))
+        ranked = lambda recs: sorted((-round(score, 9), jid) for jid, score in recs)  # điểm bằng nhau: xếp theo id
+        self.assertEqual([ranked(recs) for recs in results],
+                         [ranked(recs) for recs in self.dense_reference(m, rows, similarity, 5)])
+
+    def test_incremental_build_scores_new_journeys_for_unchanged_users(self):
+        owner, quiet = make_user('owner'), make_user('quiet')
+        old = make_journey(owner, name_journey='cũ')
+        Post.objects.create(user=owner, journey=old, content='x', latitude=16.0, longitude=108.0)
+        Post.objects.create(user=quiet, journey=make_journey(quiet), content='x', latitude=16.0, longitude=108.0)
+        recommendations.build_recommendations()
+        since = recommendations.last_build_time()
+        self.assertIsNotNone(since)
+        new = make_journey(owner, name_journey='mới')
+        Post.objects.create(user=owner, journey=new, content='y', latitude=16.1, longitude=108.1)
+        self.assertNotIn(quiet.id, recommendations.users_to_refresh(since))
+        recommendations.build_recommendations(recommendations.users_to_refresh(since),
+                                              new_journey_ids=recommendations.new_journeys(since))
+        self.assertIn(new.id, set(Recommendation.objects.filter(user=quiet).values_list('journey_id', flat=True)))
+        self.assertGreater(recommendations.last_build_time(), since)
+
+
+class CommentPathTests(TestCase):  # user-050
+    def setUp(self):
+        owner = make_user('owner')
+        self.post = Post.objects.create(user=owner, journey=make_journey(owner), content='x')
+        self.user = owner
+
+    def comment(self, parent=None):
+        return Comment.objects.create(user=self.user, post=self.post, content='c', parent_comment=parent)
+
+    def test_subtree_uses_case_insensitive_prefix(self):  # MySQL: LIKE thay vì LIKE BINARY -> dùng được index
+        root = self.comment()
+        self.comment(self.comment(root))
+        queryset = threads.subtree(root)
+        self.assertIn('LIKE', str(queryset.query))
+        self.assertEqual(queryset.count(), 3)
+        self.assertEqual(str(queryset.query), str(Comment.objects.filter(path__istartswith=root.path)
+                                                   .order_by('path').query))
+
+    def test_moving_a_comment_rewrites_descendant_paths(self):
+        first, second = self.comment(), self.comment()
+        child = self.comment(first)
+        grandchild = self.comment(child)
+        child.parent_comment = second
+        child.save()
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.path, second.path + '%010d/%010d/' % (child.id, grandchild.id))
+        self.assertEqual(threads.descendant_count(first), 0)
+        self.assertEqual(threads.descendant_count(second), 2)
+
+    def test_cannot_move_into_own_subtree(self):
+        root = self.comment()
+        child = self.comment(root)
+        root.parent_comment = child
+        with self.assertRaises(ModelValidationError):
+            root.save()
+
+    def test_fill_paths_respects_max_length(self):
+        parent = None
+        for _ in range(23):  # 23 cấp * 11 = 253 ký tự, cấp tiếp theo không còn chỗ
+            parent = self.comment(parent)
+        deep = Comment(id=parent.id + 1, user=self.user, post=self.post, content='c', parent_comment_id=parent.id)
+        threads.fill_paths(Comment, [deep])
+        self.assertLessEqual(len(deep.path), 255)
+        self.assertEqual(deep.path, parent.path[:-11] + '%010d/' % deep.id)
+        self.assertEqual(deep.parent_comment_id, parent.parent_comment_id)
+
+
+class CommentThreadTests(TestCase):  # user-049
+    def setUp(self):
+        self.user = make_user('owner')
+        self.journey = make_journey(self.user)
+        self.post = Post.objects.create(user=self.user, journey=self.journey, content='x')
+        self.root = Comment.objects.create(user=self.user, post=self.post, content='gốc')
+        Comment.objects.bulk_create([Comment(user=self.user, post=self.post, content=f'#{i}', parent_comment=self.root)
+                                     for i in range(25)])
+
+    def test_inline_replies_without_window_functions(self):  # MySQL < 8: mỗi bình luận cha 1 query
+        comments = Comment.objects.filter(post=self.post)
+        with_window = threads.attach_replies([self.root], comments, self.user)[0].first_replies
+        with mock.patch.object(type(connection.features), 'supports_over_clause', False):
+            fallback = threads.attach_replies([Comment.objects.get(pk=self.root.pk)], comments,
+                                              self.user)[0].first_replies
+        self.assertEqual([c.id for c in fallback], [c.id for c in with_window])
+        self.assertEqual(len(fallback), threads.inline_count())
+
+    def test_archived_replies_are_paginated(self):
+        archive.archive_journey(self.journey)
+        url = f'/post/{self.post.id}/comments/{self.root.id}/replies/'
+        first = self.client.get(url).json()
+        self.assertEqual(len(first['results']), 20)
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+
+
+class IdempotencyTests(TestCase):  # user-046
+    def setUp(self):
+        self.user = make_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, key):
+        return self.client.post('/journey/', {'name_journey': 'Huế', 'start_location': 'A', 'end_location': 'B'},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_saved_response(self):
+        first = self.create('k1')
+        second = self.create('k1')
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Journey.objects.count(), 1)
+
+    def test_abandoned_key_can_be_taken_over_after_lease(self):  # process chết sau reserve, không chạy finish
+        idempotency.reserve(self.user, [('k2', 'x')])
+        self.assertEqual(self.create('k2').status_code, 409)
+        later = now() + timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS + 1)
+        with mock.patch('journeys.idempotency.now', return_value=later):
+            self.assertEqual(self.create('k2').status_code, 201)
+        self.assertEqual(self.create('k2')['Idempotent-Replayed'], 'true')
+
+    def test_view_error_releases_key(self):
+        with mock.patch('journeys.views.JourneyViewSet.perform_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create('k3')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class ProfilingTests(TestCase):  # user-039
+    def setUp(self):
+        self.staff = make_user('staff', is_staff=True)
+        make_journey(self.staff)
+
+    def test_profile_header_times_serializer_fields(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.get('/journey/', HTTP_X_PROFILE_SERIALIZERS='1')
+        fields = {row['field'] for row in json.loads(response['X-Serializer-Profile'])['fields']}
+        self.assertIn('JourneyDetailSerializers.name_journey', fields)
+        self.assertNotIn('X-Serializer-Profile', client.get('/journey/'))
+
+    def test_capture_runs_as_the_staff_user(self):  # request bên trong phải được DRF xác thực bằng user hiện tại
+        self.client.force_login(self.staff)
+        response = self.client.get('/admin/profile/', {'path': '/user/current_user/'})
+        self.assertContains(response, '/user/current_user/ -> 200')
+
+
+class ArchivedJourneyTests(TestCase):  # user-036
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.journey = make_journey(self.owner, active=False)
+        archive.archive_journey(self.journey)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_update_loads_archive_with_journey(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(f'/journey/{self.journey.id}/', {'name_journey': 'Huế'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes_count'], 0)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "journeys_journeyarchive"' in q['sql']])
+
+
+class NotificationCompactTests(TestCase):  # user-037
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.journeys = [make_journey(self.owner), make_journey(self.owner)]
+
+    def notify(self, journey, actor, verb=notifications.LIKE_JOURNEY):
+        return Notification.objects.create(user=self.owner, journey=journey, actor=actor, verb=verb,
+                                           message=f"{actor.last_name} {notifications.MESSAGES[verb]}")
+
+    def test_compact_merges_every_batch(self):
+        for i in range(3):
+            actor = make_user(f'fan{i}', last_name=f'Fan{i}')
+            for journey in self.journeys:
+                self.notify(journey, actor)
+        self.assertEqual(notifications.compact(batch_size=1), 4)
+        self.assertEqual(sorted(Notification.objects.values_list('count', flat=True)), [3, 3])
+
+    def test_returning_actor_counts_as_event_not_person(self):
+        fans = [make_user(f'fan{i}', last_name=f'Fan{i}') for i in range(2)]
+        journey = self.journeys[0]
+        for actor in fans:
+            self.notify(journey, actor, notifications.COMMENT_JOURNEY)
+        notifications.compact()
+        self.notify(journey, fans[0], notifications.COMMENT_JOURNEY)
+        notifications.compact()
+        merged = Notification.objects.get()
+        self.assertEqual(merged.count, 3)
+        self.assertEqual(merged.message, 'Có 3 bình luận hành trình mới, gần nhất từ Fan0.')
+        self.assertNotIn('người khác', merged.message)
+
+    def test_migration_fills_verb_of_old_rows(self):
+        old = self.notify(self.journeys[0], make_user('fan', last_name='Fan'), notifications.COMMENT_JOURNEY)
+        other = Notification.objects.create(user=self.owner, message='Bạn có 2 lượt thích hành trình mới.')
+        Notification.objects.update(verb='')
+        importlib.import_module('journeys.migrations.0035_notification_verb_backfill').fill_verbs(apps, None)
+        old.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((old.verb, other.verb), (notifications.COMMENT_JOURNEY, ''))
+
+
+class RouteTests(TestCase):  # user-033
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.journey = make_journey(self.owner, start_latitude=10.0, start_longitude=106.0, end_latitude=11.0,
+                                    end_longitude=106.0)
+        routes.update_journey_route(self.journey)
+
+    def move_end(self, **extra):
+        response = self.client.patch(f'/journey/{self.journey.id}/', {'end_latitude': 12.0, **extra}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.journey.refresh_from_db()
+
+    def test_auto_estimated_time_follows_coordinates(self):
+        self.move_end()
+        self.assertAlmostEqual(self.journey.distance_km, float(haversine(10.0, 106.0, 12.0, 106.0)), places=1)
+        self.assertEqual(self.journey.estimated_time, routes.auto_estimated_time(self.journey.distance_km))
+
+    def test_entered_estimated_time_is_kept(self):
+        Journey.objects.filter(pk=self.journey.pk).update(estimated_time=timedelta(hours=5))
+        self.move_end()
+        self.assertEqual(self.journey.estimated_time, timedelta(hours=5))
+
+    def test_distance_follows_owner_check_ins(self):
+        straight = self.journey.distance_km
+        Post.objects.create(user=self.owner, journey=self.journey, content='x', latitude=10.5, longitude=106.5)
+        routes.update_owner_trail(self.journey.id, self.owner.id)
+        self.journey.refresh_from_db()
+        self.assertGreater(self.journey.distance_km, straight + 10)
+
+    def test_members_show_latest_post_of_this_journey(self):
+        Post.objects.create(user=self.owner, journey=self.journey, content='x', visit_point='Bảo Lộc')
+        Post.objects.create(user=self.owner, journey=make_journey(self.owner), content='y', visit_point='Huế')
+        members = self.client.get(f'/journey/{self.journey.id}/members/').json()
+        self.assertEqual(members[0]['post']['visit_point'], 'Bảo Lộc')
+        self.assertEqual(self.client.get(f'/async/journey/{self.journey.id}/members/').json(), members)
+
+
+class TrajectoryTests(TestCase):  # user-034
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.first, self.second = make_journey(self.owner), make_journey(self.owner)
+
+    def test_moving_a_post_rebuilds_both_trajectories(self):
+        for lat in (10.0, 10.1):
+            trajectories.append_point(Post.objects.create(user=self.owner, journey=self.first, content='x',
+                                                          latitude=lat, longitude=106.0))
+        post = Post.objects.filter(journey=self.first).latest('id')
+        response = self.client.patch(f'/post/{post.id}/', {'journey': self.second.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        counts = dict(Trajectory.objects.values_list('journey_id', 'point_count'))
+        self.assertEqual(counts, {self.first.id: 1, self.second.id: 1})
+
+
+class ImportTests(TestCase):  # user-035
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.journey = make_journey(self.owner)
+        post = Post.objects.create(user=self.owner, journey=self.journey, content='x')
+        Comment.objects.create(user=self.owner, post=post, content='c')
+        old = now() - timedelta(days=30)
+        Journey.objects.filter(pk=self.journey.pk).update(created_date=old, updated_date=old)
+        self.lines = list(exports.iter_ndjson(Journey.objects.all()))
+
+    def test_import_keeps_dates_without_second_write(self):
+        Journey.objects.all().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(exports.import_records(self.lines), 1)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        journey = Journey.objects.get()
+        self.assertLess(journey.updated_date, now() - timedelta(days=29))
+        self.assertEqual(Comment.objects.get().path, '%010d/' % Comment.objects.get().id)
+        self.assertTrue(Journey._meta.get_field('updated_date').auto_now)
+
+    def test_existing_ids_fail_unless_skipped_or_updated(self):
+        with self.assertRaises(IntegrityError):
+            exports.import_records(self.lines)
+        Journey.objects.filter(pk=self.journey.pk).update(name_journey='Huế')
+        exports.import_records(self.lines, conflicts=exports.SKIP)
+        self.assertEqual(Journey.objects.get().name_journey, 'Huế')
+        exports.import_records(self.lines, conflicts=exports.UPDATE)
+        self.assertEqual(Journey.objects.get().name_journey, 'Đà Lạt')
+        self.assertEqual(Post.objects.count(), 1)
+
+
+class ActiveManagerTests(TestCase):  # user-048
+    def test_sync_only_covers_approved_memberships(self):
+        owner, member, pending = make_user('owner'), make_user('member'), make_user('pending')
+        journey = make_journey(owner)
+        Participation.objects.create(user=member, journey=journey, is_approved=True)
+        Participation.objects.create(user=pending, journey=journey, is_approved=False)
+        self.assertEqual(list(sync._journey_ids(member)), [{'id': journey.id}])
+        self.assertEqual(list(sync._journey_ids(pending)), [])
+
+    def test_export_active_only(self):
+        owner = make_user('owner')
+        make_journey(owner, active=True)
+        make_journey(owner, name_journey='Huế', active=False)
+        out = StringIO()
+        call_command('export_journeys', '--active', stdout=out)
+        self.assertEqual([json.loads(line)['name_journey'] for line in out.getvalue().splitlines()], ['Đà Lạt'])
+
+
+class MigrationTestCase(TransactionTestCase):  # chạy migration dữ liệu trên schema cũ rồi trả DB về bản mới nhất
+    databases = {'default', 'replica'}
+    migrate_from = migrate_to = None
+
+    def migrate(self, name):  # -> apps theo state của migration name
+        executor = MigrationExecutor(connection)
+        target = [('journeys', name)] if name else executor.loader.graph.leaf_nodes()
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+
+    def setUp(self):
+        self.apps = self.migrate(self.migrate_from)
+
+    def tearDown(self):
+        self.migrate(None)
+
+
+class ReportTests(TestCase):  # user-026
+    def setUp(self):
+        self.target = make_user('target')
+        self.reporters = [make_user('a'), make_user('b')]
+        self.client = APIClient()
+
+    def report(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(f'/user/{self.target.id}/report_user/', {'reason': 'spam'})
+
+    def test_each_reporter_counts_once(self):
+        self.assertEqual(self.report(self.reporters[0]).status_code, 201)
+        self.assertEqual(self.report(self.reporters[0]).status_code, 200)
+        self.assertEqual(self.report(self.reporters[1]).status_code, 201)
+        self.assertEqual(ReportedUser.objects.get(user=self.target).report_count, 2)
+
+
+class ReportDedupeMigrationTests(MigrationTestCase):  # user-026, 0020_report_unique_reporteduser_queue_idx
+    migrate_from = '0019_alter_post_latitude_alter_post_longitude'
+    migrate_to = '0020_report_unique_reporteduser_queue_idx'
+
+    def test_duplicates_are_removed_and_counts_recomputed(self):
+        User, Report = self.apps.get_model('journeys', 'User'), self.apps.get_model('journeys', 'Report')
+        ReportedUser = self.apps.get_model('journeys', 'ReportedUser')
+        target, a, b = [User.objects.create(username=name, email=f'{name}@test.vn', password='x')
+                        for name in ('target', 'a', 'b')]
+        profile = ReportedUser.objects.create(user=target, report_count=5)
+        for reporter in (a, a, a, b):
+            Report.objects.create(reported_user=target, reported_by=reporter, reason='spam',
+                                  reported_user_profile=profile)
+        apps_after = self.migrate(self.migrate_to)
+        self.assertEqual(apps_after.get_model('journeys', 'Report').objects.count(), 2)
+        self.assertEqual(apps_after.get_model('journeys', 'ReportedUser').objects.get().report_count, 2)
+
+
+class AdminChangelistTests(TestCase):  # user-027
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.vn', password='x')
+        self.client.force_login(self.admin)
+        self.journey = make_journey(self.admin)
+
+    def changelist_queries(self, posts):
+        for i in range(posts):
+            Post.objects.create(user=make_user(f'u{Post.objects.count()}'), journey=self.journey, content='x')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/admin/journeys/post/').status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.assertEqual(self.changelist_queries(2), self.changelist_queries(10))
+
+    def test_unfiltered_count_uses_table_estimate(self):
+        for i in range(3):
+            make_journey(self.admin)
+        with mock.patch('journeys.paginators.estimate_row_count', return_value=50000):
+            self.assertEqual(EstimatedCountPaginator(Journey.objects.order_by('id'), 50).count, 50000)
+            self.assertEqual(EstimatedCountPaginator(Journey.objects.active().order_by('id'), 50).count, 4)
+        self.assertEqual(EstimatedCountPaginator(Journey.objects.order_by('id'), 50).count, 4)  # SQLite: COUNT(*)
+
+
+class ConnectionReuseTests(TestCase):  # user-029
+    def test_open_connection_is_counted_as_reused(self):
+        db_pool.install()
+        connection.ensure_connection()
+        before = db_pool.pool_stats()['default']['reused']
+        request_started.send(sender=self.__class__)
+        self.assertEqual(db_pool.pool_stats()['default']['reused'], before + 1)
+
+    def test_asgi_defaults_to_closing_connections_but_keeps_operator_value(self):
+        for value, expected in ((None, '0'), ('120', '120')):
+            env = {} if value is None else {'DB_CONN_MAX_AGE': value}
+            with mock.patch.dict(os.environ, env), mock.patch('journeys.db_pool.install') as install:
+                if value is None:
+                    os.environ.pop('DB_CONN_MAX_AGE', None)
+                importlib.reload(importlib.import_module('shareJourney.asgi'))
+                self.assertEqual(os.environ['DB_CONN_MAX_AGE'], expected)
+                install.assert_called()  # số liệu /admin/db_pool/ vẫn có dưới ASGI
+
+
+class BatchRetrieveTests(TestCase):  # user-040
+    def setUp(self):
+        self.user = make_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.journeys = [make_journey(self.user, name_journey=f'J{i}') for i in range(6)]
+        for journey in self.journeys:
+            LikeJourney.objects.create(user=self.user, journey=journey)
+
+    def batch(self, ids):
+        return self.client.get('/journey/batch/', {'ids': ','.join(map(str, ids))})
+
+    def test_results_follow_request_order_and_match_retrieve(self):
+        ids = [self.journeys[2].id, 999, self.journeys[0].id]
+        data = self.batch(ids).json()
+        self.assertEqual([j['id'] for j in data['results']], [ids[0], ids[2]])
+        self.assertEqual(data['missing'], [999])
+        self.assertEqual(data['results'][0], self.client.get(f'/journey/{ids[0]}/').json())
+
+    def test_query_count_does_not_grow_with_ids(self):
+        with CaptureQueriesContext(connection) as few:
+            self.batch([j.id for j in self.journeys[:2]])
+        with CaptureQueriesContext(connection) as many:
+            self.batch([j.id for j in self.journeys])
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_bad_ids_are_400(self):
+        for value in ('', 'a,b', ','.join(str(i) for i in range(1, 102))):
+            self.assertEqual(self.client.get('/journey/batch/', {'ids': value}).status_code, 400)
+
+
+class SparseFieldsTests(TestCase):  # user-041
+    def setUp(self):
+        self.user = make_user('owner')
+        self.journey = make_journey(self.user)
+        self.client = APIClient()
+
+    def get(self, **params):
+        return self.client.get(f'/journey/{self.journey.id}/', params).json()
+
+    def test_only_requested_fields(self):
+        self.assertEqual(self.get(fields='id,name_journey'), {'id': self.journey.id, 'name_journey': 'Đà Lạt'})
+
+    def test_nested_object_collapses_to_id_unless_expanded(self):
+        self.assertEqual(self.get(fields='user_create')['user_create'], self.user.id)
+        self.assertEqual(self.get(fields='user_create', expand='user_create')['user_create']['username'], 'owner')
+        self.assertEqual(self.get(fields='user_create.username')['user_create'], {'username': 'owner'})
+
+    def test_unrequested_counts_are_not_annotated(self):  # ETag vẫn đếm like riêng (conditional), không tính ở đây
+        with CaptureQueriesContext(connection) as ctx:
+            self.get(fields='id,name_journey')
+        self.assertFalse([q for q in ctx.captured_queries if 'likes_total' in q['sql']])
+        with CaptureQueriesContext(connection) as ctx:
+            self.get(fields='id,likes_count')
+        self.assertTrue([q for q in ctx.captured_queries if 'likes_total' in q['sql']])
+
+
+class ResponseFormatTests(TestCase):  # user-042
+    def setUp(self):
+        self.user = make_user('owner')
+        for i in range(3):
+            make_journey(self.user, name_journey=f'J{i}')
+        self.client = APIClient()
+
+    def test_msgpack_and_cbor_match_json(self):
+        data = self.client.get('/journey/').json()
+        packed = self.client.get('/journey/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content), data)
+        encoded = self.client.get('/journey/', HTTP_ACCEPT='application/cbor')
+        self.assertEqual(cbor2.loads(encoded.content), data)
+
+    def test_dedupe_users_moves_repeated_users_to_a_table(self):
+        data = self.client.get('/journey/', {'dedupe': 'users'}).json()
+        self.assertEqual({j['user_create'] for j in data['results']}, {self.user.id})
+        self.assertEqual([u['username'] for u in data['users']], ['owner'])
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_gzip_response_and_weak_etag(self):
+        plain = self.client.get('/journey/')
+        response = self.client.get('/journey/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+
+
+class MediaUrlTests(TestCase):  # user-047
+    AVATAR = 'image/upload/v1712345678/avatars/abc.jpg'
+
+    def test_urls_are_versioned_and_built_once(self):
+        media._build.cache_clear()
+        first = media.url(self.AVATAR)
+        self.assertIn('/v1712345678/avatars/abc.jpg', first)
+        self.assertEqual(media.url(self.AVATAR), first)
+        self.assertEqual(media._build.cache_info().hits, 1)
+
+    def test_chained_transformation_is_cached(self):
+        chain = [{'width': 100, 'crop': 'fill'}, {'effect': 'grayscale'}]
+        first = media.url(self.AVATAR, transformation=chain)
+        self.assertIn('c_fill,w_100/e_grayscale', first)
+        with self.settings(CLOUDINARY_URL_OPTIONS={'transformation': chain}):
+            self.assertEqual(media.url(self.AVATAR), first)
+        self.assertNotEqual(media.url(self.AVATAR, transformation=chain[:1]), first)
+
+    def test_url_is_stored_on_save_and_preferred(self):
+        user = make_user('owner', avatar=self.AVATAR)
+        user.refresh_from_db()
+        self.assertEqual(user.avatar_url, media.url(self.AVATAR))
+        User.objects.filter(pk=user.pk).update(avatar_url='https://cdn.test/a.jpg')
+        user.refresh_from_db()
+        self.assertEqual(media.field_url(user, 'avatar'), 'https://cdn.test/a.jpg')
+        with self.settings(CLOUDINARY_STORED_URLS=False):
+            self.assertEqual(media.field_url(user, 'avatar'), media.url(self.AVATAR))
+
+
+class CommentPathMigrationTests(MigrationTestCase):  # user-050, 0031_comment_paths
+    migrate_from = '0030_comment_thread_indexes'
+    migrate_to = '0031_comment_paths'
+
+    def test_paths_are_filled_and_deep_replies_reattached(self):
+        User, Journey = self.apps.get_model('journeys', 'User'), self.apps.get_model('journeys', 'Journey')
+        Post, Comment = self.apps.get_model('journeys', 'Post'), self.apps.get_model('journeys', 'Comment')
+        user = User.objects.create(username='owner', email='owner@test.vn', password='x')
+        post = Post.objects.create(user=user, journey=Journey.objects.create(user_create=user, name_journey='Huế'),
+                                   content='x')
+        chain = [None]
+        for _ in range(25):  # 25 cấp * 11 ký tự > 255 -> các cấp sâu gắn vào tổ tiên còn chỗ
+            chain.append(Comment.objects.create(user=user, post=post, content='c', parent_comment=chain[-1]))
+        apps_after = self.migrate(self.migrate_to)
+        comments = {c.id: c for c in apps_after.get_model('journeys', 'Comment').objects.all()}
+        self.assertEqual(comments[chain[1].id].path, '%010d/' % chain[1].id)
+        self.assertEqual(comments[chain[2].id].path, '%010d/%010d/' % (chain[1].id, chain[2].id))
+        for comment in comments.values():
+            self.assertLessEqual(len(comment.path), 255)
+            self.assertTrue(comment.path.endswith('%010d/' % comment.id))
+            parent = comments.get(comment.parent_comment_id)
+            self.assertEqual(comment.path, (parent.path if parent else '') + '%010d/' % comment.id)
+
+
+class LastPageTests(TestCase):  # user-043
+    def setUp(self):
+        self.user = make_user('owner')
+        self.journeys = [make_journey(self.user, name_journey=f'J{i}') for i in range(12)]
+        self.client = APIClient()
+
+    def test_page_last_is_served_and_tagged(self):
+        response = self.client.get('/journey/', {'page': 'last'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        again = self.client.get('/journey/', {'page': 'last'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_comment_page_last(self):
+        CommentJourney.objects.create(user=self.user, journey=self.journeys[0], content='c')
+        response = self.client.get(f'/journey/{self.journeys[0].id}/comments/', {'page': 'last'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+
+
+class MutationKeyTests(TestCase):  # user-045
+    def setUp(self):
+        self.user = make_user('liker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.journey = make_journey(make_user('owner'))
+
+    def test_key_in_progress_is_a_conflict_not_a_duplicate(self):
+        operation = {'key': 'k1', 'op': 'like_journey', 'args': {'journey': self.journey.id}}
+        idempotency.reserve(self.user, [('k1', idempotency.digest([operation['op'], operation['args']]))])
+        response = self.client.post('/mutations/', {'operations': [operation]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        IdempotencyKey.objects.all().delete()  # request kia bỏ key -> gửi lại được chạy thật
+        response = self.client.post('/mutations/', {'operations': [operation]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'ok')
+        self.assertTrue(LikeJourney.objects.filter(user=self.user, journey=self.journey).exists())
+
+
+@override_settings(COMMENT_INLINE_REPLIES=2)
+class AsyncCommentTests(TestCase):  # user-049
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.journey = make_journey(self.owner)
+        self.post = Post.objects.create(user=self.owner, journey=self.journey, content='x')
+        Participation.objects.create(user=self.owner, journey=self.journey, is_approved=True)
+        for i in range(22):
+            parent = Comment.objects.create(user=self.owner, post=self.post, content=f'c{i}')
+            journey_parent = CommentJourney.objects.create(user=self.owner, journey=self.journey, content=f'c{i}')
+        for i in range(4):
+            Comment.objects.create(user=self.owner, post=self.post, content=f'r{i}', parent_comment=parent)
+            CommentJourney.objects.create(user=self.owner, journey=self.journey, content=f'r{i}',
+                                          parent_comment=journey_parent)
+        self.client = APIClient()
+
+    def test_async_pages_match_drf(self):
+        for path in (f'post/{self.post.id}/comments/', f'journey/{self.journey.id}/comments/'):
+            for page in ('1', '2', 'last'):
+                drf = self.client.get(f'/{path}', {'page': page}).json()
+                self.assertEqual(self.client.get(f'/async/{path}', {'page': page}).json(),
+                                 json.loads(json.dumps(drf).replace('/' + path, '/async/' + path)))
+            last = drf['results'][-1]
+            self.assertEqual((last['reply_count'], len(last['replies'])), (4, 2))
+            self.assertEqual(self.client.get(f'/async/{path}', {'page': 3}).status_code, 404)
+
+    def test_archived_journey_comments_are_paginated(self):
+        Journey.objects.filter(pk=self.journey.pk).update(active=False)
+        archive.archive_journey(self.journey)
+        path = f'journey/{self.journey.id}/comments/'
+        data = self.client.get(f'/async/{path}').json()
+        self.assertEqual((data['count'], len(data['results'])), (22, 20))
+        self.assertEqual(data, json.loads(json.dumps(self.client.get(f'/{path}').json())
+                                          .replace('/' + path, '/async/' + path)))
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db import transaction, connections
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from journeys import batch
+from journeys.fieldsets import wants, nested
+
+# Danh sách bình luận theo trang: mỗi bình luận cấp cha kèm reply_count và COMMENT_INLINE_REPLIES trả lời đầu tiên,
+# phần còn lại client tải thêm qua .../comments/<id>/replies/?cursor=... Các query đều chạy trên index
+# (post/journey, parent_comment, created_date). Trả lời đầu của cả trang lấy bằng 1 query ROW_NUMBER() OVER (...),
+# cần MySQL >= 8.0.2 (hoặc MariaDB >= 10.2); server cũ hơn thì mỗi bình luận cấp cha 1 query LIMIT K.
+# Cây con của 1 bình luận lấy bằng 1 range query trên path (CommentPath): path LIKE '<path của nó>%'.
+# Dùng istartswith: startswith trên MySQL thành LIKE BINARY, không dùng được index của cột collation thường
+# (path chỉ gồm chữ số và '/', không phân biệt hoa thường cũng như nhau).
+
+
+def inline_count():
+    return getattr(settings, 'COMMENT_INLINE_REPLIES', 3)
+
+
+def top_level(queryset):
+    return queryset.filter(parent_comment__isnull=True).order_by('created_date', 'id')
+
+
+def attach_replies(parents, queryset, user, spec=None):  # gắn K trả lời đầu của mỗi bình luận vào .first_replies
+    k = inline_count()
+    by_id = {}
+    for parent in parents:
+        parent.first_replies = []
+        by_id[parent.id] = parent
+    if not by_id or k <= 0 or not wants(spec, 'replies'):
+        return parents
+    replies = batch.comments(queryset.filter(parent_comment__in=list(by_id)), user, nested(spec, 'replies'))
+    if not connections[replies.db].features.supports_over_clause:
+        for parent in parents:
+            parent.first_replies = list(replies.filter(parent_comment=parent).order_by('created_date', 'id')[:k])
+        return parents
+    rank = Window(RowNumber(), partition_by=[F('parent_comment_id')], order_by=[F('created_date').asc(), F('id').asc()])
+    for reply in replies.annotate(rank=rank).filter(rank__lte=k).order_by('created_date', 'id'):  # 1 query cho cả trang
+        by_id[reply.parent_comment_id].first_replies.append(reply)
+    return parents
+
+
+def _collapse(node, depth):  # node của cây lưu trữ -> cùng định dạng với bản trực tiếp
+    replies = node.pop('replies')
+    node['reply_count'] = len(replies)
+    if depth == 0:
+        node['replies'] = [_collapse(r, 1) for r in replies[:inline_count()]]
+    return node
+
+
+def archived_threads(tree):  # bình luận cấp cha của hành trình đã lưu trữ
+    return [_collapse(node, 0) for node in tree]
+
+
+def archived_replies(tree, comment_id):  # trả lời của 1 bình luận trong cây lưu trữ, None nếu không có
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        if node['id'] == comment_id:
+            return [_collapse(r, 1) for r in node['replies']]
+        stack.extend(node['replies'])
+    return None
+
+
+def subtree(comment):  # bình luận và mọi trả lời các cấp, theo thứ tự duyệt cây
+    return type(comment).objects.filter(path__istartswith=comment.path).order_by('path')
+
+
+def descendant_count(comment):
+    return subtree(comment).count() - 1
+
+
+@transaction.atomic
+def delete_subtrees(queryset):  # xóa bình luận kèm toàn bộ trả lời, trả về số bình luận đã xóa
+    model = queryset.model
+    paths = [p for p in queryset.values_list('path', flat=True) if p]
+    condition = Q(pk__in=list(queryset.filter(path='').values_list('pk', flat=True)))  # dòng chưa có path
+    for path in paths:
+        condition |= Q(path__istartswith=path)
+    # lấy id ra trước: MySQL không cho DELETE ... WHERE id IN (SELECT trên cùng bảng)
+    ids = list(model.objects.filter(condition).values_list('id', flat=True))
+    # bỏ liên kết cha-con trước: Collector không phải tìm trả lời từng cấp một, xóa 1 lượt theo id
+    model.objects.filter(id__in=ids).update(parent_comment=None)
+    from journeys import sync  # import trong hàm: sync -> exports -> threads
+    with sync.batched():  # tombstone của cả cây ghi 1 lượt
+        return model.objects.filter(id__in=ids).delete()[0]
+
+
+def fill_paths(model, comments):  # tính path cho bình luận tạo bằng bulk_create (id có sẵn, cha có id nhỏ hơn)
+    paths = dict(model.objects.filter(id__in={c.parent_comment_id for c in comments if c.parent_comment_id})
+                 .values_list('id', 'path'))
+    limit = (model._meta.get_field('path').max_length // model.STEP - 1) * model.STEP  # path dài nhất của cha
+    for comment in sorted(comments, key=lambda c: c.id):
+        parent_path = paths.get(comment.parent_comment_id, '')
+        if len(parent_path) > limit:  # quá sâu -> gắn vào tổ tiên gần nhất còn chỗ, giống CommentPath.save
+            parent_path = parent_path[:limit]
+            comment.parent_comment_id = int(parent_path[-model.STEP:-1])
+        comment.path = paths[comment.id] = parent_path + '%010d/' % comment.id
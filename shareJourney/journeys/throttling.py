@@ -0,0 +1,148 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from journeys.caches import TTLCache
+
+# Giới hạn tần suất cho các API ghi (like, comment, follow, report...), cấu hình theo action trong settings:
+# JOURNEY_THROTTLES = {'like': [('user', 'sliding', '30/min'), ('ip', 'bucket', '60/min')], ...}
+# Bộ đếm tách riêng theo viewset (like hành trình và like bài viết không dùng chung).
+# scope 'user' đếm theo user đăng nhập, 'ip' theo địa chỉ IP; 'sliding' = sliding-window counter,
+# 'bucket' = token bucket.
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+_rejections = {}  # (basename, action, scope) -> số request bị từ chối
+_rejections_lock = threading.Lock()
+
+
+def parse_rate(rate):  # '30/min' -> (30, 60)
+    num, period = rate.split('/')
+    return int(num), PERIODS[period]
+
+
+class MemoryBackend:  # lưu trong process, dùng khi chạy 1 process hoặc để test
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = TTLCache(maxsize=100000, ttl=86400 * 2)  # key -> count / (tokens, updated_at)
+
+    def incr(self, key, ttl):
+        with self._lock:
+            count = self._data.get(key, 0) + 1
+            self._data.set(key, count, ttl)
+            return count
+
+    def decr(self, key, ttl):
+        with self._lock:
+            count = self._data.get(key, 0)
+            if count > 0:
+                self._data.set(key, count - 1, ttl)
+
+    def get(self, key):
+        return self._data.get(key, 0)
+
+    def take_token(self, key, capacity, refill_per_sec, now):
+        with self._lock:
+            tokens, updated_at = self._data.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_sec)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._data.set(key, (tokens, now), capacity / refill_per_sec + 1)
+            return allowed, 0 if allowed else (1 - tokens) / refill_per_sec
+
+
+class CacheBackend:  # dùng Django cache (Redis/Memcached) để chia sẻ giữa các process
+    def incr(self, key, ttl):
+        if cache.add(key, 1, ttl):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:  # key vừa hết hạn
+            cache.set(key, 1, ttl)
+            return 1
+
+    def decr(self, key, ttl):
+        try:
+            cache.decr(key)
+        except ValueError:  # key đã hết hạn
+            pass
+
+    def get(self, key):
+        return cache.get(key, 0)
+
+    def take_token(self, key, capacity, refill_per_sec, now):  # không atomic, chấp nhận sai lệch nhỏ khi tranh chấp
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_sec)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), int(capacity / refill_per_sec) + 1)
+        return allowed, 0 if allowed else (1 - tokens) / refill_per_sec
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(settings, 'THROTTLE_BACKEND', 'journeys.throttling.MemoryBackend'))()
+    return _backend
+
+
+def sliding_window(backend, key, limit, period, now):
+    # sliding-window counter: số request cửa sổ hiện tại + cửa sổ trước nhân tỉ lệ phần còn chồng lên
+    # tăng trước bằng 1 lệnh atomic rồi mới kiểm tra: các request đồng thời không cùng đọc được số cũ rồi lọt qua
+    window = int(now // period)
+    elapsed = (now % period) / period
+    current = backend.incr(f'{key}:{window}', period * 2)
+    previous = backend.get(f'{key}:{window - 1}')
+    if current + previous * (1 - elapsed) > limit:
+        backend.decr(f'{key}:{window}', period * 2)  # request bị từ chối không tính vào cửa sổ
+        return False, period * (1 - elapsed)
+    return True, 0
+
+
+class ActionThrottle(BaseThrottle):
+    def __init__(self):
+        self.wait_time = None
+
+    def allow_request(self, request, view):
+        allowed, self.wait_time = self.charge(request, getattr(view, 'basename', None), getattr(view, 'action', None))
+        return allowed
+
+    def charge(self, request, basename, action):  # tính 1 lượt cho action, trả về (được phép, số giây phải chờ)
+        rules = getattr(settings, 'JOURNEY_THROTTLES', {}).get(action)
+        if not rules:
+            return True, None
+        backend = get_backend()
+        now = time.time()
+        for scope, algorithm, rate in rules:
+            ident = self.get_ident(request) if scope == 'ip' else request.user.pk
+            if ident is None:
+                continue
+            limit, period = parse_rate(rate)
+            key = f'throttle:{basename}:{action}:{scope}:{ident}'
+            if algorithm == 'bucket':
+                allowed, wait = backend.take_token(key, limit, limit / period, now)
+            else:
+                allowed, wait = sliding_window(backend, key, limit, period, now)
+            if not allowed:
+                metric = (basename, action, scope)
+                with _rejections_lock:
+                    _rejections[metric] = _rejections.get(metric, 0) + 1
+                return False, wait
+        return True, None
+
+    def wait(self):
+        return self.wait_time
+
+
+def rejection_stats():
+    with _rejections_lock:
+        return {':'.join(metric): count for metric, count in _rejections.items()}
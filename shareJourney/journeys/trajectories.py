@@ -0,0 +1,132 @@
+import numpy as np
+from django.db import transaction
+
+from journeys.caches import TTLCache
+from journeys.models import Trajectory, Post
+
+PRECISION = 1e5  # encoded polyline chuẩn của Google (5 chữ số thập phân)
+ZOOM_TOLERANCES = {  # sai số Douglas-Peucker (độ) cho từng mức zoom bản đồ
+    'low': 5e-3,
+    'medium': 5e-4,
+    'high': 5e-5,
+}
+
+simplified_cache = TTLCache(maxsize=2048, ttl=300)  # (trajectory id, updated_date, zoom) -> polyline rút gọn
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode(points, previous=(0, 0)):  # points: [(lat, lng)], previous: điểm trước đó (đã nhân PRECISION)
+    result = []
+    prev_lat, prev_lng = previous
+    for lat, lng in points:
+        lat, lng = int(round(lat * PRECISION)), int(round(lng * PRECISION))
+        result.append(_encode_value(lat - prev_lat) + _encode_value(lng - prev_lng))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(result)
+
+
+def decode(polyline):
+    points = []
+    index = lat = lng = 0
+    while index < len(polyline):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(polyline[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / PRECISION, lng / PRECISION))
+    return points
+
+
+def douglas_peucker(points, tolerance):  # trả về mảng bool: điểm nào được giữ lại
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n < 3:
+        keep[:] = True
+        return keep
+    # chiếu kinh độ theo cos(vĩ độ) để khoảng cách xấp xỉ đúng tỉ lệ
+    xy = np.column_stack([points[:, 1] * np.cos(np.radians(points[:, 0].mean())), points[:, 0]])
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        inner = xy[start + 1:end] - xy[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            index = start + 1 + i
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def append_point(post):  # gọi mỗi khi thành viên check-in (post có tọa độ)
+    if post.latitude is None or post.longitude is None:
+        return
+    with transaction.atomic():
+        trajectory, _ = Trajectory.objects.select_for_update().get_or_create(journey_id=post.journey_id,
+                                                                             user_id=post.user_id)
+        previous = (0, 0)
+        if trajectory.point_count:
+            previous = (int(round(trajectory.last_latitude * PRECISION)),
+                        int(round(trajectory.last_longitude * PRECISION)))
+        trajectory.polyline += encode([(post.latitude, post.longitude)], previous)
+        trajectory.point_count += 1
+        trajectory.last_latitude = round(post.latitude * PRECISION) / PRECISION
+        trajectory.last_longitude = round(post.longitude * PRECISION) / PRECISION
+        trajectory.save()
+
+
+def rebuild(journey_id, user_id):  # dựng lại từ các post (dùng cho dữ liệu cũ)
+    points = list(Post.objects.filter(journey_id=journey_id, user_id=user_id, latitude__isnull=False,
+                                      longitude__isnull=False).order_by('created_date', 'id')
+                  .values_list('latitude', 'longitude'))
+    if not points:
+        Trajectory.objects.filter(journey_id=journey_id, user_id=user_id).delete()
+        return None
+    trajectory, _ = Trajectory.objects.update_or_create(journey_id=journey_id, user_id=user_id, defaults={
+        'polyline': encode(points),
+        'point_count': len(points),
+        'last_latitude': round(points[-1][0] * PRECISION) / PRECISION,
+        'last_longitude': round(points[-1][1] * PRECISION) / PRECISION,
+    })
+    return trajectory
+
+
+def simplified(trajectory, zoom):  # zoom: 'low' | 'medium' | 'high' | 'full'
+    if zoom not in ZOOM_TOLERANCES:
+        return trajectory.polyline, trajectory.point_count
+    key = (trajectory.id, trajectory.updated_date, zoom)
+    cached = simplified_cache.get(key)
+    if cached is None:
+        points = decode(trajectory.polyline)
+        keep = douglas_peucker(points, ZOOM_TOLERANCES[zoom])
+        cached = (encode([p for p, k in zip(points, keep) if k]), int(keep.sum()))
+        simplified_cache.set(key, cached)
+    return cached
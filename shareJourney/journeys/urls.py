@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 from .views import CommentListAPIView, CommentJourneyListAPIView, UserJourneysListView
 
 router = DefaultRouter()
@@ -16,8 +16,25 @@ urlpatterns = [
          name='delete_comment'),
     path('post/<int:post_id>/comments/', CommentListAPIView.as_view(), name='post-comment-list'),
     path('journey/<int:journey_id>/comments/', CommentJourneyListAPIView.as_view(), name='journey-comment-list'),
+    path('post/<int:post_id>/comments/<int:comment_id>/replies/', views.CommentReplyListAPIView.as_view(),
+         name='post-comment-replies'),
+    path('journey/<int:journey_id>/comments/<int:comment_id>/replies/', views.CommentJourneyReplyListAPIView.as_view(),
+         name='journey-comment-replies'),
     path('user_journeys/', UserJourneysListView.as_view(), name='user_journeys_list'),
+    path('sync/', views.SyncAPIView.as_view(), name='sync'),
+    path('mutations/', views.MutationBatchAPIView.as_view(), name='mutations'),
     path('admin/statistics/', views.journey_statistics, name='journey_statistics'),
     path('admin/statistics/data/', views.journey_statistics_data, name='journey_statistics_data'),
+    path('admin/db_pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('admin/auth_cache/', views.auth_cache_stats, name='auth_cache_stats'),
+    path('admin/throttle/', views.throttle_stats, name='throttle_stats'),
+    path('admin/profile/', views.profile_request, name='profile_request'),
     path('vnpay/', include('vnpay.api_urls')),
+    # bản async của các API đọc (chạy dưới ASGI)
+    path('async/journey/', async_views.journey_list, name='async_journey_list'),
+    path('async/journey/<int:pk>/', async_views.journey_detail, name='async_journey_detail'),
+    path('async/journey/<int:pk>/members/', async_views.journey_members, name='async_journey_members'),
+    path('async/journey/<int:journey_id>/comments/', async_views.journey_comments, name='async_journey_comments'),
+    path('async/post/<int:post_id>/comments/', async_views.post_comments, name='async_post_comments'),
+    path('async/notifications/', async_views.notifications, name='async_notifications'),
 ]
@@ -1,23 +1,29 @@
 from datetime import datetime, timedelta
+from functools import partial
 
-from django.db.models import Avg
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
+from django.db.models import Avg, F
+from django.http import Http404
 from django.shortcuts import render
 from django.utils.timezone import now, make_aware
+from django.urls import Resolver404
 from oauth2_provider.contrib.rest_framework import permissions
 from rest_framework import viewsets, generics, parsers, status, permissions
 from django.http import HttpResponse, JsonResponse
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from journeys import serializers, perms, paginators
+from journeys import serializers, perms, paginators, db_pool, recommendations, routes, trajectories, archive, \
+    notifications, throttling, profiling, batch, fieldsets, conditional, sync, \
+    mutations, idempotency, media, threads, authentication
 from journeys.models import User, Journey, Post, Comment, LikePost, LikeJourney, Notification, Participation, \
     CommentJourney, Report, ReportedUser, Follow
-from journeys.serializers import PostDetailSerializer, \
-    CommentJourneyDetailSerializers
+from journeys.serializers import PostDetailSerializer
 
 
 class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPIView):
-    queryset = User.objects.filter(is_active=True).all()
+    queryset = User.objects.active().all()
     serializer_class = serializers.UserDetailSerializer
     parser_classes = [parsers.MultiPartParser]
 
@@ -26,6 +32,12 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPI
             return [permissions.IsAuthenticated()]
         return [permissions.AllowAny()]
 
+    def get_queryset(self):
+        queries = self.queryset.all()
+        if self.action in ['retrieve', 'batch']:  # đếm follower/following/journey bằng annotate
+            queries = batch.users(queries, self.request.user, fieldsets.parse(self.request))
+        return queries
+
     # lấy thông tin người đang đăng nhập để hiển thị profile
     @action(methods=['get', 'patch', 'delete'], url_name='current_user', detail=False)
     def current_user(self, request):
@@ -44,6 +56,7 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPI
         return Response(serializers.UserDetailSerializer(request.user).data)
 
     @action(detail=True, methods=['post'])
+    @idempotency.idempotent
     def report_user(self, request, pk=None):
         reason = request.data.get('reason')
 
@@ -51,28 +64,30 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPI
             return Response({'error': 'Dữ liệu sai'}, status=status.HTTP_400_BAD_REQUEST)
 
         reported_user = self.get_object()
-        reported_user_profile, _ = ReportedUser.objects.get_or_create(user=reported_user)
-        reported_user_profile.report_count += 1
-        reported_user_profile.save()
-
-        report = Report.objects.create(
-            reported_user=reported_user,
-            reported_by=request.user,
-            reason=reason,
-            reported_user_profile=reported_user_profile
-        )
+        with transaction.atomic():
+            reported_user_profile, _ = ReportedUser.objects.get_or_create(user=reported_user)
+            report, created = Report.objects.get_or_create(
+                reported_user=reported_user,
+                reported_by=request.user,
+                defaults={'reason': reason, 'reported_user_profile': reported_user_profile}
+            )
+            if not created:  # mỗi người chỉ được tính 1 lần report
+                return Response({'message': 'Bạn đã báo cáo người dùng này', 'report_id': report.id},
+                                status=status.HTTP_200_OK)
+            # tăng report_count ngay trong DB để các report đồng thời không ghi đè lẫn nhau
+            ReportedUser.objects.filter(pk=reported_user_profile.pk).update(report_count=F('report_count') + 1)
 
         return Response({'message': 'Báo cáo thành công', 'report_id': report.id}, status=status.HTTP_201_CREATED)
 
     @action(methods=['get'], url_path='followers', detail=True)
     def get_followers(self, request, pk):
-        followers = Follow.objects.filter(following=self.get_object(), is_active=True).all()
+        followers = Follow.objects.active().filter(following=self.get_object()).all()
         serializer = serializers.UserSerializer([follow.follower for follow in followers], many=True)
         return Response(serializer.data, status.HTTP_200_OK)
 
     @action(methods=['get'], url_path='following', detail=True)
     def get_following(self, request, pk):
-        following = Follow.objects.filter(follower=self.get_object(), is_active=True).all()
+        following = Follow.objects.active().filter(follower=self.get_object()).all()
         serializer = serializers.UserSerializer([follow.following for follow in following], many=True)
         return Response(serializer.data, status.HTTP_200_OK)
 
@@ -87,23 +102,58 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPI
 
         return Response(status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'])
+    def batch(self, request):  # /user/batch/?ids=1,2,3
+        ids = batch.parse_ids(request.query_params.get('ids'))
+        users, missing = batch.in_order(self.get_queryset().filter(id__in=ids), ids)
+        serializer = serializers.UserDetailSerializer(users, many=True, context={'request': request})
+        return Response({'results': serializer.data, 'missing': missing})
+
     @action(detail=True, methods=['get'])
     def journeys(self, request, pk):
         user = self.get_object()
-        owned_journeys = Journey.objects.filter(user_create=user)
+        owned_journeys = batch.journeys(Journey.objects.filter(user_create=user), request.user,
+                                        fieldsets.parse(request))
         serializer = serializers.JourneyDetailSerializers(owned_journeys, many=True, context={'request': request})
         return Response(serializer.data)
 
 
+class SyncAPIView(generics.GenericAPIView):  # /sync/?since=<token>[&journey=<id>]: các thay đổi kể từ lần trước
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        journey_id = request.query_params.get('journey')
+        if journey_id is not None and not journey_id.isdigit():
+            return Response({'error': 'journey không hợp lệ'}, status=status.HTTP_400_BAD_REQUEST)
+        data = sync.changes(request.user, request.query_params.get('since', ''),
+                            int(journey_id) if journey_id is not None else None)
+        if data is None:
+            return Response({'error': 'Token đồng bộ đã hết hạn, hãy đồng bộ lại từ đầu'}, status=status.HTTP_410_GONE)
+        return Response(data)
+
+
+class MutationBatchAPIView(generics.GenericAPIView):  # áp dụng các thao tác client ghi lại khi offline
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        operations = mutations.parse(request.data)
+        try:
+            results = mutations.apply(request, operations)
+        except mutations.KeyConflict:
+            return Response({'error': 'Có request khác đang xử lý cùng key, hãy thử lại sau'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
 class UserJourneysListView(generics.ListAPIView):  # danh sách hành trình mà user tham gia
     serializer_class = serializers.JourneyDetailSerializers
 
     def get_queryset(self):
         user = self.request.user
         # owned_journeys = Journey.objects.filter(user_create=user)
-        participated_journeys = Participation.objects.filter(user=user, is_approved=True).values_list('journey',
-                                                                                                      flat=True)
-        return Journey.objects.filter(id__in=participated_journeys)
+        participated_journeys = Participation.objects.active().filter(user=user).values_list('journey', flat=True)
+        return batch.journeys(Journey.objects.filter(id__in=participated_journeys), user,
+                              fieldsets.parse(self.request))
 
 
 class JourneyViewSet(viewsets.ModelViewSet):
@@ -112,11 +162,24 @@ class JourneyViewSet(viewsets.ModelViewSet):
     pagination_class = paginators.JourneyPaginator
     permission_classes = [permissions.AllowAny()]
 
+    @idempotency.idempotent
+    def create(self, request, *args, **kwargs):  # client gửi lại cùng Idempotency-Key -> không tạo trùng
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):  # khi gọi api create sẽ lấy user đang đăng nhập gán vào
-        serializer.save(user_create=self.request.user, active=True)
+        journey = serializer.save(user_create=self.request.user, active=True)
+        routes.update_journey_route(journey)
+
+    def perform_update(self, serializer):
+        journey = serializer.save()
+        routes.update_journey_route(journey)
+
+    def perform_destroy(self, instance):
+        with sync.batched():  # xóa kèm thành viên, post, comment -> tombstone ghi 1 lượt
+            instance.delete()
 
     def get_permissions(self):
-        if self.action in ['create', 'add_comment']:
+        if self.action in ['create', 'add_comment', 'recommended']:
             return [permissions.IsAuthenticated()]
         elif self.action in ['update', 'partial_update', 'destroy', 'lock_comment', 'delete_participant',
                              'complete_journey']:
@@ -125,27 +188,68 @@ class JourneyViewSet(viewsets.ModelViewSet):
             return [permissions.AllowAny()]
 
     def get_queryset(self):
+        queries = self.base_queryset().select_related('archive')  # serializer đọc journey.archive khi đã lưu trữ
+        if self.action in ['list', 'retrieve', 'batch']:  # chỉ annotate những field client yêu cầu (?fields=)
+            queries = batch.journeys(queries, self.request.user, fieldsets.parse(self.request))
+        return queries
+
+    def base_queryset(self):
         queries = self.queryset
 
         q = self.request.query_params.get("q")  # khi search /?q=... thì lấy giá trị q về
         if q:
             queries = queries.filter(name_journey__icontains=q)
         if self.action == 'list':
-            queries = queries.filter(active=True).order_by('-created_date')
+            queries = queries.active().order_by('-created_date')
         else:
             queries = queries.order_by('-created_date')
         return queries
 
+    def list(self, request, *args, **kwargs):  # trả 304 nếu danh sách không đổi (If-None-Match)
+        def versions():  # chỉ các hành trình trên trang đang phục vụ
+            queryset = self.base_queryset()
+            return conditional.journeys(queryset, request.user,
+                                        conditional.page_ids(queryset, request, self.paginator))
+        return conditional.respond(request, versions, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        journeys = lambda: conditional.journeys(self.base_queryset().filter(pk=kwargs['pk']), request.user,
+                                                [int(kwargs['pk'])])
+        return conditional.respond(request, journeys,
+                                   partial(super().retrieve, request, *args, **kwargs))
+
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):  # gợi ý đã tính sẵn bằng lệnh build_recommendations
+        journeys = recommendations.recommended_journeys(request.user)
+        if not journeys.exists():  # chưa có gợi ý -> trả về hành trình mới nhất
+            journeys = Journey.objects.active().exclude(user_create=request.user).order_by('-created_date')
+        journeys = batch.journeys(journeys, request.user, fieldsets.parse(request))
+        page = self.paginate_queryset(journeys)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):  # /journey/batch/?ids=1,2,3 -> giống retrieve cho từng id, 1 query
+        ids = batch.parse_ids(request.query_params.get('ids'))
+        journeys, missing = batch.in_order(self.get_queryset().filter(id__in=ids), ids)
+        serializer = self.get_serializer(journeys, many=True)
+        return Response({'results': serializer.data, 'missing': missing})
+
     @action(detail=True, methods=['get'])
     def posts(self, request, pk=None):
         journey = self.get_object()
-        posts = Post.objects.filter(journey=journey).order_by('-created_date')
+        if journey.archived:
+            return Response(archive.archived_posts(journey, request))
+        posts = batch.posts(Post.objects.filter(journey=journey).order_by('-created_date'), request.user,
+                            fieldsets.parse(request))
         serializer = PostDetailSerializer(posts, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(methods=['post'], url_name='like', detail=True)
     def like(self, request, pk):
         journey = self.get_object()
+        if journey.archived:
+            return self.archived_response()
         actor = request.user
         like, created = LikeJourney.objects.get_or_create(user=request.user, journey=self.get_object())
         if not created:
@@ -156,44 +260,44 @@ class JourneyViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_200_OK)
 
     def create_notification(self, journey, actor):
-        Notification.objects.create(
-            user=journey.user_create,
-            journey=journey,
-            message=f"{actor.last_name} đã thích hành trình của bạn.",
-            actor=actor
-        )
+        notifications.notify(journey.user_create, notifications.LIKE_JOURNEY, actor, journey=journey)
 
     @action(methods=['post'], url_name='add_comment', detail=True)
+    @idempotency.idempotent
     def add_comment(self, request, pk):
         actor = request.user
+        journey = self.get_object()
+        if journey.archived:
+            return self.archived_response()
         c = CommentJourney.objects.create(user=actor,
-                                          journey=self.get_object(),
+                                          journey=journey,
                                           content=request.data.get('content'))
         self.create_notificationCmt(c, actor)
         return Response(serializers.CommentJourneyDetailSerializers(c).data, status=status.HTTP_201_CREATED)
 
+    def archived_response(self):
+        return Response({'message': 'Hành trình đã được lưu trữ, chỉ có thể xem.'}, status=status.HTTP_400_BAD_REQUEST)
+
     def create_notificationCmt(self, commentJourney, actor):
         journey = commentJourney.journey
-        Notification.objects.create(
-            user=journey.user_create,
-            journey=journey,
-            message=f"{actor.last_name} đã bình luận trên hành trình của bạn.",
-            actor=actor
-        )
+        notifications.notify(journey.user_create, notifications.COMMENT_JOURNEY, actor, journey=journey)
 
     @action(methods=['delete'], url_path=r'delete_comment/(?P<comment_pk>\d+)', url_name='delete_comment', detail=True)
     def delete_comment(self, request, pk, comment_pk):
         journey = self.get_object()
         comment = CommentJourney.objects.get(pk=comment_pk, journey=journey)
         if comment.user == request.user:
-            comment.delete()
+            threads.delete_subtrees(CommentJourney.objects.filter(pk=comment.pk))  # xóa kèm các trả lời
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({'error': 'Bạn không có quyền xóa comment này.'}, status=status.HTTP_403_FORBIDDEN)
 
     @action(methods=['post'], detail=True, url_path='comment_reply')
+    @idempotency.idempotent
     def reply_to_comment(self, request, pk=None):
         journey = self.get_object()
+        if journey.archived:
+            return self.archived_response()
         comment_id = request.data.get('comment_id')
         content = request.data.get('content')
 
@@ -244,13 +348,14 @@ class JourneyViewSet(viewsets.ModelViewSet):
         except CommentJourney.DoesNotExist:
             return Response({"message": "Bình luận không tồn tại hoặc không thuộc hành trình này."},
                             status=status.HTTP_400_BAD_REQUEST)
-        if Participation.objects.filter(user=comment.user, journey=journey, is_approved=True).exists():
+        if Participation.objects.active().filter(user=comment.user, journey=journey).exists():
             return Response({"message": f"{comment.user.last_name} đã là thành viên của hành trình."},
                             status=status.HTTP_200_OK)
         Participation.objects.create(user=comment.user, journey=journey, is_approved=True)
         Notification.objects.create(
             user=comment.user,
-            message=f"Bạn đã được {user.last_name} duyệt vào hành trình của họ."
+            message=f"Bạn đã được {user.last_name} duyệt vào hành trình của họ.",
+            verb=notifications.APPROVE
         )
         return Response({"message": f"Bạn đã duyệt {comment.user.last_name} vào hành trình."},
                         status=status.HTTP_200_OK)
@@ -261,7 +366,7 @@ class JourneyViewSet(viewsets.ModelViewSet):
         user_id = request.data.get('user_id')
         try:
             user = User.objects.get(id=user_id)
-            participant = Participation.objects.get(journey=journey, user_id=user_id, is_approved=True)
+            participant = Participation.objects.active().get(journey=journey, user_id=user_id)
         except Participation.DoesNotExist:
             return Response({"message": "Người dùng không tồn tại trong danh sách tham gia hoặc chưa được duyệt."},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -273,8 +378,12 @@ class JourneyViewSet(viewsets.ModelViewSet):
 
     @action(methods=['get'], detail=True, url_path='members')
     def get_members(self, request, pk=None):
+        return conditional.respond(request, partial(conditional.members, pk),
+                                   partial(self.members_response, request))
+
+    def members_response(self, request):
         journey = self.get_object()
-        participations = journey.participation_set.filter(is_approved=True).select_related('user')
+        participations = journey.participation_set.active().select_related('user')
 
         members = []
         member_data = {  # lấy ra người tạo hành trình
@@ -282,10 +391,10 @@ class JourneyViewSet(viewsets.ModelViewSet):
             'ownerJourney': True,
             'full_name': journey.user_create.get_full_name(),
             'username': journey.user_create.username,
-            'avatar': journey.user_create.avatar.url if journey.user_create.avatar else None,
-            'post': journey.user_create.post_set.all().order_by('-created_date').values('visit_point', 'latitude',
-                                                                                        'longitude').first(),
-            # lấy bài đăng mới nhất
+            'avatar': media.field_url(journey.user_create, 'avatar'),
+            'post': journey.user_create.post_set.filter(journey=journey).order_by('-created_date').values(
+                'visit_point', 'latitude', 'longitude', 'estimated_time_of_arrival').first(),
+            # lấy bài đăng mới nhất trong hành trình này
         }
         members.append(member_data)
         for participation in participations:
@@ -294,13 +403,29 @@ class JourneyViewSet(viewsets.ModelViewSet):
                 'id': user.id,
                 'full_name': user.get_full_name(),
                 'username': user.username,
-                'avatar': user.avatar.url if user.avatar else None,
-                'post': user.post_set.all().order_by('-created_date').values('visit_point', 'latitude',
-                                                                             'longitude').first(),
+                'avatar': media.field_url(user, 'avatar'),
+                'post': user.post_set.filter(journey=journey).order_by('-created_date')
+                .values('visit_point', 'latitude', 'longitude', 'estimated_time_of_arrival').first(),
             }
             members.append(member_data)  # đưa thành viên vào ds member để trả về
         return Response(members, status=status.HTTP_200_OK)
 
+    @action(methods=['get'], detail=True, url_path='trajectory')
+    def trajectory(self, request, pk=None):  # đường đi đã rút gọn theo zoom (?zoom=low|medium|high|full, ?user_id=)
+        journey = self.get_object()
+        zoom = request.query_params.get('zoom', 'medium')
+        items = journey.trajectories.all()
+        user_id = request.query_params.get('user_id')
+        if user_id:
+            items = items.filter(user_id=user_id)
+
+        data = []
+        for t in items:
+            polyline, count = trajectories.simplified(t, zoom)
+            data.append({'user_id': t.user_id, 'point_count': t.point_count, 'simplified_count': count,
+                         'polyline': polyline})
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(methods=['patch'], detail=True, url_path='complete_journey')
     def complete_journey(self, request, pk=None):
         journey = self.get_object()
@@ -318,7 +443,7 @@ class JourneyViewSet(viewsets.ModelViewSet):
             return Response({"message": "Vui lòng đánh giá."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            participation = Participation.objects.get(journey=journey, user=user, is_approved=True)
+            participation = Participation.objects.active().get(journey=journey, user=user)
             participation.rating = rating
             participation.save()
 
@@ -343,8 +468,59 @@ class PostViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPI
     serializer_class = serializers.PostSerializer
     permission_classes = [permissions.AllowAny()]
 
+    def get_queryset(self):
+        queries = self.queryset.all()
+        if self.action in ['retrieve', 'batch']:
+            queries = batch.posts(queries, self.request.user, fieldsets.parse(self.request))
+        return queries
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional.respond(request, partial(conditional.post, kwargs['pk'], request.user),
+                                   partial(self.retrieve_or_archived, request, *args, **kwargs))
+
+    def retrieve_or_archived(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:  # post của hành trình đã lưu trữ
+            data = archive.archived_post(kwargs['pk'], request)
+            if data is None:
+                raise
+            return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):  # /post/batch/?ids=1,2,3
+        ids = batch.parse_ids(request.query_params.get('ids'))
+        posts, missing = batch.in_order(self.get_queryset().filter(id__in=ids), ids)
+        data = dict(zip([p.id for p in posts], self.get_serializer(posts, many=True).data))
+        for post_id in missing:  # post của hành trình đã lưu trữ
+            archived = archive.archived_post(post_id, request)
+            if archived is not None:
+                data[post_id] = archived
+        return Response({'results': [data[i] for i in ids if i in data], 'missing': [i for i in ids if i not in data]})
+
+    @idempotency.idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):  # user đăng bài
-        serializer.save(user=self.request.user)
+        post = serializer.save(user=self.request.user)
+        routes.update_post_eta(post)
+        routes.update_owner_trail(post.journey_id, post.user_id)
+        trajectories.append_point(post)
+
+    def perform_update(self, serializer):
+        old_journey_id = serializer.instance.journey_id
+        post = serializer.save()
+        for journey_id in {old_journey_id, post.journey_id}:  # post chuyển sang hành trình khác -> cả 2 đều đổi
+            routes.update_owner_trail(journey_id, post.user_id)
+            trajectories.rebuild(journey_id, post.user_id)  # tọa độ có thể đã đổi
+
+    def perform_destroy(self, instance):
+        journey_id, user_id = instance.journey_id, instance.user_id
+        with sync.batched():  # xóa kèm comment -> tombstone ghi 1 lượt
+            instance.delete()
+        routes.update_owner_trail(journey_id, user_id)
+        trajectories.rebuild(journey_id, user_id)
 
     def get_permissions(self):
         if self.action in ['create', 'add_comment', 'like']:
@@ -355,6 +531,7 @@ class PostViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPI
             return [permissions.AllowAny()]
 
     @action(methods=['post'], url_name='add_comment', detail=True)
+    @idempotency.idempotent
     def add_comment(self, request, pk):
         actor = request.user
         c = Comment.objects.create(user=actor,
@@ -365,19 +542,14 @@ class PostViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPI
 
     def create_notificationCmt(self, comment, actor):
         post = comment.post
-        Notification.objects.create(
-            user=post.user,
-            post=post,
-            message=f"{actor.last_name} đã bình luận trên bài viết của bạn.",
-            actor=actor
-        )
+        notifications.notify(post.user, notifications.COMMENT_POST, actor, post=post)
 
     @action(methods=['delete'], url_path=r'delete_comment/(?P<comment_pk>\d+)', url_name='delete_comment', detail=True)
     def delete_comment(self, request, pk, comment_pk):
         post = self.get_object()
         comment = Comment.objects.get(pk=comment_pk, post=post)
         if comment.user == request.user:
-            comment.delete()
+            threads.delete_subtrees(Comment.objects.filter(pk=comment.pk))
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({'error': 'Bạn không có quyền xóa comment này.'}, status=status.HTTP_403_FORBIDDEN)
@@ -398,6 +570,7 @@ class PostViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPI
                             status=status.HTTP_403_FORBIDDEN)
 
     @action(methods=['post'], detail=True, url_path='comment_reply')
+    @idempotency.idempotent
     def reply_to_comment(self, request, pk=None):
         post = self.get_object()
         comment_id = request.data.get('comment_id')
@@ -431,12 +604,7 @@ class PostViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPI
         return Response(status=status.HTTP_200_OK)
 
     def create_notification(self, post, user):
-        Notification.objects.create(
-            user=post.user,
-            post=post,
-            message=f"{user.last_name} đã thích bài viết của bạn.",
-            actor=user
-        )
+        notifications.notify(post.user, notifications.LIKE_POST, user, post=post)
 
 
 # class NotificationViewSet(viewsets.ViewSet, generics.RetrieveAPIView):
@@ -470,20 +638,106 @@ class PostViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPI
 #         return Response({'message': 'Notification marked as read'}, status=status.HTTP_200_OK)
 
 
-class CommentListAPIView(generics.ListAPIView):  # cmt của POST
-    serializer_class = serializers.CommentDetailSerializers
+class CommentListAPIView(generics.ListAPIView):  # cmt của POST: cmt cấp cha theo trang, kèm vài trả lời đầu tiên
+    serializer_class = serializers.CommentThreadSerializer
+    pagination_class = paginators.CommentPaginator
+
+    def comments(self):
+        return Comment.objects.filter(post_id=self.kwargs['post_id'])
 
     def get_queryset(self):
-        post_id = self.kwargs['post_id']
-        return Comment.objects.filter(post_id=post_id, parent_comment__isnull=True)  # lấy các comment cấp cha
+        return batch.comments(threads.top_level(self.comments()), self.request.user, fieldsets.parse(self.request))
+
+    def paginate_queryset(self, queryset):
+        return threads.attach_replies(super().paginate_queryset(queryset), self.comments(), self.request.user,
+                                      fieldsets.parse(self.request))
+
+    def list(self, request, *args, **kwargs):
+        return conditional.respond(request, partial(conditional.post_comments, self.kwargs['post_id'], request.user,
+                                                    request, self.paginator),
+                                   partial(self.comments_response, request, *args, **kwargs))
+
+    def comments_response(self, request, *args, **kwargs):
+        comments = archive.archived_post_comments(self.kwargs['post_id'])
+        if comments is not None:
+            return self.get_paginated_response(
+                self.paginator.paginate_queryset(threads.archived_threads(comments), request, view=self))
+        return super().list(request, *args, **kwargs)
+
+
+class CommentReplyListAPIView(generics.ListAPIView):  # tải thêm trả lời của 1 cmt của POST (?cursor=)
+    serializer_class = serializers.CommentReplySerializer
+    pagination_class = paginators.ReplyCursorPaginator
+
+    def get_queryset(self):
+        replies = Comment.objects.filter(post_id=self.kwargs['post_id'], parent_comment_id=self.kwargs['comment_id'])
+        return batch.comments(replies, self.request.user, fieldsets.parse(self.request))
+
+    def list(self, request, *args, **kwargs):
+        return conditional.respond(request, partial(conditional.post_replies, self.kwargs['post_id'],
+                                                    self.kwargs['comment_id'], request.user),
+                                   partial(self.replies_response, request, *args, **kwargs))
+
+    def replies_response(self, request, *args, **kwargs):
+        comments = archive.archived_post_comments(self.kwargs['post_id'])
+        if comments is not None:
+            replies = threads.archived_replies(comments, self.kwargs['comment_id'])
+            if replies is None:
+                raise Http404
+            return Response(self.paginator.paginate_list(replies, request))
+        return super().list(request, *args, **kwargs)
 
 
 class CommentJourneyListAPIView(generics.ListAPIView):
-    serializer_class = CommentJourneyDetailSerializers
+    serializer_class = serializers.CommentJourneyThreadSerializer
+    pagination_class = paginators.CommentPaginator
+
+    def comments(self):  # ds comment của 1 hành trình
+        return CommentJourney.objects.filter(journey_id=self.kwargs['journey_id'])
+
+    def get_queryset(self):
+        return batch.comments(threads.top_level(self.comments()), self.request.user, fieldsets.parse(self.request))
+
+    def paginate_queryset(self, queryset):
+        return threads.attach_replies(super().paginate_queryset(queryset), self.comments(), self.request.user,
+                                      fieldsets.parse(self.request))
+
+    def list(self, request, *args, **kwargs):
+        return conditional.respond(request, partial(conditional.journey_comments, self.kwargs['journey_id'],
+                                                    request.user, request, self.paginator),
+                                   partial(self.comments_response, request, *args, **kwargs))
+
+    def comments_response(self, request, *args, **kwargs):
+        journey = Journey.objects.filter(pk=self.kwargs['journey_id'], archived=True).select_related('archive').first()
+        if journey is not None:
+            comments = threads.archived_threads(archive.archived_journey_comments(journey, request))
+            return self.get_paginated_response(self.paginator.paginate_queryset(comments, request, view=self))
+        return super().list(request, *args, **kwargs)
 
-    def get_queryset(self):  # ds comment của 1 hành trình
-        journey_id = self.kwargs['journey_id']
-        return CommentJourney.objects.filter(journey_id=journey_id, parent_comment__isnull=True)
+
+class CommentJourneyReplyListAPIView(generics.ListAPIView):  # tải thêm trả lời của 1 cmt hành trình (?cursor=)
+    serializer_class = serializers.CommentJourneyReplySerializer
+    pagination_class = paginators.ReplyCursorPaginator
+
+    def get_queryset(self):
+        replies = CommentJourney.objects.filter(journey_id=self.kwargs['journey_id'],
+                                                parent_comment_id=self.kwargs['comment_id'])
+        return batch.comments(replies, self.request.user, fieldsets.parse(self.request))
+
+    def list(self, request, *args, **kwargs):
+        return conditional.respond(request, partial(conditional.journey_replies, self.kwargs['journey_id'],
+                                                    self.kwargs['comment_id'], request.user),
+                                   partial(self.replies_response, request, *args, **kwargs))
+
+    def replies_response(self, request, *args, **kwargs):
+        journey = Journey.objects.filter(pk=self.kwargs['journey_id'], archived=True).select_related('archive').first()
+        if journey is not None:
+            replies = threads.archived_replies(archive.archived_journey_comments(journey, request),
+                                               self.kwargs['comment_id'])
+            if replies is None:
+                raise Http404
+            return Response(self.paginator.paginate_list(replies, request))
+        return super().list(request, *args, **kwargs)
 
 
 def index(request):
@@ -492,12 +746,12 @@ def index(request):
 
 def journey_statistics(request):
     total_journeys = Journey.objects.count()
-    total_active_journeys = Journey.objects.filter(active=True).count()
-    total_completed_journeys = Journey.objects.filter(active=False).count()
+    total_active_journeys = Journey.objects.active().count()
+    total_completed_journeys = Journey.objects.inactive().count()
 
     today = now().date()
     start_of_month = today.replace(day=1)
-    journeys_completed_this_month = Journey.objects.filter(active=False, updated_date__gte=start_of_month).count()
+    journeys_completed_this_month = Journey.objects.inactive().filter(updated_date__gte=start_of_month).count()
 
     context = {
         'total_journeys': total_journeys,
@@ -521,10 +775,10 @@ def journey_statistics_data(request):
 
         total_journeys = Journey.objects.filter(created_date__gte=start_of_period,
                                                 created_date__lt=end_of_period).count()
-        total_active_journeys = Journey.objects.filter(created_date__gte=start_of_period,
-                                                       created_date__lt=end_of_period, active=True).count()
-        total_completed_journeys = Journey.objects.filter(updated_date__gte=start_of_period,
-                                                          updated_date__lt=end_of_period, active=False).count()
+        total_active_journeys = Journey.objects.active().filter(created_date__gte=start_of_period,
+                                                                created_date__lt=end_of_period).count()
+        total_completed_journeys = Journey.objects.inactive().filter(updated_date__gte=start_of_period,
+                                                                     updated_date__lt=end_of_period).count()
 
         data = {
             'total_journeys': total_journeys,
@@ -535,3 +789,30 @@ def journey_statistics_data(request):
         return JsonResponse(data)
     except ValueError:
         return JsonResponse({'error': 'Invalid date value'}, status=400)
+
+
+@staff_member_required
+def db_pool_stats(request):
+    return JsonResponse(db_pool.pool_stats())
+
+
+@staff_member_required
+def auth_cache_stats(request):
+    return JsonResponse(authentication.stats())
+
+
+@staff_member_required
+def throttle_stats(request):
+    return JsonResponse(throttling.rejection_stats())
+
+
+@staff_member_required
+def profile_request(request):  # ?path=/journey/?page=2 -> kết quả cProfile của request đó
+    path = request.GET.get('path')
+    if not path:
+        return HttpResponse("Thiếu tham số path", status=400, content_type='text/plain; charset=utf-8')
+    try:
+        status_code, report = profiling.capture(request, path, int(request.GET.get('limit', 50)))
+    except Resolver404:
+        return HttpResponse("Không tìm thấy đường dẫn", status=404, content_type='text/plain; charset=utf-8')
+    return HttpResponse(f"{path} -> {status_code}\n\n{report}", content_type='text/plain; charset=utf-8')
@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shareJourney.settings')
+# view sync chạy trong thread pool của ASGI, mỗi thread giữ kết nối riêng -> kết nối bền dễ chồng chất. Mặc định
+# dưới ASGI đóng kết nối sau mỗi request (dùng pooler phía DB như ProxySQL nếu cần giữ kết nối); đặt DB_CONN_MAX_AGE
+# để giữ kết nối, /admin/db_pool/ cho biết số kết nối được tạo/dùng lại.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+from journeys import db_pool  # noqa: E402
+
+db_pool.install()  # đếm kết nối DB được tạo/dùng lại
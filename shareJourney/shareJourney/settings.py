@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 import cloudinary
 
@@ -47,12 +48,62 @@ INSTALLED_APPS = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
-    )
+        'journeys.authentication.CachedOAuth2Authentication',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'journeys.throttling.ActionThrottle',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (  # client chọn qua Accept: application/msgpack | application/cbor
+        'journeys.renderers.JSONRenderer',
+        'journeys.renderers.MessagePackRenderer',
+        'journeys.renderers.CBORRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
+AUTH_TOKEN_CACHE_TTL = 60  # giây; token đã xác thực lưu trong Django cache (CACHES), dùng chung giữa các process
+
+# Giới hạn tần suất theo action: (scope 'user'|'ip', thuật toán 'sliding'|'bucket', 'số/đơn vị thời gian')
+JOURNEY_THROTTLES = {
+    'like': [('user', 'sliding', '30/min'), ('ip', 'bucket', '120/min')],
+    'add_comment': [('user', 'sliding', '10/min'), ('ip', 'bucket', '60/min')],
+    'reply_to_comment': [('user', 'sliding', '10/min'), ('ip', 'bucket', '60/min')],
+    'follow': [('user', 'sliding', '20/min'), ('ip', 'bucket', '60/min')],
+    'report_user': [('user', 'sliding', '5/hour'), ('ip', 'sliding', '20/hour')],
+}
+# nhiều process/server: dùng 'journeys.throttling.CacheBackend' với CACHES là Redis/Memcached
+THROTTLE_BACKEND = 'journeys.throttling.MemoryBackend'
+
+# tỉ lệ request được đo thời gian từng field serializer và ghi log (0 = tắt, 0.01 = 1%)
+SERIALIZER_PROFILING_SAMPLE_RATE = float(os.environ.get('SERIALIZER_PROFILING_SAMPLE_RATE', 0))
+
+# nén response (brotli nếu đã cài, không thì gzip); bỏ qua response nhỏ hơn ngưỡng (byte)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# /sync/: số dòng tối đa mỗi trang, độ trễ an toàn (giây), số ngày giữ tombstone (token cũ hơn phải đồng bộ lại)
+SYNC_PAGE_SIZE = 500
+SYNC_LAG_SECONDS = 2
+SYNC_TOMBSTONE_DAYS = 30
+
+# /mutations/: số thao tác tối đa mỗi lô; thời gian giữ kết quả theo key idempotency (giờ)
+MUTATION_BATCH_MAX_OPERATIONS = 200
+IDEMPOTENCY_TTL_HOURS = 24
+IDEMPOTENCY_LEASE_SECONDS = 60  # key đang xử lý bị bỏ (process chết) được request gửi lại giành sau chừng này giây
+
+# URL ảnh Cloudinary (journeys.media): số URL giữ trong LRU mỗi process, option build URL (vd. {'secure': True}),
+# dùng URL đã lưu sẵn lúc upload
+CLOUDINARY_URL_CACHE_SIZE = 20000
+CLOUDINARY_URL_OPTIONS = {}
+CLOUDINARY_STORED_URLS = True
+
+# số trả lời trả kèm mỗi bình luận cấp cha trong danh sách bình luận, phần còn lại tải qua .../replies/
+COMMENT_INLINE_REPLIES = 3
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'journeys.middleware.CompressionMiddleware',
+    'journeys.middleware.ReplicaRoutingMiddleware',
+    'journeys.profiling.SerializerProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,10 +148,19 @@ DATABASES = {
         'NAME': 'journeys3db',
         'USER': 'root',
         'PASSWORD': 'Admin@123',
-        'HOST': ''
+        'HOST': '',
+        # env DB_CONN_MAX_AGE; không đặt: WSGI giữ kết nối tối đa 600s, asgi.py mặc định 0 (đóng sau mỗi request)
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,  # kiểm tra kết nối cũ còn sống trước khi dùng lại
     }
 }
 
+# Read replica: thêm alias vào DATABASES và DATABASE_REPLICAS, ví dụ 2 file SQLite trong shareJourney/test_settings.py
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['journeys.routers.ReplicaRouter']
+REPLICA_READ_YOUR_WRITES_SECONDS = 5  # sau khi ghi, client đọc từ primary trong khoảng này
+REPLICA_HEALTH_CHECK_INTERVAL = 30  # giây giữa 2 lần kiểm tra replica
+
 AUTH_USER_MODEL = "journeys.User"
 
 # Password validation
@@ -0,0 +1,11 @@
+# Chạy test local không cần MySQL: python manage.py test journeys --settings=shareJourney.test_settings
+# 2 file SQLite: primary + replica (replica là MIRROR của primary khi chạy test, router vẫn chọn alias như thật).
+from shareJourney.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'primary.sqlite3'},
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3',
+                'TEST': {'MIRROR': 'default'}},
+}
+DATABASE_REPLICAS = ['replica']
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']  # tạo user nhanh hơn
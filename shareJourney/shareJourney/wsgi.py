@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shareJourney.settings')
 
 application = get_wsgi_application()
+
+from journeys import db_pool  # noqa: E402
+
+db_pool.install()  # đếm kết nối DB được tạo/dùng lại